@@ -0,0 +1,146 @@
+# Project imports
+import NanoConfig
+from NanoBlocks._MemoryMappedBlock import MemoryMappedBlock
+from NanoBlocks._CacheableBlock import CacheableBlock
+from NanoBlocks.Index import LIST_LEN_TYPE, ADDRESS_TYPE
+
+# Globals
+COUNT_TYPE = ADDRESS_TYPE
+
+
+class HashDirectoryBlock(MemoryMappedBlock, CacheableBlock):
+    """
+    Class which represents a block of the directory of a hash index in a file.  The directory maps the number of each
+    bucket of the index to the address of the first block of that bucket; as it may outgrow a single block, directory
+    blocks are chained together, beginning with the block at address 0.
+
+    Structure of the block is:
+    NumEntries (8 bytes):   First directory block only; the number of entries in the index.
+    NextBlock (8 bytes):    The address of the next block of the directory, or 0 if this is the last.
+    NumAddresses (2 bytes): An unsigned integer representation of the number of addresses in the block.
+    Addresses (X bytes):    The addresses of the first block of each bucket, in order of bucket number.
+    """
+
+    address = None      # File index which this block begins at
+    numEntries = 0      # The number of entries in the index; only maintained on the first directory block
+    nextBlock = 0       # Address of the directory block holding the addresses of the buckets following ours
+    addresses = None    # List of the addresses of the buckets in this block
+    maxAddresses = None # Maximum number of addresses this block can hold
+
+    # Number of bytes used by the fields of the block other than its addresses
+    headerSize = COUNT_TYPE.size + ADDRESS_TYPE.size + LIST_LEN_TYPE.size
+
+    # MemoryMappedBlock definitions
+    fields = [
+        'numEntries',
+        'nextBlock',
+        'addresses',
+    ]
+    dataTypes = {
+        'numEntries': COUNT_TYPE,
+        'nextBlock': ADDRESS_TYPE,
+        'addresses': ADDRESS_TYPE,
+    }
+    iterableFields = {'addresses'}
+    iterableFieldNumItemsDataType = {
+        'addresses': LIST_LEN_TYPE,
+    }
+    iterableFieldSizes = None # Set in __init__
+
+    def __init__(self, address):
+        self.address = address
+        self.addresses = []
+
+        # MemoryMappedBlock calculations
+        self.blockSize = NanoConfig.index_block_size
+        self.maxAddresses = int((self.blockSize - self.headerSize) / ADDRESS_TYPE.size)
+        self.iterableFieldSizes = {
+            'addresses': self.maxAddresses * ADDRESS_TYPE.size,
+        }
+
+
+    def full(self):
+        return len(self.addresses) >= self.maxAddresses
+
+
+class HashBucketBlock(MemoryMappedBlock, CacheableBlock):
+    """
+    Class which represents a block of a bucket of a hash index in a file.  Every entry whose key hashes to a bucket is
+    held by it, in no particular order; entries which do not fit within the first block of the bucket are held by a
+    chain of overflow blocks following it.
+
+    Structure of the block is:
+    Overflow (8 bytes):     The address of the next block of this bucket, or 0 if this is the last.
+    NumKeys (2 bytes):      An unsigned integer representation of the number of keys in the block
+    NumAddresses (2 bytes): An unsigned integer representation of the number of addresses in the block
+    Keys (X bytes):         The keys of the entries in the block.
+    Addresses (X bytes):    The positions in the database table of the tuples having each key.
+    """
+
+    address = None    # File index which this block begins at
+    overflow = 0      # Address of the next block of this bucket
+    dataType = None   # Type of data which can be looked up by the index
+    keys = None       # List of the keys of the entries in the block
+    addresses = None  # List of the addresses of the entries in the block
+    maxKeys = None    # Maximum number of keys this block can hold
+
+    # Number of bytes used by the fields of the block other than its keys & addresses
+    headerSize = ADDRESS_TYPE.size + (2 * LIST_LEN_TYPE.size)
+
+    # MemoryMappedBlock definitions
+    fields = [
+        'overflow',
+        'keys',
+        'addresses',
+    ]
+    dataTypes = None # Set in __init__
+    iterableFields = {'keys', 'addresses'}
+    iterableFieldNumItemsDataType = {
+        'keys': LIST_LEN_TYPE,
+        'addresses': LIST_LEN_TYPE,
+    }
+    iterableFieldSizes = None # Set in __init__
+
+    def __init__(self, address, dataType):
+        self.address = address
+        self.dataType = dataType
+        self.keys = []
+        self.addresses = []
+
+        # MemoryMappedBlock calculations
+        self.blockSize = NanoConfig.index_block_size
+        self.maxKeys = int((self.blockSize - self.headerSize) / (self.dataType.size + ADDRESS_TYPE.size))
+        self.dataTypes = {
+            'overflow': ADDRESS_TYPE,
+            'keys': dataType,
+            'addresses': ADDRESS_TYPE,
+        }
+        self.iterableFieldSizes = {
+            'keys': self.maxKeys * self.dataType.size,
+            'addresses': self.maxKeys * ADDRESS_TYPE.size,
+        }
+
+
+    def full(self):
+        return len(self.keys) >= self.maxKeys
+
+
+    def add(self, key, address):
+        """
+        Adds a key & address to this Block.
+
+        Inputs: key     - The key which will be used for lookups.
+                address - The address which will be returned upon successful lookup.
+        """
+
+        if self.full():
+            raise BufferError("HashBucketBlock is full")
+
+        self.keys.append(key)
+        self.addresses.append(address)
+
+
+    def lookupAll(self, key):
+        """ Returns the list of addresses associated with the given key in this block, in no particular order. """
+
+        return [address for entryKey, address in zip(self.keys, self.addresses) if entryKey == key]
@@ -17,6 +17,9 @@ ADDRESS_TYPE = NanoTypes.Uint(8)
 class KeyNotFound(Exception):
     pass
 
+class DuplicateKey(Exception):
+    pass
+
 
 class _IndexBlock(MemoryMappedBlock, CacheableBlock):
     """
@@ -25,10 +28,16 @@ class _IndexBlock(MemoryMappedBlock, CacheableBlock):
     Structure of the block is:
     isLeaf (1 byte):        A flag indicating whether the block is a leaf (addresses point to the db table)
                             or an internal node (addresses point to further index blocks).
+    Parent (8 bytes):       The address of this block's parent block.
+    PrevLeaf (8 bytes):     LeafBlocks only; the address of the LeafBlock preceding this one in key order.
+    NextLeaf (8 bytes):     LeafBlocks only; the address of the LeafBlock following this one in key order.
     NumKeys (2 bytes):      An unsigned integer representation of the number of keys in the block
+    NumPositions (2 bytes): InteriorBlocks only; an unsigned integer representation of the number of positions in the
+                            block.
     NumAddresses (2 bytes): An unsigned integer representation of the number of addresses in the block
     Keys (X bytes):         Values which lookup values can be compared to, to determine where a given value
                             would be located in the database table.
+    Positions (X bytes):    InteriorBlocks only; the position in the database table of the first entry of each child.
     Addresses (X bytes):    Addresses which are pointed to by keys.
     """
 
@@ -40,6 +49,9 @@ class _IndexBlock(MemoryMappedBlock, CacheableBlock):
     addresses = None    # List of addresses mapped to by our keys
     maxKeys = None      # Maximum number of keys this block can hold
 
+    # Number of bytes used by the fields of the block other than its keys & addresses
+    headerSize = FLAG_TYPE.size + ADDRESS_TYPE.size + (2 * LIST_LEN_TYPE.size)
+
     # MemoryMappedBlock definitions
     fields = [
         'isLeaf',
@@ -63,8 +75,7 @@ class _IndexBlock(MemoryMappedBlock, CacheableBlock):
 
         # MemoryMappedBlock calculations
         self.blockSize = NanoConfig.index_block_size
-        self.maxKeys = int((self.blockSize - (FLAG_TYPE.size + ADDRESS_TYPE.size + (2 * LIST_LEN_TYPE.size)))
-                           / (self.dataType.size + ADDRESS_TYPE.size))
+        self.maxKeys = int((self.blockSize - self.headerSize) / (self.dataType.size + ADDRESS_TYPE.size))
         self.dataTypes = {
             'isLeaf': FLAG_TYPE,
             'parent': ADDRESS_TYPE,
@@ -149,9 +160,58 @@ class _IndexBlock(MemoryMappedBlock, CacheableBlock):
 class LeafBlock(_IndexBlock):
     """
     IndexBlock which contains a mapping of key to address, where the address points to a tuple in the database table.
+
+    LeafBlocks are additionally linked to their neighbouring LeafBlocks, allowing ranges of keys to be walked in either
+    direction without revisiting interior blocks.  As the root block is the only block which may reside at address 0,
+    and it has no neighbours, an address of 0 indicates that there is no neighbouring leaf.
+
+    Entries with equal keys are ordered by address; together they form the posting list of the key.  A posting list
+    which does not fit within a single LeafBlock continues into the LeafBlocks following it.
     """
 
     isLeaf = 1
+    prevLeaf = 0 # Address of the LeafBlock holding the keys before ours
+    nextLeaf = 0 # Address of the LeafBlock holding the keys after ours
+
+    fields = [
+        'isLeaf',
+        'parent',
+        'prevLeaf',
+        'nextLeaf',
+        'keys',
+        'addresses',
+    ]
+    headerSize = _IndexBlock.headerSize + (2 * ADDRESS_TYPE.size)
+
+    def __init__(self, address, dataType):
+        _IndexBlock.__init__(self, address, dataType)
+
+        self.dataTypes['prevLeaf'] = ADDRESS_TYPE
+        self.dataTypes['nextLeaf'] = ADDRESS_TYPE
+
+
+    def add(self, key, address):
+        """
+        Adds a key & address to this Block; after any entries with the same key and a smaller address.
+
+        Inputs: key     - The key which will be used for lookups.
+                address - The address which will be returned upon successful lookup.
+        """
+
+        if self.full():
+            raise BufferError("IndexBlock is full")
+
+        lo, hi = bisect.bisect_left(self.keys, key), bisect.bisect_right(self.keys, key)
+        idx = lo + bisect.bisect_left(self.addresses[lo:hi], address)
+        self.keys.insert(idx, key)
+        self.addresses.insert(idx, address)
+
+
+    def lookupAll(self, key):
+        """ Returns the list of addresses associated with the given key in this block, in order of address. """
+
+        return self.addresses[bisect.bisect_left(self.keys, key): bisect.bisect_right(self.keys, key)]
+
 
     def lookup(self, key):
         """
@@ -175,10 +235,102 @@ class InteriorBlock(_IndexBlock):
     """
     IndexBlock which contains a mapping of key to address, where the address points to another IndexBlock.
 
-    Main difference of InteriorBlocks from LeafBlocks being that InteriorBlocks 
+    Main difference of InteriorBlocks from LeafBlocks being that InteriorBlocks know each of their children by its first
+    entry; both its key, and its position in the database table.  As the posting list of a key may span many children,
+    this allows an entry to be found by descending directly to the child holding it, rather than to the first child
+    holding its key.
     """
 
     isLeaf = 0
+    positions = None # List of the positions of the first entry of each child, alongside their keys
+
+    fields = [
+        'isLeaf',
+        'parent',
+        'keys',
+        'positions',
+        'addresses',
+    ]
+    headerSize = _IndexBlock.headerSize + LIST_LEN_TYPE.size
+    iterableFields = {'keys', 'positions', 'addresses'}
+    iterableFieldNumItemsDataType = {
+        'keys': LIST_LEN_TYPE,
+        'positions': LIST_LEN_TYPE,
+        'addresses': LIST_LEN_TYPE,
+    }
+
+    def __init__(self, address, dataType):
+        _IndexBlock.__init__(self, address, dataType)
+        self.positions = []
+
+        # Each entry additionally holds a position, so fewer fit within the block
+        self.maxKeys = int((self.blockSize - self.headerSize) / (self.dataType.size + 2 * ADDRESS_TYPE.size))
+        self.dataTypes['positions'] = ADDRESS_TYPE
+        self.iterableFieldSizes = {
+            'keys': self.maxKeys * self.dataType.size,
+            'positions': self.maxKeys * ADDRESS_TYPE.size,
+            'addresses': self.maxKeys * ADDRESS_TYPE.size,
+        }
+
+
+    def add(self, key, address, position=0):
+        """
+        Adds a child to this Block.
+
+        Inputs: key      - The key of the first entry of the child.
+                address  - The address of the child.
+                position - The position of the first entry of the child.
+        """
+
+        if self.full():
+            raise BufferError("IndexBlock is full")
+
+        lo, hi = bisect.bisect_left(self.keys, key), bisect.bisect_right(self.keys, key)
+        idx = lo + bisect.bisect_left(self.positions[lo:hi], position)
+        self.keys.insert(idx, key)
+        self.positions.insert(idx, position)
+        self.addresses.insert(idx, address)
+
+
+    def delete(self, key=None):
+        """
+        Deletes the last child with the given key from this Block.
+
+        Raises an KeyNotFound exception if key is not found in the block.
+        """
+
+        idx = bisect.bisect(self.keys, key)
+        if idx == 0 or self.keys[idx - 1] != key:
+            raise KeyNotFound(str(key))
+
+        self.deleteAddress(self.addresses[idx - 1])
+
+
+    def deleteAddress(self, address):
+        """
+        Deletes a child from this Block, given its address.
+
+        Raises an KeyNotFound exception if address is not found in the block.
+        """
+
+        if address not in self.addresses:
+            raise KeyNotFound("IndexBlock Address: %s" % address)
+
+        idx = self.addresses.index(address)
+
+        self.keys.pop(idx)
+        self.positions.pop(idx)
+        self.addresses.pop(idx)
+
+
+    def childIndex(self, key, position):
+        """
+        Returns the index of the child which holds (or should hold) the entry of the given key and position; the last
+        child whose first entry is not greater than it, or the first child if every child's first entry is greater.
+        """
+
+        lo, hi = bisect.bisect_left(self.keys, key), bisect.bisect_right(self.keys, key)
+        return max(0, lo + bisect.bisect_right(self.positions[lo:hi], position) - 1)
 
     def lookup(self, key):
         """
@@ -4,7 +4,8 @@ class CacheableBlock:
     caching objects.
     """
 
-    address = None # The address this block resides in in the file.
+    address = None   # The address this block resides in in the file.
+    blockSize = None # The number of bytes this block occupies in the file.
 
     # Private methods
     def _write(self, fd):
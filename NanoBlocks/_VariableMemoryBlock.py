@@ -1,3 +1,6 @@
+# Standard imports
+import copy
+
 # Project imports
 import NanoTypes
 
@@ -24,6 +27,9 @@ class VariableMemoryBlock:
     dataTypes = None
     # List of fields which are stored as iterables
     iterableFields = None
+    # Dictionary mapping fields appended to self.fields after instances may already have been serialized, to the value
+    # each takes when it is missing from the end of a string serialized before it was added
+    fieldDefaults = None
 
     ###
     # Variable Memory DataType classes
@@ -128,14 +134,19 @@ class VariableMemoryBlock:
 
         Inputs: s - A string containing the data to initialize this instance with.
 
-        Raises an error if s contains insufficient memory to initialize all fields in self.fields, or
-        if it contains extra bytes not required to initialize all fields in self.fields.
+        Raises an error if s contains insufficient memory to initialize all fields in self.fields (other than those
+        in self.fieldDefaults), or if it contains extra bytes not required to initialize all fields in self.fields.
         """
 
         # Current index into s
         idx = 0
 
         for fieldName in self.fields:
+            # Strings serialized before a field was added end before it; give the field its default value instead
+            if idx == len(s) and self.fieldDefaults and fieldName in self.fieldDefaults:
+                setattr(self, fieldName, copy.copy(self.fieldDefaults[fieldName]))
+                continue
+
             # Get the number of bytes to initialize this field with
             fieldLength, idx = self.__getFromBlock(self._sizeDataType, idx, self._sizeDataType.size, s)
 
@@ -6,15 +6,50 @@ from NanoBlocks._VariableMemoryBlock import VariableMemoryBlock
 class Config(VariableMemoryBlock):
     # Class Attributes
     column = None
-    unique = None # TODO implement - raise error if multiple added
+    unique = None          # Whether or not the index rejects the addition of a key it already contains
+    hashed = None          # Whether the index is a NanoIO.HashIndex.HashIndexIO, rather than a NanoIO.Index.IndexIO
+    trailingColumns = None # For an index over several columns, the configs of the columns following `column`
 
     # VariableMemoryMappedBlock definitions
     fields = [
         'column',
         'unique',
+        'hashed',
+        'trailingColumns',
     ]
     dataTypes = {
         'column': VariableMemoryBlock.SerializableClass(NanoConfig.Column.Config),
         'unique': NanoTypes.Uint(1),
+        'hashed': NanoTypes.Uint(1),
+        'trailingColumns': VariableMemoryBlock.SerializableClass(NanoConfig.Column.Config),
     }
+    iterableFields = [
+        'trailingColumns',
+    ]
+    fieldDefaults = {
+        'hashed': 0,
+        'trailingColumns': [],
+    }
+
+    def colNames(self):
+        """ Returns the names of the columns this index is over, in the order their values appear in its keys. """
+
+        return [self.column.name] + [col.name for col in self.trailingColumns or []]
+
+
+    def indexName(self):
+        """ Returns the name of this index; the name of its column, or its columns' names joined by commas. """
+
+        return ",".join(self.colNames())
+
+
+    def keyType(self):
+        """
+        Returns the type of the keys of this index; the type of its column, or if it is over several columns a
+        NanoTypes.Composite of their types whose keys are tuples of their values.
+        """
+
+        if not self.trailingColumns:
+            return NanoTypes.getType(self.column.typeString)
 
+        return NanoTypes.Composite(NanoTypes.getType(col.typeString) for col in [self.column] + self.trailingColumns)
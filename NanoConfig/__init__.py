@@ -11,14 +11,41 @@ __CONFIG = {
     'root_dir': None,
     # Number of bytes in each IndexBlock
     'index_block_size': 4096,
+    # Percentage of each IndexBlock's keys which are filled when bulk loading an index
+    'index_fill_percent': 90,
     # Maximum number of blocks a BlockCacheManager will store before writing to file
     'max_num_dirty_blocks': 10,
+    # Maximum number of bytes of clean (unmodified) blocks a BlockCacheManager will keep in memory
+    'block_cache_size': 4194304,
+    # Maximum number of changes made to a DeletedBlockManager's references before they are written to file
+    'max_num_dirty_refs': 1024,
+    # Number of bytes by which a table file's memory mapping is grown when rows are appended past its end
+    'table_growth_size': 1048576,
+    # Number of bytes of a table file read at a time when scanning over its rows
+    'scan_buffer_size': 4194304,
+    # Maximum number of parsed queries a NanoConnection keeps for reuse when the same query is executed again
+    'query_cache_size': 256,
+    # Maximum number of bytes of rows a join holds in memory before partitioning its inputs to temporary files
+    'join_buffer_size': 16777216,
+    # Maximum number of bytes of rows a sort holds in memory before writing them to a temporary file as a sorted run
+    'sort_buffer_size': 16777216,
+    # Maximum number of bytes of groups an aggregation holds in memory before partitioning its rows to temporary files
+    'group_buffer_size': 16777216,
 }
 
 # A set of numeric configuration options
 __NUMERIC_CONFIGS = {
     'index_block_size',
+    'index_fill_percent',
     'max_num_dirty_blocks',
+    'block_cache_size',
+    'max_num_dirty_refs',
+    'table_growth_size',
+    'scan_buffer_size',
+    'query_cache_size',
+    'join_buffer_size',
+    'sort_buffer_size',
+    'group_buffer_size',
 }
 
 
@@ -62,8 +89,26 @@ def __loadFromCmdLine():
     parser.add_argument('--index-block-size',
                         default=__CONFIG['index_block_size'],
                         help="Number of bytes in each IndexBlock. (default: %(default)s)")
+    parser.add_argument('--index-fill-percent',
+                        help="Percentage of each IndexBlock filled when bulk loading an index. (default: %(default)s)")
     parser.add_argument('--max_num_dirty_blocks',
                         help="Maximum number of blocks that will be cached before writing to file. (default: %(default)s)")
+    parser.add_argument('--block-cache-size',
+                        help="Maximum number of bytes of clean blocks that will be cached. (default: %(default)s)")
+    parser.add_argument('--max-num-dirty-refs',
+                        help="Maximum number of changes to deleted refs before writing to file. (default: %(default)s)")
+    parser.add_argument('--table-growth-size',
+                        help="Number of bytes by which a table file's memory mapping grows. (default: %(default)s)")
+    parser.add_argument('--scan-buffer-size',
+                        help="Number of bytes of a table file read at a time when scanning it. (default: %(default)s)")
+    parser.add_argument('--query-cache-size',
+                        help="Maximum number of parsed queries a connection keeps for reuse. (default: %(default)s)")
+    parser.add_argument('--join-buffer-size',
+                        help="Maximum number of bytes of rows a join holds in memory. (default: %(default)s)")
+    parser.add_argument('--sort-buffer-size',
+                        help="Maximum number of bytes of rows a sort holds in memory. (default: %(default)s)")
+    parser.add_argument('--group-buffer-size',
+                        help="Maximum number of bytes of groups an aggregation holds in memory. (default: %(default)s)")
 
     return [(k, v) for k, v in parser.parse_args().__dict__.items() if v is not None]
 
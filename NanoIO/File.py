@@ -3,7 +3,7 @@ Contains miscellaneous functions for creating / getting / removing database, tab
 """
 
 # Standard imports
-import os, glob, shutil
+import os, glob, shutil, tempfile
 
 # Project imports
 import NanoConfig
@@ -13,7 +13,9 @@ __TABLE_EXT = "tbl"    # Table Extension
 __CONFIG_EXT = "tcf"   # Table Config Extension
 __INDEX_EXT = "idx"    # Index Extension
 __DELMGR_EXT = "del"   # Deleted Block Manager Extension
+__STATS_EXT = "sts"    # Index Statistics Extension
 __PTR_FSTR_EXT = "pfs" # Pointer Type Filestore Extension
+__TEMP_EXT = "tmp"     # Temporary File Extension
 
 
 ###
@@ -26,6 +28,7 @@ indexPath = lambda dbName, tableName, colName: _path(dbName, indexFileName(table
 tablePath = lambda dbName, tableName: _path(dbName, tableName, __TABLE_EXT)
 configPath = lambda dbName, tableName: _path(dbName, tableName, __CONFIG_EXT)
 delMgrPath = lambda dbName, tableName: _path(dbName, tableName, __DELMGR_EXT)
+statsPath = lambda dbName, indexName: _path(dbName, indexName, __STATS_EXT)
 ptrFstrName = lambda tableName, colName: "%s_%s" % (tableName, colName)
 ptrFstrPath = lambda dbName, tableName, colName: _path(dbName, ptrFstrName(tableName, colName), __PTR_FSTR_EXT)
 
@@ -47,6 +50,9 @@ def checkPtrFstrExists(dbName, tableName, colName):
 def checkDelMgrExists(dbName, name):
     return os.path.isfile(delMgrPath(dbName, name))
 
+def checkStatsExists(dbName, name):
+    return os.path.isfile(statsPath(dbName, name))
+
 def assertDatabaseExists(dbName):
     if not checkDatabaseExists(dbName):
         raise IOError("Database %s does not exist at %s" % (dbName, NanoConfig.root_dir))
@@ -71,12 +77,17 @@ def _renameIndex(index, dbName, tableName): #TODO test
     index.close()
 
     # Rename the index data file
-    os.rename(indexPath(dbName, index.tableName, index.indexConfig.column.name),
-              indexPath(dbName, tableName, index.indexConfig.column.name))
+    os.rename(indexPath(dbName, index.tableName, index.indexConfig.indexName()),
+              indexPath(dbName, tableName, index.indexConfig.indexName()))
 
     # Rename the deleted manager file for our data file
-    os.rename(delMgrPath(dbName, indexFileName(index.tableName, index.indexConfig.column.name)),
-              delMgrPath(dbName, indexFileName(tableName, index.indexConfig.column.name)))
+    os.rename(delMgrPath(dbName, indexFileName(index.tableName, index.indexConfig.indexName())),
+              delMgrPath(dbName, indexFileName(tableName, index.indexConfig.indexName())))
+
+    # Rename the statistics file of the index, if its statistics have been gathered
+    if checkStatsExists(dbName, indexFileName(index.tableName, index.indexConfig.indexName())):
+        os.rename(statsPath(dbName, indexFileName(index.tableName, index.indexConfig.indexName())),
+                  statsPath(dbName, indexFileName(tableName, index.indexConfig.indexName())))
     
 
 def _renameTable(table, dbName, tableName): # TODO test
@@ -142,6 +153,16 @@ def createPtrFstr(dbName, tableName, colName):
 
     return open(ptrFstrPath(dbName, tableName, colName), 'w+')
 
+def createTempFile(dbName):
+    """
+    Creates a temporary file in a database's directory, which queries may spill intermediate results to.  The file is
+    removed when it is closed.
+    """
+
+    assertDatabaseExists(dbName)
+
+    return tempfile.TemporaryFile(prefix="_", suffix=".%s" % __TEMP_EXT, dir=dbPath(dbName))
+
 # Deletes
 def deleteDatabase(name):
     assertDatabaseExists(name)
@@ -157,6 +178,9 @@ def deleteIndex(dbName, tableName, colName):
     if checkDelMgrExists(dbName, indexFileName(tableName, colName)):
         os.remove(delMgrPath(dbName, indexFileName(tableName, colName)))
 
+    if checkStatsExists(dbName, indexFileName(tableName, colName)):
+        os.remove(statsPath(dbName, indexFileName(tableName, colName)))
+
 def deleteTable(dbName, name):
     assertDatabaseExists(dbName)
 
@@ -0,0 +1,548 @@
+# Standard imports
+import os
+import zlib
+
+# Project imports
+import NanoConfig
+import NanoTools
+import NanoIO.File
+import NanoIO.Index
+from NanoBlocks.Index import KeyNotFound, DuplicateKey
+from NanoBlocks.HashIndex import HashDirectoryBlock, HashBucketBlock
+
+# Globals
+SPLIT_LOAD_FACTOR = 0.75 # Fraction of the capacity of an index's buckets which may be filled before one is split
+
+class HashIndexIO:
+    """
+    Class whose instances are responsible for managing a hash index of a column in a given table.
+
+    Has the same interface as NanoIO.Index.IndexIO, but entries are held in buckets chosen by the hash of their key
+    rather than in key order; so while the entries of a key are found by reading a single bucket (usually a single
+    block), ranges of keys can only be found by reading every entry in the index.
+
+    The index grows by linear hashing.  Once its entries fill more than SPLIT_LOAD_FACTOR of its buckets' capacity the
+    next bucket in turn is split in two; moving the entries whose hash has the next bit set into a new bucket.  As
+    buckets are split in order of bucket number, the number of buckets alone determines which bucket a key is in.
+    """
+
+    ordered = False    # Entries cannot be iterated over in key order, so ranges of keys cannot be looked up directly
+
+    dbName = None      # Name of the database containing the table whose column this index is for
+    tableName = None   # Name of the table the column this index is for belongs to
+    indexConfig = None # NanoConfig.Index.Config instance for this Index
+    colType = None     # DataType of the keys of this index; see NanoConfig.Index.Config.keyType
+    indexFD = None     # A file descriptor open to this index's file
+    directory = None   # The list of NanoBlocks.HashIndex.HashDirectoryBlocks of this index; always held in memory
+    numBuckets = None  # The number of buckets in this index
+    bucketKeys = None  # The maximum number of keys each block of a bucket can hold
+    stats = None       # A dictionary of statistics describing the keys in this index, see statistics()
+    numChanges = None  # The number of entries added to or deleted from this index since stats were gathered
+
+    # Data Model methods
+    def __init__(self, dbName, tableName, indexConfig):
+        self.dbName = dbName
+        self.tableName = tableName
+        self.indexConfig = indexConfig
+        self.indexFD = NanoIO.File.getIndex(self.dbName, self.tableName, self.indexConfig.indexName())
+
+        self.cacheMgr = NanoTools.BlockCacheManager.BlockCacheManager(self.indexFD)
+        self.delMgr = NanoTools.DeletedBlockManager.DeletedBlockManager(
+            self.dbName, NanoIO.File.indexFileName(self.tableName, self.indexConfig.indexName())
+        )
+        self.colType = self.indexConfig.keyType()
+        self.bucketKeys = HashBucketBlock(0, self.colType).maxKeys
+        self.stats, self.numChanges = NanoIO.Index.readStatistics(
+            self.dbName, NanoIO.File.indexFileName(self.tableName, self.indexConfig.indexName())
+        )
+
+        # Check if our index is empty.  If it is, create a single empty bucket to start with
+        self.indexFD.seek(0, os.SEEK_END)
+        if self.indexFD.tell() == 0:
+            self.bulkLoad([])
+            return
+
+        # Otherwise read in the chain of directory blocks beginning at address 0
+        self.directory = []
+        address = 0
+        while True:
+            self.indexFD.seek(address)
+            block = HashDirectoryBlock(address).fromString(self.indexFD.read(NanoConfig.index_block_size))
+            self.directory.append(block)
+            address = block.nextBlock
+            if not address:
+                break
+        self.numBuckets = sum(len(block.addresses) for block in self.directory)
+
+
+    # Private methods
+    def _hash(self, key):
+        """ Returns the hash of a key; computed from its serialized form, so that it is the same across processes. """
+
+        return zlib.crc32(self.colType.toString(key)) & 0xffffffff
+
+
+    def _bucketNum(self, key):
+        """ Returns the number of the bucket which holds the entries of the given key. """
+
+        keyHash = self._hash(key)
+        num = keyHash & ((1 << self.numBuckets.bit_length()) - 1)
+
+        # Buckets which have not yet been split off from their lower half have not been created yet
+        if num >= self.numBuckets:
+            num = keyHash & ((1 << (self.numBuckets.bit_length() - 1)) - 1)
+
+        return num
+
+
+    def _bucketBlocks(self, num):
+        """ Returns an iterator over the chain of HashBucketBlocks of the given bucket. """
+
+        perBlock = self.directory[0].maxAddresses
+        address = self.directory[num / perBlock].addresses[num % perBlock]
+        while True:
+            block = self._getBlockAtAddress(address)
+            yield block
+            address = block.overflow
+            if not address:
+                return
+
+
+    def _getBlockAtAddress(self, address):
+        """ Returns the bucket block at the given index. """
+
+        if address in self.cacheMgr:
+            return self.cacheMgr.getBlock(address)
+
+        self.indexFD.seek(address)
+        block = self.indexFD.read(NanoConfig.index_block_size)
+
+        if not block:
+            raise IndexError("Index does not contain an address: %s" % address)
+
+        block = HashBucketBlock(address, self.colType).fromString(block)
+        self.cacheMgr.addCleanBlock(block)
+
+        return block
+
+
+    def _writeBlockToFile(self, block):
+        """ Marks that the block should be serialized to the index. """
+
+        self.cacheMgr.addBlock(block)
+
+
+    def _markBlockDeleted(self, block):
+        """ Marks that the index at which this block existed is available for a new block to be written to. """
+
+        self.delMgr.addRef(block.address)
+
+
+    def _getAddressForNewBlock(self):
+        """ Returns an index which we can write a new block to.  Re-uses previously deleted indices if possible. """
+
+        address = self.delMgr.popRef()
+        if address is None:
+            self.indexFD.seek(0, os.SEEK_END)
+            dirtyMax = (max(self.cacheMgr.keys()) + NanoConfig.index_block_size if len(self.cacheMgr.keys()) else -1)
+            address = max(self.indexFD.tell(), dirtyMax)
+
+        return address
+
+
+    def _newBucketBlock(self):
+        """ Returns a new, empty HashBucketBlock; written to an unused address in the index. """
+
+        block = HashBucketBlock(self._getAddressForNewBlock(), self.colType)
+        self._writeBlockToFile(block)
+        return block
+
+
+    def _writeBucket(self, blocks, entries):
+        """
+        Rewrites the chain of blocks of a bucket to hold the given entries; adding overflow blocks to the chain, or
+        deleting them from it, as required.
+
+        Inputs: blocks  - The list of HashBucketBlocks currently in the bucket's chain, beginning with its first block.
+                entries - A list of the (key, position) tuples the bucket should hold.
+        """
+
+        numBlocks = max(1, (len(entries) + self.bucketKeys - 1) / self.bucketKeys)
+        for block in blocks[numBlocks:]:
+            self._markBlockDeleted(block)
+        blocks = blocks[:numBlocks]
+        while len(blocks) < numBlocks:
+            blocks.append(self._newBucketBlock())
+
+        for blockNum, block in enumerate(blocks):
+            blockEntries = entries[blockNum * self.bucketKeys: (blockNum + 1) * self.bucketKeys]
+            block.keys = [key for key, pos in blockEntries]
+            block.addresses = [pos for key, pos in blockEntries]
+            block.overflow = blocks[blockNum + 1].address if blockNum < numBlocks - 1 else 0
+            self._writeBlockToFile(block)
+
+
+    def _addBucket(self, address):
+        """ Appends the address of a new bucket to our directory; adding a block to the directory if required. """
+
+        block = self.directory[-1]
+        if block.full():
+            newBlock = HashDirectoryBlock(self._getAddressForNewBlock())
+            block.nextBlock = newBlock.address
+            self._writeBlockToFile(block)
+            self.directory.append(newBlock)
+            block = newBlock
+
+        block.addresses.append(address)
+        self._writeBlockToFile(block)
+        self.numBuckets += 1
+
+
+    def _changeEntries(self, numEntries):
+        """ Records that the given number of entries have been added to (or if negative, deleted from) the index. """
+
+        self.directory[0].numEntries += numEntries
+        self._writeBlockToFile(self.directory[0])
+        self.numChanges += abs(numEntries)
+
+
+    def _split(self):
+        """ Splits the next bucket in turn into two; moving the entries of keys whose hash has its next bit set. """
+
+        splitNum = self.numBuckets - (1 << (self.numBuckets.bit_length() - 1))
+        blocks = list(self._bucketBlocks(splitNum))
+        entries = [entry for block in blocks for entry in zip(block.keys, block.addresses)]
+
+        # The new bucket's number is the split bucket's number with the next bit of the hash set
+        mask = (1 << self.numBuckets.bit_length()) - 1
+        moved = [(key, pos) for key, pos in entries if self._hash(key) & mask == self.numBuckets]
+        kept = [(key, pos) for key, pos in entries if self._hash(key) & mask != self.numBuckets]
+
+        self._writeBucket(blocks, kept)
+        newBlock = self._newBucketBlock()
+        self._writeBucket([newBlock], moved)
+        self._addBucket(newBlock.address)
+
+
+    def _iterate(self):
+        """
+        Iterates over the entries in this Index, in no particular order.
+
+        The Index should not be modified while iterating over it.
+
+        Returns: An iterator over (key, position) tuples of the entries in this index.
+        """
+
+        for num in xrange(self.numBuckets):
+            for block in self._bucketBlocks(num):
+                for entry in zip(block.keys, block.addresses):
+                    yield entry
+
+
+    # Public methods
+    def lookup(self, key):
+        """
+        Looks up the position of a single value in the database table file
+
+        Inputs: key - The key to look up in the index.
+
+        Returns: The smallest position in the database table file that a tuple with the given key appears in if found.
+                 Raises a NanoBlocks.Index.KeyNotFound if it does not exist in the index.
+        """
+
+        positions = self.lookupAll(key)
+        if not positions:
+            raise KeyNotFound(str(key))
+
+        return positions[0]
+
+
+    def lookupAll(self, key):
+        """
+        Looks up the posting list of a key; the positions of every row in the database table file having the key.
+
+        Inputs: key - The key to look up in the index.
+
+        Returns: A list of the positions of the rows having the key, in order of position.  Empty if there are none.
+        """
+
+        positions = []
+        for block in self._bucketBlocks(self._bucketNum(key)):
+            positions.extend(block.lookupAll(key))
+            if positions and self.indexConfig.unique:
+                break
+
+        return sorted(positions)
+
+
+    def lookupMany(self, keys):
+        """
+        Looks up the entries of several keys; reading the bucket of each.
+
+        Inputs: keys - An iterable of the keys to look up.
+
+        Returns: A list of (key, position) tuples of the entries having any of the given keys, in key order.
+        """
+
+        return [(key, pos) for key in sorted(set(keys)) for pos in self.lookupAll(key)]
+
+
+    def iterateCondition(self, condition, reverse=False):
+        """
+        Iterates over the entries in this index which satisfy the given filter, in key order.  Unless the filter is on
+        a set of values every entry in the index must be read and sorted; see NanoIO.Index.IndexIO for an index which
+        can look up ranges.
+
+        Inputs: condition - An instance of NanoTools.NanoCondition.Filter on the column this index is for.
+                reverse   - If True, entries are iterated over in descending order of key.
+
+        Returns: An iterator over (key, position) tuples of the entries satisfying the given filter.
+        """
+
+        if condition.inItems is None:
+            entries = sorted(entry for entry in self._iterate() if condition.withinBounds(entry[0]))
+        else:
+            entries = self.lookupMany(item for item in condition.inItems if condition.withinBounds(item))
+
+        for entry in (reversed(entries) if reverse else entries):
+            yield entry
+
+
+    def lookupCondition(self, condition):
+        """
+        Returns a list of positions in the database table file which satisfy the given filter.
+
+        Inputs: condition - An instance of NanoTools.NanoCondition.Filter on the column this index is for.
+
+        Returns: A list of positions of tuples in the database table file satisfying the given filter, in key order.
+        """
+
+        return [pos for key, pos in self.iterateCondition(condition)]
+
+
+    def statistics(self):
+        """
+        Returns statistics describing the keys in this index.  As every entry of a key is in the same bucket, distinct
+        keys are counted one bucket at a time.  As with NanoIO.Index.IndexIO, statistics are reused until more than
+        NanoIO.Index.STATISTICS_STALE_FRACTION of the entries they describe have been added or deleted, and are written
+        alongside the index when it is closed.
+
+        Returns: A dictionary containing:
+                   entries  - The number of entries in the index.
+                   distinct - The number of distinct keys in the index.
+        """
+
+        if self.stats is not None and self.numChanges <= self.stats['entries'] * NanoIO.Index.STATISTICS_STALE_FRACTION:
+            return self.stats
+
+        distinct = 0
+        for num in xrange(self.numBuckets):
+            distinct += len(set(key for block in self._bucketBlocks(num) for key in block.keys))
+
+        self.stats = {'entries': self.directory[0].numEntries, 'distinct': distinct}
+        self.numChanges = 0
+        return self.stats
+
+
+    def estimateEntries(self, condition):
+        """
+        Estimates the number of entries in this index which satisfy the given filter, from the statistics of this index.
+
+        Inputs: condition - An instance of NanoTools.NanoCondition.Filter on the column this index is for.
+
+        Returns: The estimated number of entries, as a float.
+        """
+
+        # A range of keys can only be found by reading every entry
+        if condition.inItems is None:
+            return float(self.directory[0].numEntries)
+
+        items = [item for item in set(condition.inItems) if condition.withinBounds(item)]
+        if self.indexConfig.unique:
+            return float(len(items))
+
+        stats = self.statistics()
+        if not stats['entries']:
+            return 0.0
+
+        return len(items) * stats['entries'] / float(stats['distinct'])
+
+
+    def add(self, key, pos):
+        """
+        Adds the given key to the index.
+
+        Inputs: key - The value of the column in the tuple to be looked up upon.
+                pos - The position of the tuple in the database table file.
+
+        Raises a DuplicateKey exception if the index is unique and already contains the key.
+        """
+
+        # Find a block in the key's bucket with room for it; a unique index must check every block for the key first
+        target = None
+        for block in self._bucketBlocks(self._bucketNum(key)):
+            if self.indexConfig.unique and key in block.keys:
+                raise DuplicateKey(str(key))
+            if target is None and not block.full():
+                target = block
+                if not self.indexConfig.unique:
+                    break
+
+        if target is None:
+            target = self._newBucketBlock()
+            block.overflow = target.address
+            self._writeBlockToFile(block)
+
+        target.add(key, pos)
+        self._writeBlockToFile(target)
+        self._changeEntries(1)
+
+        if self.directory[0].numEntries > SPLIT_LOAD_FACTOR * self.numBuckets * self.bucketKeys:
+            self._split()
+
+
+    def addMany(self, pairs):
+        """
+        Adds many keys to the index.
+
+        Inputs: pairs - An iterable of (key, pos) tuples to add to the index.
+
+        If the index is currently empty it is instead built from scratch using bulkLoad.
+
+        Raises a DuplicateKey exception if the index is unique and would contain a key more than once; in which case
+        none of the keys are added.
+        """
+
+        pairs = list(pairs)
+        if not self.directory[0].numEntries:
+            self.bulkLoad(pairs)
+            return
+
+        for idx, (key, pos) in enumerate(pairs):
+            try:
+                self.add(key, pos)
+            except DuplicateKey:
+                for key, pos in pairs[:idx]:
+                    self.delete(key, pos)
+                raise
+
+
+    def bulkLoad(self, sortedPairs, fillPercent=None):
+        """
+        Replaces the contents of this index with the given keys.  The number of buckets required is calculated in
+        advance and the entries divided between them, so that every block is written to the index file once,
+        sequentially; the directory first, followed by the first block of each bucket, then any overflow blocks.
+
+        Inputs: sortedPairs - An iterable of (key, pos) tuples.  Unlike NanoIO.Index.IndexIO, need not be sorted.
+                fillPercent - The percentage of each bucket's first block to fill; leaving room for later additions to
+                              be made without splitting buckets.  Defaults to NanoConfig.index_fill_percent.
+
+        Raises a DuplicateKey exception, leaving our contents unchanged, if the index is unique and a key is repeated.
+        """
+
+        pairs = list(sortedPairs)
+        fillPercent = NanoConfig.index_fill_percent if fillPercent is None else fillPercent
+
+        if self.indexConfig.unique:
+            keys = set()
+            for key, pos in pairs:
+                if key in keys:
+                    raise DuplicateKey(str(key))
+                keys.add(key)
+
+        # Discard our current contents
+        self.stats = None
+        self.cacheMgr.truncate()
+        self.delMgr.truncate()
+        self.indexFD.seek(0)
+        self.indexFD.truncate()
+
+        # Divide the entries between as many buckets as are needed to fill each to the requested percentage
+        keysPerBucket = max(1, self.bucketKeys * fillPercent / 100)
+        self.numBuckets = max(1, (len(pairs) + keysPerBucket - 1) / keysPerBucket)
+        buckets = [[] for num in xrange(self.numBuckets)]
+        for key, pos in pairs:
+            buckets[self._bucketNum(key)].append((key, pos))
+
+        perDirectory = HashDirectoryBlock(0).maxAddresses
+        numDirectory = (self.numBuckets + perDirectory - 1) / perDirectory
+        blockAddress = lambda blockNum: blockNum * NanoConfig.index_block_size
+
+        self.directory = []
+        for blockNum in xrange(numDirectory):
+            block = HashDirectoryBlock(blockAddress(blockNum))
+            block.nextBlock = blockAddress(blockNum + 1) if blockNum < numDirectory - 1 else 0
+            lastNum = min(self.numBuckets, (blockNum + 1) * perDirectory)
+            block.addresses = [blockAddress(numDirectory + num) for num in xrange(blockNum * perDirectory, lastNum)]
+            self.directory.append(block)
+        self.directory[0].numEntries = len(pairs)
+
+        self.indexFD.seek(0)
+        for block in self.directory:
+            self.indexFD.write(block.toString())
+
+        # Write the first block of each bucket, setting aside the remainder of any bucket which overflows it
+        overflows = []
+        nextOverflow = numDirectory + self.numBuckets
+        for num, entries in enumerate(buckets):
+            blocks = []
+            for start in xrange(0, max(1, len(entries)), self.bucketKeys):
+                block = HashBucketBlock(blockAddress(numDirectory + num if not start else nextOverflow), self.colType)
+                block.keys = [key for key, pos in entries[start: start + self.bucketKeys]]
+                block.addresses = [pos for key, pos in entries[start: start + self.bucketKeys]]
+                if blocks:
+                    blocks[-1].overflow = block.address
+                    nextOverflow += 1
+                blocks.append(block)
+
+            self.indexFD.write(blocks[0].toString())
+            overflows.extend(blocks[1:])
+
+        for block in overflows:
+            self.indexFD.write(block.toString())
+
+        self.indexFD.flush()
+
+
+    def delete(self, key, pos=None):
+        """
+        Deletes an entry from the index.
+
+        Inputs: key - The key of the entry to delete from the index.
+                pos - The position of the entry to delete.  If None, the entry with the key and the smallest position
+                      is deleted.
+
+        Outputs: None if successful; raises a KeyNotFound exception if the entry cannot be found.
+        """
+
+        blocks = list(self._bucketBlocks(self._bucketNum(key)))
+        found = None
+        for blockNum, block in enumerate(blocks):
+            for idx, (entryKey, entryPos) in enumerate(zip(block.keys, block.addresses)):
+                if entryKey == key and (entryPos == pos if pos is not None else found is None or entryPos < found[2]):
+                    found = (blockNum, idx, entryPos)
+
+        if found is None:
+            raise KeyNotFound(str(key) if pos is None else "%s at %s" % (key, pos))
+
+        blockNum, idx, entryPos = found
+        block = blocks[blockNum]
+        block.keys.pop(idx)
+        block.addresses.pop(idx)
+        self._writeBlockToFile(block)
+        self._changeEntries(-1)
+
+        # Unlink emptied overflow blocks from the bucket's chain
+        if not block.keys and blockNum:
+            blocks[blockNum - 1].overflow = block.overflow
+            self._writeBlockToFile(blocks[blockNum - 1])
+            self._markBlockDeleted(block)
+
+
+    def close(self):
+        self.cacheMgr.flushAll()
+        self.delMgr.close()
+        self.indexFD.close()
+        NanoIO.Index.writeStatistics(self.dbName,
+                                     NanoIO.File.indexFileName(self.tableName, self.indexConfig.indexName()),
+                                     self.stats, self.numChanges)
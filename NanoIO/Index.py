@@ -1,34 +1,84 @@
 # Standard imports
 import os
+import bisect
+import cPickle
 
 # Project imports
-import NanoTypes
 import NanoConfig
 import NanoTools
 import NanoIO.File
-from NanoBlocks.Index import LeafBlock, InteriorBlock, KeyNotFound
+from NanoBlocks.Index import LeafBlock, InteriorBlock, KeyNotFound, DuplicateKey
+
+# Globals
+STATISTICS_BUCKETS = 100        # The number of (equally sized) buckets of keys statistics describe the distribution of
+STATISTICS_STALE_FRACTION = 0.1 # Fraction of an index's entries which must change before its statistics are regathered
+
+
+def readStatistics(dbName, indexName):
+    """
+    Returns a tuple of (statistics, number of changes made since they were gathered) of an index, as last written by
+    writeStatistics; or (None, 0) if none have been written.
+
+    Inputs: dbName    - The name of the database the index is in.
+            indexName - The name of the index's file; see NanoIO.File.indexFileName.
+    """
+
+    if not NanoIO.File.checkStatsExists(dbName, indexName):
+        return None, 0
+
+    with open(NanoIO.File.statsPath(dbName, indexName), 'rb') as statsFD:
+        try:
+            return cPickle.load(statsFD)
+        except (cPickle.UnpicklingError, EOFError, ValueError):
+            return None, 0
+
+
+def writeStatistics(dbName, indexName, stats, numChanges):
+    """
+    Writes the statistics of an index to its statistics file, so that they need not be regathered when the index is
+    next opened.  If the index has no statistics, any previously written are removed.
+
+    Inputs: dbName     - The name of the database the index is in.
+            indexName  - The name of the index's file; see NanoIO.File.indexFileName.
+            stats      - The statistics of the index, or None.
+            numChanges - The number of entries added to or deleted from the index since the statistics were gathered.
+    """
+
+    if stats is None:
+        if NanoIO.File.checkStatsExists(dbName, indexName):
+            os.remove(NanoIO.File.statsPath(dbName, indexName))
+        return
+
+    with open(NanoIO.File.statsPath(dbName, indexName), 'wb') as statsFD:
+        cPickle.dump((stats, numChanges), statsFD, cPickle.HIGHEST_PROTOCOL)
 
 class IndexIO:
     """ Class whose instances are responsible for managing an index of a column in a given table. """
 
+    ordered = True     # Entries can be iterated over in key order, so ranges of keys can be looked up
     dbName = None      # Name of the database containing the table whose column this index is for
     tableName = None   # Name of the table the column this index is for belongs to
     indexConfig = None # NanoConfig.Index.Config instance for this Index
-    colType = None     # DataType of the column this index is for
+    colType = None     # DataType of the keys of this index; see NanoConfig.Index.Config.keyType
     indexFD = None     # A file descriptor open to this index's file
+    stats = None       # A dictionary of statistics describing the keys in this index, see statistics()
+    numChanges = None  # The number of entries added to or deleted from this index since stats were gathered
 
     # Data Model methods
     def __init__(self, dbName, tableName, indexConfig):
         self.dbName = dbName
         self.tableName = tableName
         self.indexConfig = indexConfig
-        self.indexFD = NanoIO.File.getIndex(self.dbName, self.tableName, self.indexConfig.column.name)
+        self.indexFD = NanoIO.File.getIndex(self.dbName, self.tableName, self.indexConfig.indexName())
 
         self.cacheMgr = NanoTools.BlockCacheManager.BlockCacheManager(self.indexFD)
         self.delMgr = NanoTools.DeletedBlockManager.DeletedBlockManager(
-            self.dbName, NanoIO.File.indexFileName(self.tableName, self.indexConfig.column.name)
+            self.dbName, NanoIO.File.indexFileName(self.tableName, self.indexConfig.indexName())
+        )
+        self.colType = self.indexConfig.keyType()
+        self.stats, self.numChanges = readStatistics(
+            self.dbName, NanoIO.File.indexFileName(self.tableName, self.indexConfig.indexName())
         )
-        self.colType = NanoTypes.getType(self.indexConfig.column.typeString)
 
         # Check if our index is empty.  If it is, create an empty leafblock to start with
         self.indexFD.seek(0, os.SEEK_END)
@@ -103,6 +153,78 @@ class IndexIO:
         return block
 
 
+    def _entriesChanged(self, numEntries):
+        """
+        Records that entries have been added to (or if negative, deleted from) the index; keeping the number of entries
+        our statistics describe up to date, so they remain accurate until the distribution of keys may have changed.
+        """
+
+        self.numChanges += abs(numEntries)
+        if self.stats is not None:
+            self.stats['entries'] += numEntries
+            if self.indexConfig.unique:
+                self.stats['distinct'] += numEntries
+
+
+    def _entryLeaf(self, key, pos):
+        """
+        Returns the LeafBlock which holds (or should hold) the entry of the given key and position.  As entries with
+        equal keys are ordered by position, a key's entries may span several consecutive leaves; interior blocks know
+        each child by both the key and position of its first entry, so the leaf is found in a single descent however
+        long the key's posting list is.
+        """
+
+        block = self._getBlockAtAddress(0)
+        while isinstance(block, InteriorBlock):
+            block = self._getBlockAtAddress(block.addresses[block.childIndex(key, pos)])
+
+        return block
+
+
+    @staticmethod
+    def _firstEntry(block):
+        """ Returns the (key, position) of the first entry beneath the given (non-empty) block. """
+
+        return block.keys[0], (block.addresses[0] if block.isLeaf else block.positions[0])
+
+
+    def _assertUnique(self, leaf, key):
+        """
+        Raises a DuplicateKey if the index already contains the given key.  Rather than looking the key up, the leaf
+        which an entry for it would be added to (as returned by _entryLeaf) is given; an existing entry can only be
+        within it, or at the adjoining end of one of its neighbours.
+        """
+
+        idx = bisect.bisect_left(leaf.keys, key)
+        if (idx < len(leaf.keys) and leaf.keys[idx] == key) or \
+           (idx == 0 and leaf.prevLeaf and self._getBlockAtAddress(leaf.prevLeaf).keys[-1:] == [key]) or \
+           (idx == len(leaf.keys) and leaf.nextLeaf and self._getBlockAtAddress(leaf.nextLeaf).keys[:1] == [key]):
+            raise DuplicateKey(str(key))
+
+
+    def _findEntry(self, key, pos=None):
+        """
+        Finds an entry in the index.
+
+        Inputs: key - The key of the entry to find.
+                pos - The position of the entry to find; if None, the first entry with the given key is found.
+
+        Returns: A tuple of (LeafBlock, index) of the entry within the leaf.  Raises a KeyNotFound if there is no entry.
+        """
+
+        # Positions are never negative, so (key, -1) precedes each of the key's entries
+        block = self._entryLeaf(key, -1 if pos is None else pos)
+        while True:
+            lo, hi = bisect.bisect_left(block.keys, key), bisect.bisect_right(block.keys, key)
+            idx = lo if pos is None else lo + bisect.bisect_left(block.addresses[lo:hi], pos)
+            if idx < hi and (pos is None or block.addresses[idx] == pos):
+                return block, idx
+
+            if hi < len(block.keys) or not block.nextLeaf:
+                raise KeyNotFound(str(key) if pos is None else "%s at %s" % (key, pos))
+            block = self._getBlockAtAddress(block.nextLeaf)
+
+
     def _getBlockAtAddress(self, address):
         """ Returns the index block at the given index. """
 
@@ -116,7 +238,10 @@ class IndexIO:
             raise IndexError("Index does not contain an address: %s" % address)
 
         # Check the first byte of the block to determine whether or not it is a leaf or interior block
-        return (LeafBlock if ord(block[0]) else InteriorBlock)(address, self.colType).fromString(block)
+        block = (LeafBlock if ord(block[0]) else InteriorBlock)(address, self.colType).fromString(block)
+        self.cacheMgr.addCleanBlock(block)
+
+        return block
 
 
     def _writeBlockToFile(self, block):
@@ -160,24 +285,75 @@ class IndexIO:
             child.parent = block.address
             self._writeBlockToFile(child)
 
-    def _updateParentsKeys(self, block, oldKey, newKey):
+    def _edgeLeaf(self, address, last=False):
         """
-        In the event that we add a key to the left end of a block, its key (which indicates that everything in the block
-        is >= than it) needs to be updated; and this is true for all the parents of this block as well, assuming that
-        this block and its parents are the smallest blocks in all of their parents.
+        Returns the first LeafBlock in key order beneath the block at the given address.
 
-        Inputs: block  - The block whose key has been updated
-                oldKey - The old key for this block.
-                newKey - The new key for this block.
+        Inputs: address - The address of the block to descend from.
+                last    - If True, the last LeafBlock in key order is returned instead.
         """
 
-        parent = self._getBlockAtAddress(block.parent)
-        # Check if this key was the smallest key in this block.
-        if parent.keys[0] == oldKey:
-            parent.deleteAddress(block.address)
-            parent.add(newKey, block.address)
+        block = self._getBlockAtAddress(address)
+        while isinstance(block, InteriorBlock):
+            block = self._getBlockAtAddress(block.addresses[-1 if last else 0])
+
+        return block
+
+    def _linkLeaf(self, leaf, prevAddress, nextAddress):
+        """
+        Links a LeafBlock into the chain of leaves between the leaves at the given addresses.  The neighbouring leaves
+        are updated to point to the given leaf; writing the given leaf is left to the caller.
+
+        Inputs: leaf        - The LeafBlock to link into the chain.
+                prevAddress - The address of the leaf which should precede it, or 0 if it is the first leaf.
+                nextAddress - The address of the leaf which should follow it, or 0 if it is the last leaf.
+        """
+
+        leaf.prevLeaf = prevAddress
+        leaf.nextLeaf = nextAddress
+
+        if prevAddress:
+            prevLeaf = self._getBlockAtAddress(prevAddress)
+            prevLeaf.nextLeaf = leaf.address
+            self._writeBlockToFile(prevLeaf)
+        if nextAddress:
+            nextLeaf = self._getBlockAtAddress(nextAddress)
+            nextLeaf.prevLeaf = leaf.address
+            self._writeBlockToFile(nextLeaf)
+
+    def _unlinkLeaf(self, leaf):
+        """ Removes a LeafBlock from the chain of leaves, joining its neighbours to each other. """
+
+        if leaf.prevLeaf:
+            prevLeaf = self._getBlockAtAddress(leaf.prevLeaf)
+            prevLeaf.nextLeaf = leaf.nextLeaf
+            self._writeBlockToFile(prevLeaf)
+        if leaf.nextLeaf:
+            nextLeaf = self._getBlockAtAddress(leaf.nextLeaf)
+            nextLeaf.prevLeaf = leaf.prevLeaf
+            self._writeBlockToFile(nextLeaf)
+
+    def _updateParentsKeys(self, block):
+        """
+        Each block is known to its parent by its first entry.  When the first entry of a block changes (by adding an
+        entry to its left end, or deleting its first entry) the key & position its parent holds for it must be updated
+        to match; and if the block is the first child of its parent, so must those the parent's own parent holds for it.
+
+        Inputs: block - The (non-empty) block whose first entry may have changed.
+        """
+
+        while block.address != 0:
+            parent = self._getBlockAtAddress(block.parent)
+            idx = parent.addresses.index(block.address)
+            firstEntry = self._firstEntry(block)
+            if (parent.keys[idx], parent.positions[idx]) == firstEntry:
+                return
+
+            parent.keys[idx], parent.positions[idx] = firstEntry
             self._writeBlockToFile(parent)
-            self._updateParentsKeys(parent, oldKey, newKey)
+            if idx:
+                return
+            block = parent
 
     def _splitBlock(self, block):
         """ Splits a block into two different blocks, each having half of the keys of the original. """
@@ -187,7 +363,8 @@ class IndexIO:
             block.address = self._getAddressForNewBlock()
             block.parent = 0
             newRoot = InteriorBlock(0, self.colType)
-            newRoot.add(block.keys[0], block.address)
+            key, pos = self._firstEntry(block)
+            newRoot.add(key, block.address, pos)
             self._writeBlockToFile(newRoot)
             self._writeBlockToFile(block)
             # If our root was an interior block, update its children to point to its new address
@@ -212,10 +389,26 @@ class IndexIO:
 
         # If we've split an interior block we need to update the parent of each of the blocks we just copied over
         if not block.isLeaf:
+            block.positions, newBlock.positions = block.positions[:middleIndex], block.positions[middleIndex:]
             self._updateChildrensParent(newBlock)
 
-        # Add the new block to our parent
-        parentBlock.add(newBlock.keys[0], newBlock.address)
+        # Otherwise link the new leaf into the chain of leaves, directly after the block we split
+        else:
+            newBlock.prevLeaf = block.address
+            newBlock.nextLeaf = block.nextLeaf
+            if block.nextLeaf:
+                nextLeaf = self._getBlockAtAddress(block.nextLeaf)
+                nextLeaf.prevLeaf = newBlock.address
+                self._writeBlockToFile(nextLeaf)
+            block.nextLeaf = newBlock.address
+
+        # Add the new block to our parent, directly after the block we split; as other children of our parent may
+        # share its smallest key, it cannot be placed by its key alone
+        idx = parentBlock.addresses.index(block.address) + 1
+        key, pos = self._firstEntry(newBlock)
+        parentBlock.keys.insert(idx, key)
+        parentBlock.positions.insert(idx, pos)
+        parentBlock.addresses.insert(idx, newBlock.address)
 
         # Serialize the parent, old, and new block to the index file
         self._writeBlockToFile(block)
@@ -223,47 +416,71 @@ class IndexIO:
         self._writeBlockToFile(parentBlock)
 
 
-    def _iterate(self, minValue=None, maxValue=None, minEqual=False, maxEqual=False, blockAddress=0):
+    def _iterate(self, minValue=None, maxValue=None, minEqual=False, maxEqual=False, reverse=False):
         """
-        Recursive function 
-        Iterates over the values in this Index, optionally starting at a min value and ending at a max value.
+        Iterates over the entries in this Index in key order, optionally starting at a min value and ending at a max
+        value.  Descends the tree once to the leaf where the range begins, then walks along the chain of leaves until it
+        passes the other end of the range.
+
+        The Index should not be modified while iterating over it.
 
         Inputs: minValue - An optional value which serves as a minimum value for any values returned.
                 maxValue - An optional value which serves as a maximum value for any values returned.
                 minEqual - If minValue != None, specifies that we want to return a value that matches minValue exactly.
                 maxEqual - If maxValue != None, specifies that we want to return a value that matches maxValue exactly.
-                blockAddress - The address of the block to begin searching in.
+                reverse  - If True, iterates from the maximum value to the minimum value.
 
-        Returns: An iterator over the list of file positions pointed to by this index.
+        Returns: An iterator over (key, position) tuples of the entries in this index within the range.
         """
 
-        block = self._getBlockAtAddress(blockAddress)
-
-        # If this block is empty, do nothing
-        if not block.keys:
-            return
-        # Ensure that all of our keys are not less than the minValue nor greater than the maxValue
-        if maxValue is not None and (block.keys[0] >= maxVal if maxEqual else block.keys[0] > maxVal):
-            return
-        if minValue is not None and (block.keys[-1] < minValue if minEqual else block.keys[-1] <= minValue):
-            return 
+        # Descend to the leaf the range begins in.  As each interior key is the smallest key of its child, a child
+        # whose key equals the start of the range may be preceded by children also containing that key; so when
+        # iterating forwards descend into the child preceding the first whose key is not less than minValue.
+        block = self._getBlockAtAddress(0)
+        while isinstance(block, InteriorBlock):
+            if reverse:
+                idx = (len(block.keys) if maxValue is None else bisect.bisect_right(block.keys, maxValue)) - 1
+            else:
+                idx = 0 if minValue is None else bisect.bisect_left(block.keys, minValue) - 1
+            block = self._getBlockAtAddress(block.addresses[max(0, idx)])
 
-        minCondition = lambda x: (x >= minValue if minEqual else x > minValue)
-        maxCondition = lambda x: (x <= maxValue if maxEqual else x < maxValue)
-        condition = lambda x: minCondition(x) and maxCondition(x)
+        if reverse:
+            if maxValue is None:
+                idx = len(block.keys) - 1
+            else:
+                idx = (bisect.bisect_right if maxEqual else bisect.bisect_left)(block.keys, maxValue) - 1
 
-        # Find all keys that apply and iterate over them seperately
-        toIterate = [address for key, address in zip(block.keys, block.addresses) if condition(key)]
+            while True:
+                while idx >= 0:
+                    key = block.keys[idx]
+                    if minValue is not None and (key < minValue if minEqual else key <= minValue):
+                        return
+                    yield key, block.addresses[idx]
+                    idx -= 1
 
-        for address in toIterate:
-            # If this is an interior block, iterate over the block at this address
-            if isinstance(block, InteriorBlock):
-                for val in self._iterate(minValue, maxValue, minEqual, maxEqual, address):
-                    yield val
+                if not block.prevLeaf:
+                    return
+                block = self._getBlockAtAddress(block.prevLeaf)
+                idx = len(block.keys) - 1
 
-            # Otherwise this is a leaf block, just yield the address
+        else:
+            if minValue is None:
+                idx = 0
             else:
-                yield address
+                idx = (bisect.bisect_left if minEqual else bisect.bisect_right)(block.keys, minValue)
+
+            while True:
+                while idx < len(block.keys):
+                    key = block.keys[idx]
+                    if maxValue is not None and (key > maxValue if maxEqual else key >= maxValue):
+                        return
+                    yield key, block.addresses[idx]
+                    idx += 1
+
+                if not block.nextLeaf:
+                    return
+                block = self._getBlockAtAddress(block.nextLeaf)
+                idx = 0
 
 
     # Public methods
@@ -284,28 +501,178 @@ class IndexIO:
         return position
 
 
+    def lookupAll(self, key):
+        """
+        Looks up the posting list of a key; the positions of every row in the database table file having the key.
+
+        Inputs: key - The key to look up in the index.
+
+        Returns: A list of the positions of the rows having the key, in order of position.  Empty if there are none.
+        """
+
+        return [pos for entryKey, pos in self.lookupMany([key])]
+
+
+    def lookupMany(self, keys):
+        """
+        Looks up the entries of several keys in a single ordered pass down the tree.  Keys are visited in sorted order;
+        the blocks along the path to the previous key's leaf are retained, and each key only ascends as far as the
+        lowest of them whose range contains it before descending again.  Neighbouring keys therefore share the interior
+        blocks above them, and keys within the same leaf are found without leaving it.
+
+        Inputs: keys - An iterable of the keys to look up.
+
+        Returns: A list of (key, position) tuples of the entries having any of the given keys, in key order.
+        """
+
+        entries = []
+
+        # A list of (block, upperKey) tuples of the blocks from the root to the current leaf.  upperKey is the largest
+        # key which may descend into the block (or None if unbounded); as each interior key is the smallest key of its
+        # child, but a child may be preceded by children also containing that key, a key equal to that of a child
+        # descends into the child preceding it.
+        path = [(self._getBlockAtAddress(0), None)]
+
+        for key in sorted(set(keys)):
+            while len(path) > 1 and path[-1][1] is not None and key > path[-1][1]:
+                path.pop()
+
+            block, upperKey = path[-1]
+            while isinstance(block, InteriorBlock):
+                idx = max(0, bisect.bisect_left(block.keys, key) - 1)
+                if idx + 1 < len(block.keys):
+                    upperKey = block.keys[idx + 1]
+                block = self._getBlockAtAddress(block.addresses[idx])
+                path.append((block, upperKey))
+
+            # The posting list of the key may continue into the leaves following this one; unless it is unique
+            while True:
+                positions = block.lookupAll(key)
+                entries.extend((key, pos) for pos in positions)
+                if (positions and self.indexConfig.unique) or \
+                   bisect.bisect_right(block.keys, key) < len(block.keys) or not block.nextLeaf:
+                    break
+                block = self._getBlockAtAddress(block.nextLeaf)
+
+        return entries
+
+
+    def iterateCondition(self, condition, reverse=False):
+        """
+        Iterates over the entries in this index which satisfy the given filter, in key order.
+
+        Inputs: condition - An instance of NanoTools.NanoCondition.Filter on the column this index is for.
+                reverse   - If True, entries are iterated over in descending order of key.
+
+        Returns: An iterator over (key, position) tuples of the entries satisfying the given filter.
+        """
+
+        if condition.inItems is None:
+            for entry in self._iterate(condition.greaterThan, condition.lessThan, condition.greaterThanEqual,
+                                       condition.lessThanEqual, reverse):
+                yield entry
+            return
+
+        # Items must also satisfy any range on the filter
+        entries = self.lookupMany(item for item in condition.inItems if condition.withinBounds(item))
+        for entry in (reversed(entries) if reverse else entries):
+            yield entry
+
+
     def lookupCondition(self, condition):
         """
-        Returns a list of positions in the database table file which satisfy the given condition.
+        Returns a list of positions in the database table file which satisfy the given filter.
 
-        Inputs: condition - An instance of NanoTools.NanoCondition containing the conditions to look up.
+        Inputs: condition - An instance of NanoTools.NanoCondition.Filter on the column this index is for.
 
-        Returns: A list of positions of tuples in the database table file satisfying the given condition.
+        Returns: A list of positions of tuples in the database table file satisfying the given filter, in key order.
         """
 
-        positions = []
+        return [pos for key, pos in self.iterateCondition(condition)]
+
+
+    def statistics(self):
+        """
+        Returns statistics describing the distribution of keys in this index.  Statistics are gathered by walking the
+        leaves of the index once, and are reused until more than STATISTICS_STALE_FRACTION of the entries they describe
+        have been added or deleted; in the meantime their number of entries is kept up to date as entries are added and
+        deleted.  They are written alongside the index when it is closed, so are not regathered when it is reopened.
+
+        Returns: A dictionary containing:
+                   entries  - The number of entries in the index.
+                   distinct - The number of distinct keys in the index.
+                   bounds   - A sorted list of keys dividing the entries into roughly equally sized buckets; beginning
+                              with the smallest key and ending with the largest key in the index.
+        """
+
+        if self.stats is not None and self.numChanges <= self.stats['entries'] * STATISTICS_STALE_FRACTION:
+            return self.stats
+
+        # Sample every step'th key; doubling the step whenever we've sampled too many keys, so that we need not know
+        # the number of entries in the index in advance
+        entries = distinct = 0
+        step = 1
+        bounds = []
+        lastKey = None
+        for key, pos in self._iterate():
+            if not entries % step:
+                bounds.append(key)
+                if len(bounds) > 2 * STATISTICS_BUCKETS:
+                    bounds = bounds[::2]
+                    step *= 2
+            if not entries or key != lastKey:
+                distinct += 1
+            lastKey = key
+            entries += 1
+
+        # Ensure the largest key is always our final bound
+        if entries and bounds[-1] != lastKey:
+            bounds.append(lastKey)
+
+        self.stats = {'entries': entries, 'distinct': distinct, 'bounds': bounds}
+        self.numChanges = 0
+        return self.stats
+
+
+    def estimateEntries(self, condition):
+        """
+        Estimates the number of entries in this index which satisfy the given filter, from the statistics of this index.
+
+        Inputs: condition - An instance of NanoTools.NanoCondition.Filter on the column this index is for.
+
+        Returns: The estimated number of entries, as a float.
+        """
+
+        # Each key of a unique index has a single entry; which lets point lookups be estimated without statistics
+        if self.indexConfig.unique and condition.inItems is not None:
+            return float(len([item for item in set(condition.inItems) if condition.withinBounds(item)]))
+
+        stats = self.statistics()
+        if not stats['entries']:
+            return 0.0
+
+        bounds = stats['bounds']
+        perKey = stats['entries'] / float(stats['distinct'])
 
         if condition.inItems is not None:
-            for item in condition.inItems:
-                try:
-                    positions.append(self.lookup(item))
+            items = [item for item in set(condition.inItems)
+                     if condition.withinBounds(item) and bounds[0] <= item <= bounds[-1]]
+            return len(items) * perKey
 
-                except KeyNotFound:
-                    pass
+        # Find the bounds which fall within the range of the filter; each accounts for an equal share of the entries
+        lo, hi = 0, len(bounds)
+        if condition.greaterThan is not None:
+            bisectLo = bisect.bisect_left if condition.greaterThanEqual else bisect.bisect_right
+            lo = bisectLo(bounds, condition.greaterThan)
+        if condition.lessThan is not None:
+            bisectHi = bisect.bisect_right if condition.lessThanEqual else bisect.bisect_left
+            hi = bisectHi(bounds, condition.lessThan)
 
-        positions.extend(self._iterate(condition.minValue, condition.maxValue, condition.minEqual, conition.maxEqual, 0))
+        # The range lies entirely beyond the smallest or largest key in the index
+        if lo == len(bounds) or hi == 0:
+            return 0.0
 
-        return positions
+        return max(stats['entries'] * max(0, hi - lo) / float(len(bounds)), perKey)
 
 
     def add(self, key, pos):
@@ -314,75 +681,173 @@ class IndexIO:
 
         Inputs: key - The value of the column in the tuple to be looked up upon.
                 pos - The position of the tuple in the database table file.
+
+        Raises a DuplicateKey exception if the index is unique and already contains the key.
         """
 
-        block = self._lookupBlock(key)
+        # Descend once to the leaf the entry belongs in; if the key is already in the index it can only be found there
+        block = self._entryLeaf(key, pos)
+        if self.indexConfig.unique:
+            self._assertUnique(block, key)
 
-        # If our search yielded an interior block, then this key is less than all other keys in this block.
-        # In this case, we want to check our leftmost block to see if we can add this key to it.  This requires it
-        # to be a leaf block and to not be full
-        if isinstance(block, InteriorBlock):
-            leftBlock = self._getBlockAtAddress(block.addresses[0])
-            if isinstance(leftBlock, LeafBlock) and not leftBlock.full():
-                prevKey = leftBlock.keys[0]
-                leftBlock.add(key, pos)
-                self._writeBlockToFile(leftBlock)
-                self._updateParentsKeys(leftBlock, prevKey, key)
-                return
+        self._entriesChanged(1)
 
-        # Otherwise, we are either adding to a leaf block or adding a new block to an interior block
-        # however if this block is full we cannot do either.  Split it if it is
+        # If the leaf is full, split it; the entry may then belong in either half, so find the leaf it belongs in again
         if block.full():
             self._splitBlock(block)
-            # Now, we no longer know whether or not this block is the block which this key should be inserted into;
-            # as it is just as likely that we should be inserting into the new block which was just created when we
-            # split the existing block.  Because of this, find the correct block to insert into again from scratch.
-            block = self._lookupBlock(key)
-
-        # At this point there are two things we can do:
-        #  If this is an interior block we need to add a new leaf block to it
-        #  If this is a leaf block we need to add the value to it
-        if isinstance(block, InteriorBlock):
-            # Record what the previous first key in our interior block was; if we add the new leaf block to the front of
-            # our interior block we will potentially need to update our interior blocks parents reference keys to it
-            prevKey = block.keys[0]
-            leaf = LeafBlock(self._getAddressForNewBlock(), self.colType)
-            leaf.parent = block.address
-            leaf.add(key, pos)
-            block.add(key, leaf.address)
-            self._writeBlockToFile(leaf)
-            self._writeBlockToFile(block)
-            if block.keys[0] != prevKey:
-                self._updateParentsKeys(block, prevKey, block.keys[0])
+            block = self._entryLeaf(key, pos)
 
-        # Otherwise we found a leaf, add this value to it
-        else:
-            block.add(key, pos)
-            self._writeBlockToFile(block)
+        block.add(key, pos)
+        self._writeBlockToFile(block)
+        self._updateParentsKeys(block)
 
 
-    def delete(self, key):
+    def addMany(self, pairs):
         """
-        Deletes the first entry in the index matching the given value.
+        Adds many keys to the index.
 
-        Inputs: key - The key to delete from the index.
+        Inputs: pairs - An iterable of (key, pos) tuples to add to the index.
 
-        Outputs: None if successful; raises a KeyNotFound exception if the key cannot be found.
+        Keys are added in sorted order, so that consecutive additions descend to the same or neighbouring blocks
+        (which will likely still be held by our cache manager) rather than to random locations in the index.
+        If the index is currently empty it is instead built from scratch using bulkLoad.
+
+        Raises a DuplicateKey exception if the index is unique and would contain a key more than once; in which case
+        none of the keys are added.
         """
 
-        block = self._lookupBlock(key, findLeaf=True)
+        pairs = sorted(pairs)
+        rootBlock = self._getBlockAtAddress(0)
+        if isinstance(rootBlock, LeafBlock) and not rootBlock.keys:
+            self.bulkLoad(pairs)
+            return
+
+        for idx, (key, pos) in enumerate(pairs):
+            try:
+                self.add(key, pos)
+            except DuplicateKey:
+                for key, pos in pairs[:idx]:
+                    self.delete(key, pos)
+                raise
+
+
+    def bulkLoad(self, sortedPairs, fillPercent=None):
+        """
+        Replaces the contents of this index with the given keys, building the tree from the bottom up.
 
-        block.delete(key)
+        Rather than adding keys one at a time (splitting blocks and updating parents as we go), LeafBlocks are packed
+        with consecutive keys, then each level of InteriorBlocks is packed with the first keys of the level below it.
+        As the number of blocks on each level can be calculated in advance, every block's address (and so its parent's
+        address) is known before it is built, and each level is written to the index file sequentially.
+
+        Inputs: sortedPairs - An iterable of (key, pos) tuples, sorted by key.
+                fillPercent - The percentage of each block's keys to fill; leaving room for later additions to be made
+                              without splitting blocks.  Defaults to NanoConfig.index_fill_percent.
+
+        Raises a DuplicateKey exception, leaving our contents unchanged, if the index is unique and a key is repeated.
+        """
+
+        pairs = list(sortedPairs)
+        fillPercent = NanoConfig.index_fill_percent if fillPercent is None else fillPercent
+
+        if self.indexConfig.unique:
+            for (key, pos), (nextKey, nextPos) in zip(pairs, pairs[1:]):
+                if key == nextKey:
+                    raise DuplicateKey(str(key))
+
+        # Discard our current contents
+        self.stats = None
+        self.cacheMgr.truncate()
+        self.delMgr.truncate()
+        self.indexFD.seek(0)
+        self.indexFD.truncate()
+
+        if not pairs:
+            self.indexFD.write(LeafBlock(0, self.colType).toString())
+            self.indexFD.flush()
+            return
+
+        # Determine how many keys to put in each block, and from that the number of blocks on each level of the tree
+        keysPerLeaf = max(1, LeafBlock(0, self.colType).maxKeys * fillPercent / 100)
+        keysPerInterior = max(2, InteriorBlock(0, self.colType).maxKeys * fillPercent / 100)
+        levelSizes = [(len(pairs) + keysPerLeaf - 1) / keysPerLeaf]
+        while levelSizes[-1] > 1:
+            levelSizes.append((levelSizes[-1] + keysPerInterior - 1) / keysPerInterior)
+
+        # The root block lives at address 0, all other levels are laid out after it; beginning with the leaves
+        levelAddresses = []
+        address = NanoConfig.index_block_size
+        for levelSize in levelSizes[:-1]:
+            levelAddresses.append(address)
+            address += levelSize * NanoConfig.index_block_size
+        levelAddresses.append(0)
+
+        # Entries for the current level, as (key, position, address) tuples; initially the keys & table positions
+        # which the leaves will point to
+        entries = [(key, pos, pos) for key, pos in pairs]
+        for level, levelSize in enumerate(levelSizes):
+            blockClass = InteriorBlock if level else LeafBlock
+            perBlock = keysPerInterior if level else keysPerLeaf
+
+            self.indexFD.seek(levelAddresses[level])
+            nextEntries = []
+            for blockNum in range(levelSize):
+                block = blockClass(levelAddresses[level] + blockNum * NanoConfig.index_block_size, self.colType)
+                if level < len(levelSizes) - 1:
+                    block.parent = levelAddresses[level + 1] + (blockNum / keysPerInterior) * NanoConfig.index_block_size
+                blockEntries = entries[blockNum * perBlock: (blockNum + 1) * perBlock]
+                block.keys = [key for key, pos, address in blockEntries]
+                block.addresses = [address for key, pos, address in blockEntries]
+
+                # Leaves are laid out in key order, so each is linked to the blocks on either side of it
+                if not level:
+                    block.prevLeaf = block.address - NanoConfig.index_block_size if blockNum else 0
+                    block.nextLeaf = block.address + NanoConfig.index_block_size if blockNum < levelSize - 1 else 0
+                else:
+                    block.positions = [pos for key, pos, address in blockEntries]
+
+                self.indexFD.write(block.toString())
+
+                # Each block is pointed to by its parent using its first entry
+                nextEntries.append(self._firstEntry(block) + (block.address,))
+
+            entries = nextEntries
+
+        self.indexFD.flush()
+
+
+    def delete(self, key, pos=None):
+        """
+        Deletes an entry from the index.
+
+        Inputs: key - The key of the entry to delete from the index.
+                pos - The position of the entry to delete.  If None, the entry with the key and the smallest position
+                      is deleted.
+
+        Outputs: None if successful; raises a KeyNotFound exception if the entry cannot be found.
+        """
+
+        block, idx = self._findEntry(key, pos)
+
+        block.keys.pop(idx)
+        block.addresses.pop(idx)
+        self._entriesChanged(-1)
         self._writeBlockToFile(block)
 
         # Iterate through this blocks lineage; deleting empty (non-root) blocks
         while len(block.keys) == 0 and block.address != 0:
+            if block.isLeaf:
+                self._unlinkLeaf(block)
             self._markBlockDeleted(block)
             parent = self._getBlockAtAddress(block.parent)
             parent.deleteAddress(block.address)
             self._writeBlockToFile(parent)
             block = parent
 
+        # If the first key of the remaining block was removed, the keys its ancestors know it by must be updated
+        if block.keys:
+            self._updateParentsKeys(block)
+
         # Edge case; if we iterated all the way up to the root block, check if it's empty.
         # if it is, convert it into an empty leaf block
         if block.address == 0 and len(block.keys) == 0 and isinstance(block, InteriorBlock):
@@ -393,3 +858,5 @@ class IndexIO:
         self.cacheMgr.flushAll()
         self.delMgr.close()
         self.indexFD.close()
+        writeStatistics(self.dbName, NanoIO.File.indexFileName(self.tableName, self.indexConfig.indexName()),
+                        self.stats, self.numChanges)
@@ -3,14 +3,24 @@ File containing a class which allows manipulation & access to database tables.
 """
 
 # Standard imports
-import os
+import os, mmap, struct
+
+# Optional imports
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Project imports
 import NanoTools
+import NanoConfig
 import NanoTypes
 import NanoIO.File
 import NanoIO.Index
+import NanoIO.HashIndex
 import NanoConfig.Table
+import NanoConfig.Index
+import NanoBlocks.Index
 from NanoBlocks._MemoryMappedBlock import MemoryMappedBlock
 
 class TableIO:
@@ -21,7 +31,9 @@ class TableIO:
     config = None            # A NanoConfig.Table.Config instance for this table
     configFD = None          # A file descriptor open to the file for this table's configuration
     tableFD = None           # A file descriptor open to the file for this table
-    indices = None           # A dictionary mapping column names on this table to NanoIO.Index.IndexIO instances
+    tableMap = None          # An mmap over self.tableFD; None while the table file is empty
+    tableSize = None         # Number of bytes of rows in the table file; self.tableMap may extend past this
+    indices = None           # A dictionary mapping index names on this table to IndexIO or HashIndexIO instances
     delMgr = None            # A NanoTools.DeletedBlockManager instance to manage deleted rows of this table
     memoryMappedRow = None   # A class subclassing MemoryMappedBlock that can be used to convert values to/from strings
     memoryMappedClass = None # A class of MemoryMappedBlock.MemoryMappedClass creating instances of our memoryMappedRow
@@ -36,6 +48,7 @@ class TableIO:
         self._getTableConfig()
         self._initializeIndices()
         self.constructMemoryMappedRow()
+        self._mapTable()
 
     def __del__(self):
         try:
@@ -59,12 +72,68 @@ class TableIO:
         self.configFD.write(self.config.toString())
 
 
+    def _mapTable(self):
+        """ Memory maps our table file, recording the number of bytes of rows it currently contains. """
+
+        self.tableFD.seek(0, os.SEEK_END)
+        self.tableSize = self.tableFD.tell()
+        self.tableMap = mmap.mmap(self.tableFD.fileno(), self.tableSize) if self.tableSize else None
+
+
+    def _unmapTable(self):
+        """ Closes our mapping of the table file, trimming any space it was grown by that holds no rows. """
+
+        if self.tableMap is not None:
+            self.tableMap.close()
+            self.tableMap = None
+
+        if self.tableSize is not None and not self.tableFD.closed:
+            self.tableFD.truncate(self.tableSize)
+
+
+    def _growTable(self, size):
+        """
+        Ensures that our table file and its mapping are at least size bytes long.
+
+        Rather than growing the file a row at a time, it is grown in steps of NanoConfig.table_growth_size so that
+        appending rows only occasionally requires the file to be remapped.
+        """
+
+        mapSize = len(self.tableMap) if self.tableMap is not None else 0
+        if size <= mapSize:
+            return
+
+        growthSize = max(NanoConfig.table_growth_size, self.config.rowSize)
+        newSize = ((size + growthSize - 1) / growthSize) * growthSize
+
+        if self.tableMap is not None:
+            self.tableMap.close()
+        self.tableFD.truncate(newSize)
+        self.tableMap = mmap.mmap(self.tableFD.fileno(), newSize)
+
+
+    def _writeAt(self, idx, s):
+        """ Writes the string s to our table at the given index, growing the table if necessary. """
+
+        end = idx + len(s)
+        self._growTable(end)
+        self.tableMap[idx: end] = s
+        self.tableSize = max(self.tableSize, end)
+
+
     def _initializeIndices(self):
-        """ Initializes self.indices to be a dictionary mapping index column names to IndexIO instances. """
+        """ Initializes self.indices to be a dictionary mapping index names to their index instances. """
 
         self.indices = dict()
         for indexConfig in self.config.indices:
-            self.indices[indexConfig.column.name] = NanoIO.Index.IndexIO(self.dbName, self.tableName, indexConfig)
+            self.indices[indexConfig.indexName()] = self._openIndex(indexConfig)
+
+
+    def _openIndex(self, indexConfig):
+        """ Returns an instance of the class managing the kind of index described by the given index config. """
+
+        indexClass = NanoIO.HashIndex.HashIndexIO if indexConfig.hashed else NanoIO.Index.IndexIO
+        return indexClass(self.dbName, self.tableName, indexConfig)
 
 
     def constructMemoryMappedRow(self):
@@ -85,10 +154,85 @@ class TableIO:
             dataTypes = {col.name: NanoTypes.getType(col.typeString) for col in self.config.columns}
             dataTypes['_valid'] = NanoTypes.Uint(1)
 
+            # If every field has a fixed width struct representation, rows are packed and unpacked with a single
+            # struct.Struct instead of field by field.  See _constructRowStruct.
+            rowStruct = None # A struct.Struct for the entire row, or None if the row can't be represented by one
+            nullVals = None  # A list of the null value of each field's type, in the order of self.fields
+            charSizes = None # A list of (index into self.fields, width) tuples for each Char field
+
+            def toString(self):
+                if self.rowStruct is None:
+                    return MemoryMappedBlock.toString(self)
+
+                values = [getattr(self, fieldName) for fieldName in self.fields]
+                for idx, val in enumerate(values):
+                    if val is None:
+                        values[idx] = self.nullVals[idx]
+
+                # struct pads strings on the right, whereas Char pads on the left.  Strings which are too long are left
+                # as they are, to be rejected by the per-field serialization below
+                for idx, size in self.charSizes:
+                    if isinstance(values[idx], str) and len(values[idx]) <= size:
+                        values[idx] = values[idx].rjust(size, '\x00')
+                    else:
+                        return MemoryMappedBlock.toString(self)
+
+                # Anything struct will not accept as is (strings given for numeric columns, out of range values, ...)
+                # is left to the per-field serialization to convert or reject
+                try:
+                    return self.rowStruct.pack(*values)
+                except struct.error:
+                    return MemoryMappedBlock.toString(self)
+
+            def fromString(self, block):
+                if self.rowStruct is None:
+                    return MemoryMappedBlock.fromString(self, block)
+
+                if len(block) != self.blockSize:
+                    raise Exception("Cannot fromString block of length: %s; expecting len(%s)" % (len(block), self.blockSize))
+
+                values = list(self.rowStruct.unpack(block))
+                for idx, size in self.charSizes:
+                    values[idx] = values[idx].lstrip('\x00') or None
+                for idx, val in enumerate(values):
+                    if val == self.nullVals[idx]:
+                        values[idx] = None
+
+                self.__dict__.update(zip(self.fields, values))
+                return self
+
+        self._constructRowStruct(MemoryMappedRow)
         self.memoryMappedRow = MemoryMappedRow
         self.memoryMappedClass = MemoryMappedBlock.MemoryMappedClass(MemoryMappedRow)
 
 
+    def _constructRowStruct(self, rowClass):
+        """
+        Sets up the given MemoryMappedRow class to pack & unpack entire rows with a single struct.Struct, if all of its
+        fields are of fixed width types which struct can represent (Int, Uint, Float and Char).
+        """
+
+        structFormat = ['=']
+        charSizes = []
+        for idx, fieldName in enumerate(rowClass.fields):
+            dataType = rowClass.dataTypes[fieldName]
+            if isinstance(dataType, NanoTypes.Char):
+                structFormat.append('%ds' % dataType.size)
+                charSizes.append((idx, dataType.size))
+            elif getattr(dataType, 'structMapping', None):
+                structFormat.append(dataType.structMapping[dataType.quantifier])
+            else:
+                return
+
+        rowStruct = struct.Struct("".join(structFormat))
+        if rowStruct.size != rowClass.blockSize:
+            return
+
+        rowClass.rowStruct = rowStruct
+        rowClass.charSizes = charSizes
+        rowClass.nullVals = [rowClass.dataTypes[fieldName].nullVal for fieldName in rowClass.fields]
+
+
     def _writeRowAt(self, pos, row):
         """
         Writes a row to a given position in the data file.
@@ -96,18 +240,27 @@ class TableIO:
         Inputs: pos - The position to write the row to.  If None, the row will be written to either a position returned
                       from self.delMgr, or if that returns None as well, the end of the file.
                 row - An instance of self.memoryMappedRow to write to the file.
+
+        Returns: The position the row was written to.
         """
 
         if pos is None:
             idx = self.delMgr.popRef()
             if idx is None:
-                self.tableFD.seek(0, os.SEEK_END)
-            else:
-                self.tableFD.seek(idx)
+                idx = self.tableSize
         else:
-            self._seekPos(pos)
+            idx = self._posToIdx(pos)
+
+        self._writeAt(idx, row.toString())
+
+        return idx / self.config.rowSize
+
+    def _invalidateRow(self, pos):
+        """ Clears the valid flag of the row at the given position in place, and marks the position for reuse. """
+
+        self.tableMap[self._posToIdx(pos)] = self.memoryMappedRow.dataTypes['_valid'].toString(False)
+        self.delMgr.addRef(self._posToIdx(pos))
 
-        self.tableFD.write(row.toString())
 
     def _validateFields(self, *args, **kwargs):
         """
@@ -119,8 +272,8 @@ class TableIO:
             raise Exception("Too many values given for table %s. Values: %s" % (self.config.name, args))
 
         for kwarg in kwargs:
-            if kwarg not in self.memorymappedRow.fields[1:]:
-                raise Exception("Unknown value given for table %; value: %s" % (self.config.name, kwarg))
+            if kwarg not in self.memoryMappedRow.fields[1:]:
+                raise Exception("Unknown value given for table %s; value: %s" % (self.config.name, kwarg))
 
 
     def _valsToRow(self, *args, **kwargs):
@@ -138,66 +291,401 @@ class TableIO:
         return row
 
 
+    def _indexKey(self, colName, val):
+        """ Converts a value given for an indexed column into the key that its index would store for it. """
+
+        dataType = self.memoryMappedRow.dataTypes[colName]
+        return dataType.fromString(dataType.toString(val))
+
+
+    def _rowKey(self, indexConfig, row):
+        """
+        Returns the key the index described by the given index config stores for a row; a tuple of the row's values of
+        the index's columns, if it is over several of them.
+        """
+
+        keys = tuple(self._indexKey(colName, getattr(row, colName)) for colName in indexConfig.colNames())
+        return keys if len(keys) > 1 else keys[0]
+
+
+    def _indexPairs(self, indexConfig):
+        """
+        Returns a list of (key, pos) tuples for each row in the table, sorted by the key the index described by the
+        given index config stores for it.
+        """
+
+        pairs = [(tuple(values) if len(values) > 1 else values[0], pos)
+                 for pos, values in self.scan(columns=indexConfig.colNames())]
+        pairs.sort()
+        return pairs
+
+
     def _posToIdx(self, pos):
         """ Converts a position (0, 1, 2, 3, ...) to an index (which is a multiple of self.rowSize). """
 
         return self.config.rowSize * pos
 
 
-    def _seekPos(self, pos):
-        """ Seeks self.tableFD to the given position index. """
+    def _rowStringAt(self, pos):
+        """ Returns the serialized row at the given position (0, 1, 2, 3, ...), read directly from our mapping. """
+
+        idx = self._posToIdx(pos)
+        if pos < 0 or idx + self.config.rowSize > self.tableSize:
+            raise Exception("No data at position %d" % pos)
 
-        self.tableFD.seek(self._posToIdx(pos))
+        return self.tableMap[idx: idx + self.config.rowSize]
 
 
     # Public methods
     def close(self):
         """ Closes all active file descriptors associated with this object. """
 
+        self._unmapTable()
+        for index in self.indices.values():
+            index.close()
         self.delMgr.close()
         self.configFD.close()
         self.tableFD.close()
 
 
+    def addIndex(self, colNames, unique=False, hashed=False):
+        """
+        Creates a new index on the given column(s) of this table, populating it from the rows already in the table.
+
+        Inputs: colNames - The name of the column to index; or a sequence of column names, for an index whose keys are
+                           tuples of the values of each column, in order.
+                unique   - Whether or not the index should reject rows repeating a key of the index.
+                hashed   - Whether the index should be a hash index; which can only look up keys, but can usually do so
+                           by reading a single block.
+        """
+
+        colNames = [colNames] if isinstance(colNames, basestring) else list(colNames)
+        columns = dict((col.name, col) for col in self.config.columns)
+        for colName in colNames:
+            if colName not in columns:
+                raise Exception("Cannot create index on missing column: %s" % colName)
+        if len(set(colNames)) < len(colNames):
+            raise Exception("Duplicated column in index: %s" % ",".join(colNames))
+
+        indexConfig = NanoConfig.Index.Config()
+        indexConfig.column = columns[colNames[0]]
+        indexConfig.trailingColumns = [columns[colName] for colName in colNames[1:]]
+        indexConfig.unique = unique
+        indexConfig.hashed = hashed
+
+        indexName = indexConfig.indexName()
+        if indexName in self.indices:
+            raise Exception("Duplicated index name: %s" % indexName)
+
+        NanoIO.File.createIndex(self.dbName, self.tableName, indexName).close()
+
+        index = self._openIndex(indexConfig)
+        try:
+            index.bulkLoad(self._indexPairs(indexConfig))
+        except NanoBlocks.Index.DuplicateKey:
+            index.close()
+            NanoIO.File.deleteIndex(self.dbName, self.tableName, indexName)
+            raise
+
+        self.config.indices.append(indexConfig)
+        self._setTableConfig()
+        self.indices[indexName] = index
+
+
+    def reindex(self, indexName=None):
+        """
+        Rebuilds the index of the given name (see NanoConfig.Index.Config.indexName) from the rows in the table, or
+        every index on the table if no name is given.
+        """
+
+        if indexName is not None and indexName not in self.indices:
+            raise Exception("Table %s has no index on column: %s" % (self.config.name, indexName))
+
+        for name in ([indexName] if indexName is not None else self.indices.keys()):
+            self.indices[name].bulkLoad(self._indexPairs(self.indices[name].indexConfig))
+
+
     def truncate(self):
         """ Truncates our data file for this table. """
 
-        self.tableFD.seek(0)
-        self.tableFD.truncate()
+        self.tableSize = 0
+        self._unmapTable()
+        self.delMgr.truncate()
+
+
+    def numPositions(self):
+        """ Returns the number of positions in our table file; including those of deleted rows. """
+
+        return self.tableSize / self.config.rowSize
+
+
+    def numRows(self):
+        """ Returns the number of (non-deleted) rows in our table. """
+
+        return self.numPositions() - len(self.delMgr)
+
+
+    def scan(self, batchRows=None, columns=None):
+        """
+        Iterates over every row in this table, in order of position.
+
+        Rows are copied out of our mapping of the table file a batch at a time, and rows which have been deleted are
+        skipped using their valid flag without being decoded.  Rows appended to the table after the scan has begun are
+        not visited.
+
+        Inputs: batchRows - The number of rows to read at a time.  Defaults to as many rows as fit within
+                            NanoConfig.scan_buffer_size bytes.
+                columns   - An optional list of names of the columns whose values should be returned.
+                            Defaults to every column in the table.
+
+        Returns: An iterator over (pos, values) tuples, where values is a tuple of the values of the requested columns.
+        """
+
+        rowClass = self.memoryMappedRow
+        rowSize = self.config.rowSize
+
+        if batchRows is None:
+            batchRows = max(1, NanoConfig.scan_buffer_size / rowSize)
+
+        columns = rowClass.fields[1:] if columns is None else list(columns)
+        for colName in columns:
+            if colName not in rowClass.fields[1:]:
+                raise Exception("Unknown column given for table %s: %s" % (self.config.name, colName))
+        fieldIdxs = [rowClass.fields.index(colName) for colName in columns]
+
+        rowStruct = rowClass.rowStruct
+        if rowStruct is not None:
+            charIdxs = set(idx for idx, size in rowClass.charSizes)
+            nullVals = rowClass.nullVals
+
+        numRows = self.tableSize / rowSize
+        for batchStart in xrange(0, numRows, batchRows):
+            batch = self.tableMap[batchStart * rowSize: min(numRows, batchStart + batchRows) * rowSize]
+
+            for offset in xrange(0, len(batch), rowSize):
+                if batch[offset] == '\x00':
+                    continue
+
+                # Decode only the requested columns; mirroring MemoryMappedRow.fromString
+                if rowStruct is not None:
+                    fieldVals = rowStruct.unpack_from(batch, offset)
+                    values = []
+                    for idx in fieldIdxs:
+                        val = fieldVals[idx]
+                        if idx in charIdxs:
+                            val = val.lstrip('\x00') or None
+                        values.append(None if val == nullVals[idx] else val)
+                    values = tuple(values)
+
+                else:
+                    row = self.memoryMappedClass.fromString(batch[offset: offset + rowSize])
+                    values = tuple(getattr(row, colName) for colName in columns)
+
+                yield batchStart + offset / rowSize, values
+
+
+    def asNumpy(self, columns=None):
+        """
+        Returns the columns of this table as a numpy masked array, backed by a read only np.memmap of the table file
+        with a structured dtype matching our rows; allowing column arithmetic without decoding each row in Python.
+
+        Requires numpy, and that every column of the table is of a fixed width type which _constructRowStruct could
+        pack.  The values of deleted rows and null values are masked.  As Char values are stored padded on the left with
+        null bytes they appear that way in the array.
+
+        Inputs: columns - An optional list of names of the columns to include.  Defaults to every column in the table.
+
+        Returns: A numpy.ma.MaskedArray with a field for each requested column, and an element for each row position.
+        """
+
+        if numpy is None:
+            raise Exception("numpy is required to export table %s as an array" % self.config.name)
+
+        rowClass = self.memoryMappedRow
+        if rowClass.rowStruct is None:
+            raise Exception("Table %s has columns which cannot be exported as an array" % self.config.name)
+
+        columns = rowClass.fields[1:] if columns is None else list(columns)
+        for colName in columns:
+            if colName not in rowClass.fields[1:]:
+                raise Exception("Unknown column given for table %s: %s" % (self.config.name, colName))
+
+        # Determine the offset and numpy type of each field in our rows
+        offsets = dict()
+        formats = dict()
+        offset = 0
+        for fieldName in rowClass.fields:
+            dataType = rowClass.dataTypes[fieldName]
+            offsets[fieldName] = offset
+            if isinstance(dataType, NanoTypes.Char):
+                formats[fieldName] = 'S%d' % dataType.size
+            else:
+                formats[fieldName] = '=' + dataType.structMapping[dataType.quantifier]
+            offset += dataType.size
+
+        makeDtype = lambda fieldNames: numpy.dtype({
+            'names': fieldNames,
+            'formats': [formats[fieldName] for fieldName in fieldNames],
+            'offsets': [offsets[fieldName] for fieldName in fieldNames],
+            'itemsize': self.config.rowSize,
+        })
+        dtype = makeDtype(columns)
+        maskDtype = [(colName, bool) for colName in columns]
+
+        numRows = self.tableSize / self.config.rowSize
+        if not numRows:
+            return numpy.ma.array(numpy.zeros(0, dtype), mask=numpy.zeros(0, maskDtype))
+
+        path = NanoIO.File.tablePath(self.dbName, self.tableName)
+        data = numpy.memmap(path, dtype=dtype, mode='r', shape=(numRows,))
+        deleted = numpy.memmap(path, dtype=makeDtype(['_valid']), mode='r', shape=(numRows,))['_valid'] == 0
+
+        mask = numpy.zeros(numRows, maskDtype)
+        for colName in columns:
+            dataType = rowClass.dataTypes[colName]
+            # numpy strips the trailing null bytes of strings; so a null Char is an empty string
+            nullVal = '' if isinstance(dataType, NanoTypes.Char) else dataType.nullVal
+            mask[colName] = deleted | (data[colName] == nullVal)
+
+        return numpy.ma.array(data, mask=mask, copy=False)
+
+
+    def rebuildFreeList(self):
+        """
+        Rebuilds the list of positions of deleted rows available for reuse from the valid flags of the rows in our
+        table file.  Positions are reused in ascending order.
+        """
+
+        rowSize = self.config.rowSize
+        self.delMgr.truncate()
+        self.delMgr.addRefs([idx for idx in xrange(self.tableSize - rowSize, -1, -rowSize)
+                             if self.tableMap[idx] == '\x00'])
 
 
     def getRow(self, pos):
         """ Gets the row from this table at the given position (0, 1, 2, 3, ...). """
 
-        self._seekPos(pos)
-        row = self.memoryMappedClass.fromString(self.tableFD.read(self.config.rowSize)) # TODO test if file is empty, get pos 1
+        row = self.memoryMappedClass.fromString(self._rowStringAt(pos))
         if not row._valid:
             raise Exception("No data at position %d" % pos)
         return row
 
 
     def insertRow(self, *args, **kwargs):
-        """ Inserts a row into our table file using the given values to construct the row. """
+        """
+        Inserts a row into our table file using the given values to construct the row.
+
+        Raises a DuplicateKey exception if the row would repeat a key of a unique index; in which case the row is not
+        inserted.
+
+        Returns: The position the row was inserted at.
+        """
 
         row = self._valsToRow(*args, **kwargs)
-        self._writeRowAt(None, row)
+        pos = self._writeRowAt(None, row)
+
+        added = []
+        try:
+            for index in self.indices.values():
+                index.add(self._rowKey(index.indexConfig, row), pos)
+                added.append(index)
+        except NanoBlocks.Index.DuplicateKey:
+            for index in added:
+                index.delete(self._rowKey(index.indexConfig, row), pos)
+            self._invalidateRow(pos)
+            raise
+
+        return pos
+
+
+    def insertRows(self, rows):
+        """
+        Inserts many rows into our table file at once.
+
+        Inputs: rows - An iterable of rows to insert.  Each row may be either a sequence of values, given positionally,
+                       or a dictionary mapping column names to values.
+
+        Every row is serialized before anything is written, so an invalid row causes none of the rows to be inserted.
+        Positions of previously deleted rows are reused first, and all remaining rows are appended to the table with a
+        single write.  Index keys are collected as we go and added to each index in key order afterwards.  If any of
+        the rows would repeat a key of a unique index a DuplicateKey exception is raised, and none of them are inserted.
+
+        Returns: A list of the positions the rows were inserted at, in the order the rows were given.
+        """
+
+        rows = [self._valsToRow(**vals) if isinstance(vals, dict) else self._valsToRow(*vals) for vals in rows]
+        serialized = [row.toString() for row in rows]
+
+        # Fill the positions of any deleted rows first
+        positions = []
+        for idx in self.delMgr.popRefs(len(rows)):
+            self._writeAt(idx, serialized[len(positions)])
+            positions.append(idx / self.config.rowSize)
+
+        # Append the remainder to the end of the table in one contiguous write
+        if len(positions) < len(rows):
+            firstPos = self.tableSize / self.config.rowSize
+            numAppended = len(rows) - len(positions)
+            self._writeAt(self.tableSize, "".join(serialized[len(positions):]))
+            positions.extend(range(firstPos, firstPos + numAppended))
+
+        added = []
+        try:
+            for index in self.indices.values():
+                pairs = [(self._rowKey(index.indexConfig, row), pos) for row, pos in zip(rows, positions)]
+                index.addMany(pairs)
+                added.append((index, pairs))
+        except NanoBlocks.Index.DuplicateKey:
+            for index, pairs in added:
+                for key, pos in pairs:
+                    index.delete(key, pos)
+            for pos in positions:
+                self._invalidateRow(pos)
+            raise
+
+        return positions
 
 
     def updateRow(self, pos, **kwargs):
-        """ Updates the row in the file at the given position, updating the values from the given keyword arguments. """
+        """
+        Updates the row in the file at the given position, updating the values from the given keyword arguments.
+
+        Raises a DuplicateKey exception if the updated row would repeat a key of a unique index; in which case the row
+        is left unchanged.
+        """
 
         self._validateFields(**kwargs)
+        oldRow = self.getRow(pos)
         row = self.getRow(pos)
         for kwarg in kwargs:
             setattr(row, kwarg, kwargs[kwarg])
 
+        # Re-key any indices on columns which were updated, before the row itself is rewritten
+        rekeyed = []
+        try:
+            for index in self.indices.values():
+                if set(index.indexConfig.colNames()) & set(kwargs):
+                    oldKey, newKey = self._rowKey(index.indexConfig, oldRow), self._rowKey(index.indexConfig, row)
+                    index.delete(oldKey, pos)
+                    rekeyed.append((index, oldKey, None))
+                    index.add(newKey, pos)
+                    rekeyed[-1] = (index, oldKey, newKey)
+        except NanoBlocks.Index.DuplicateKey:
+            for index, oldKey, newKey in rekeyed:
+                if newKey is not None:
+                    index.delete(newKey, pos)
+                index.add(oldKey, pos)
+            raise
+
         self._writeRowAt(pos, row)
 
 
     def deleteRow(self, pos):
         """ Deletes the row in the file at the given position. """
 
+        # Ensure there is a row at this position, then clear its valid flag in place
         row = self.getRow(pos)
-        row._valid = False
-        self._writeRowAt(pos, row)
-        self.delMgr.addRef(self._posToIdx(pos))
+        self._invalidateRow(pos)
+
+        for index in self.indices.values():
+            index.delete(self._rowKey(index.indexConfig, row), pos)
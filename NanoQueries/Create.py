@@ -11,15 +11,24 @@ class Create(BaseQuery):
     name = None
     cols = None
     indices = None
+    uniqueIndices = None
+    hashIndices = None
+    uniqueHashIndices = None
+    compositeIndices = None
 
-    grammar = """
+    grammar = r"""
                   [<target: "database"> <name: _>]
                   [
                    <target: "table">
                    <name: _>
                    {
-                    (cols: <name: _!index_> <type: _>)
-                    ["index" <indices: _>]
+                    (cols: <name: _!index$|unique$|hash_> <type: _>)
+                    (compositeIndices: [<unique: "unique">] [<hashed: "hash">] "index"
+                                       "\(" {<columns: %[^(),]+%> [","]} "\)")
+                    ["index" <indices: _!\(_>]
+                    ["unique" "index" <uniqueIndices: _!\(_>]
+                    ["hash" "index" <hashIndices: _!\(_>]
+                    ["unique" "hash" "index" <uniqueHashIndices: _!\(_>]
                    }
                   ]
               """
@@ -61,31 +70,43 @@ class Create(BaseQuery):
 
             tableConfig.rowSize = rowSize
 
-            # Add indices to this table
+            # Add indices to this table; as (column names, unique, hashed) tuples
+            indices = [([index], False, False) for index in self.indices or []] + \
+                      [([index], True, False) for index in self.uniqueIndices or []] + \
+                      [([index], False, True) for index in self.hashIndices or []] + \
+                      [([index], True, True) for index in self.uniqueHashIndices or []] + \
+                      [(index['columns'], 'unique' in index, 'hashed' in index)
+                       for index in self.compositeIndices or []]
             idxSet = set()
             tableConfig.indices = []
-            if self.indices:
-                for index in self.indices:
-                    # Sanity check; disallow duplicated indices
-                    if index in idxSet:
-                        raise Exception("Duplicated index name: %s" % index)
-                    # Ensure this indexed column exists in our table
-                    if index not in colDict:
-                        raise Exception("Cannot create index on missing column: %s" % index)
-                    # Ensure that the index file for this index doesn't somehow already exist
-                    if NanoIO.File.checkIndexExists(dbName, tableName, index):
-                        raise Exception("Cannot create table %s.%s; index file already exists at %s" % \
-                                        (dbName, tableName, NanoIO.File.indexPath(dbName, tableName, index)))
+            for colNames, unique, hashed in indices:
+                index = ",".join(colNames)
+                # Sanity check; disallow duplicated indices
+                if index in idxSet:
+                    raise Exception("Duplicated index name: %s" % index)
+                # Ensure these indexed columns exist in our table, and are not repeated
+                for colName in colNames:
+                    if colName not in colDict:
+                        raise Exception("Cannot create index on missing column: %s" % colName)
+                if len(set(colNames)) < len(colNames):
+                    raise Exception("Duplicated column in index: %s" % index)
+                # Ensure that the index file for this index doesn't somehow already exist
+                if NanoIO.File.checkIndexExists(dbName, tableName, index):
+                    raise Exception("Cannot create table %s.%s; index file already exists at %s" % \
+                                    (dbName, tableName, NanoIO.File.indexPath(dbName, tableName, index)))
 
-                    idxSet.add(index)
+                idxSet.add(index)
 
-                    indexConfig = NanoConfig.Index.Config()
-                    indexConfig.column = colDict[index]
-                    tableConfig.indices.append(indexConfig)
+                indexConfig = NanoConfig.Index.Config()
+                indexConfig.column = colDict[colNames[0]]
+                indexConfig.trailingColumns = [colDict[colName] for colName in colNames[1:]]
+                indexConfig.unique = unique
+                indexConfig.hashed = hashed
+                tableConfig.indices.append(indexConfig)
 
-                # Create each index for this table
-                for index in self.indices:
-                    NanoIO.File.createIndex(dbName, tableName, index)
+            # Create each index for this table
+            for index in idxSet:
+                NanoIO.File.createIndex(dbName, tableName, index)
 
             # Create this table
             configFD = NanoIO.File.createTable(dbName, tableName)
@@ -1,5 +1,6 @@
 # Project imports
 from _BaseQuery import BaseQuery
+import NanoTools.NanoExecutor as NanoExecutor
 
 class Delete(BaseQuery):
     name = None
@@ -16,5 +17,20 @@ class Delete(BaseQuery):
                   ["limit" <limit: %\d+%>]
               """
 
+    def _plan(self, conn):
+        """ Returns the NanoExecutor.Operator producing the rows this query modifies, each led by its position. """
+
+        dbName, tableName = conn._parseName(self.name)
+        return NanoExecutor.planModification(conn._getTable(self.name), tableName, self.condition, self.orderBy,
+                                             self.orderByDir, self.limit, conn._params, dbName)
+
+
     def executeQuery(self, conn):
-        pass
+        tableIO = conn._getTable(self.name)
+
+        # Find every row to delete before deleting any; as deleting rows modifies the indices we may be scanning
+        positions = [row[0] for row in self._plan(conn)]
+        for pos in positions:
+            tableIO.deleteRow(pos)
+
+        return {'rows': [], 'rowcount': len(positions)}
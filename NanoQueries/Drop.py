@@ -30,9 +30,9 @@ class Drop(BaseQuery):
             tableIO = conn._getTable(self.name)
 
             # Delete all associated indices for this table
-            for colName, index in tableIO.indices.items():
+            for indexName, index in tableIO.indices.items():
                 index.close()
-                NanoIO.File.deleteIndex(dbName, tableName, colName)
+                NanoIO.File.deleteIndex(dbName, tableName, indexName)
 
             # Delete the table itself
             tableIO.close()
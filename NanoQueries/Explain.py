@@ -1,3 +1,23 @@
-# TODO
-class Explain:
-    pass
+# Project imports
+from _BaseQuery import BaseQuery
+import NanoQueries
+import NanoTools.NanoExecutor as NanoExecutor
+
+class Explain(BaseQuery):
+    query = None
+
+    grammar = """
+                  {<query: _all_>}
+              """
+
+    def executeQuery(self, conn):
+        if not self.query:
+            raise Exception("No query given to explain")
+
+        queryType = self.query[0].title()
+        if not hasattr(getattr(NanoQueries, queryType, None), '_plan'):
+            raise Exception("Cannot explain a %s query" % self.query[0])
+
+        query = getattr(NanoQueries, queryType)(" ".join(self.query))
+
+        return {'rows': NanoExecutor.explain(query._plan(conn)), 'columns': ['plan', 'rows', 'cost']}
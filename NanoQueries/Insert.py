@@ -13,14 +13,59 @@ class Insert(BaseQuery):
                   {<vals: _all_>}
               """
 
+    def _parseRows(self, params=()):
+        """
+        Groups our values into the rows they belong to.
+
+        Values may either be given as a single row: `values 1 2 3`, or as any number of bracketed, comma separated rows:
+        `values (1, 2, 3), (4, 5, 6)`.
+
+        Inputs: params - A tuple of the parameters bound to the query, for any placeholders in the values.
+
+        Returns: A list of lists of values; one per row.
+        """
+
+        if self.vals[0] != "(":
+            return [[self._parseValue(val, params) for val in self.vals]]
+
+        rows = []
+        row = None
+        for val in self.vals:
+            if val == "(":
+                if row is not None:
+                    raise Exception("Unexpected ( within row: %s" % self.vals)
+                row = []
+            elif val == ")":
+                if row is None:
+                    raise Exception("Unmatched ) in values: %s" % self.vals)
+                rows.append(row)
+                row = None
+            elif val == ",":
+                continue
+            elif row is None:
+                raise Exception("Value %s given outside of a row" % val)
+            else:
+                row.append(self._parseValue(val, params))
+
+        if row is not None:
+            raise Exception("Unmatched ( in values: %s" % self.vals)
+
+        return rows
+
+
     def executeQuery(self, conn):
         dbName, tableName = conn._parseName(self.name)
 
         tableIO = conn._getTable(self.name)
 
+        rows = self._parseRows(conn._params)
+
         # Ensure an expected number of values
-        if len(self.vals) != len(tableIO.config.columns):
-            raise Exception("Number of values given, %d != number columns, %d" % \
-                            (len(self.vals), len(tableIO.config.columns)))
+        for row in rows:
+            if len(row) != len(tableIO.config.columns):
+                raise Exception("Number of values given, %d != number columns, %d" % \
+                                (len(row), len(tableIO.config.columns)))
+
+        tableIO.insertRows(rows)
 
-        tableIO.insertRow(*self.vals)
+        return {'rows': [], 'rowcount': len(rows)}
@@ -0,0 +1,15 @@
+# Project imports
+from _BaseQuery import BaseQuery
+
+class Reindex(BaseQuery):
+    name = None
+    column = None
+
+    grammar = """
+                  "table"
+                  <name: _>
+                  [<column: _>]
+              """
+
+    def executeQuery(self, conn):
+        conn._getTable(self.name).reindex(self.column)
@@ -1,5 +1,6 @@
 # Project imports
 from _BaseQuery import BaseQuery
+import NanoTools.NanoExecutor as NanoExecutor
 
 class Select(BaseQuery):
     distinct = None
@@ -8,6 +9,7 @@ class Select(BaseQuery):
     innerJoins = None
     leftJoins = None
     where = None
+    groupBy = None
     orderBy = None
     orderByDir = None
     limit = None
@@ -19,10 +21,100 @@ class Select(BaseQuery):
                   "from"
                   <name: _>
                   {
-                   (innerJoins: "inner" "join" <name: _> "on" *condition: inner, left, where, order, limit*)
-                   (leftJoins: "left" "join" <name: _> "on" *condition: inner, left, where, order, limit*)
+                   (innerJoins: "inner" "join" <name: _> "on" *condition: inner, left, where, group, order, limit*)
+                   (leftJoins: "left" "join" <name: _> "on" *condition: inner, left, where, group, order, limit*)
                   }
-                  ["where" *where: order, limit*]
+                  ["where" *where: group, order, limit*]
+                  ["group" "by" {<groupBy: _!(order|limit)_>}]
                   ["order" "by" <orderBy: _> <orderByDir: %(asc|desc)%>]
                   ["limit" <limit: %\d+%>]
               """
+
+    def _expressions(self, plan):
+        """
+        Returns the list of expressions our attrs select.  Attrs may be separated by commas, and `*` selects every
+        column in the tables we select from.  Without commas, each attr is an expression; except for the tokens within
+        parentheses, which belong to the same expression as the token preceding them, ie: `count ( * )`.
+        """
+
+        if "," in self.attrs:
+            groups = [[]]
+            for token in self.attrs:
+                if token == ",":
+                    groups.append([])
+                else:
+                    groups[-1].append(token)
+            expressions = [" ".join(group) for group in groups if group]
+        else:
+            expressions = []
+            depth = 0
+            for token in self.attrs:
+                if depth or (token == "(" and expressions):
+                    expressions[-1] += " " + token
+                else:
+                    expressions.append(token)
+                depth += {"(": 1, ")": -1}.get(token, 0)
+
+        toReturn = []
+        for expression in expressions:
+            if expression == "*":
+                toReturn.extend(colName for tableName, colName in plan.columns)
+            else:
+                toReturn.append(expression)
+
+        return toReturn
+
+
+    def _plan(self, conn):
+        """ Returns the NanoExecutor.Operator producing the rows this query selects. """
+
+        dbName, tableName = conn._parseName(self.name)
+        tableIO = conn._getTable(self.name)
+
+        descending = (self.orderByDir or '').lower() == 'desc'
+        # Without distinct, only as many rows as the limit are consumed from the ordered rows
+        limit = self.limit if self.distinct is None else None
+
+        # Aggregated rows are ordered after they are grouped, rather than as they are read
+        grouped = self.groupBy is not None or bool(NanoExecutor.findAggregates(self.attrs))
+        orderBy = None if grouped else self.orderBy
+
+        # Without any joins, our where condition and order may let us scan an index rather than the entire table
+        if not (self.innerJoins or self.leftJoins):
+            plan = NanoExecutor.planScan(tableIO, tableName, self.where, orderBy, descending, limit,
+                                         params=conn._params, dbName=dbName)
+
+        else:
+            plan = NanoExecutor.TableScan(tableIO, tableName)
+
+            # Inner joins are applied before left joins
+            for join, outer in [(join, False) for join in self.innerJoins or []] + \
+                               [(join, True) for join in self.leftJoins or []]:
+                joinDBName, joinTableName = conn._parseName(join['name'])
+                right = NanoExecutor.TableScan(conn._getTable(join['name']), joinTableName)
+                plan = NanoExecutor.planJoin(plan, right, join['condition'], outer, conn._params, dbName)
+
+            if self.where is not None:
+                plan = NanoExecutor.Filter(plan, self.where, conn._params)
+            if orderBy is not None:
+                plan = NanoExecutor.Sort(plan, orderBy, descending, dbName, limit)
+
+        expressions = names = self._expressions(plan)
+        if grouped:
+            groupBy = [token for token in self.groupBy or [] if token != ","]
+            plan, expressions = NanoExecutor.planAggregate(plan, names, groupBy, conn._params, dbName)
+            if self.orderBy is not None:
+                plan = NanoExecutor.Sort(plan, self.orderBy, descending, dbName, limit)
+
+        plan = NanoExecutor.Project(plan, expressions, conn._params, names)
+        if self.distinct is not None:
+            plan = NanoExecutor.Distinct(plan)
+        if self.limit is not None:
+            plan = NanoExecutor.Limit(plan, self.limit)
+
+        return plan
+
+
+    def executeQuery(self, conn):
+        plan = self._plan(conn)
+        return {'rows': plan, 'columns': [expression for tableName, expression in plan.columns]}
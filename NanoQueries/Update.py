@@ -1,5 +1,6 @@
 # Project import
 from _BaseQuery import BaseQuery
+import NanoTools.NanoExecutor as NanoExecutor
 
 class Update(BaseQuery):
     name = None
@@ -17,3 +18,23 @@ class Update(BaseQuery):
                   ["order" "by" <orderBy: _> <orderByDir: %(asc|desc)%>]
                   ["limit" <limit: %\d+%>]
               """
+
+    def _plan(self, conn):
+        """ Returns the NanoExecutor.Operator producing the rows this query modifies, each led by its position. """
+
+        dbName, tableName = conn._parseName(self.name)
+        return NanoExecutor.planModification(conn._getTable(self.name), tableName, self.where, self.orderBy,
+                                             self.orderByDir, self.limit, conn._params, dbName)
+
+
+    def executeQuery(self, conn):
+        tableIO = conn._getTable(self.name)
+
+        colSets = dict((colSet['name'], self._parseValue(colSet['val'], conn._params)) for colSet in self.colSets)
+
+        # Find every row to update before updating any; so that updated rows are not revisited
+        positions = [row[0] for row in self._plan(conn)]
+        for pos in positions:
+            tableIO.updateRow(pos, **colSets)
+
+        return {'rows': [], 'rowcount': len(positions)}
@@ -3,12 +3,17 @@ import re
 
 # Project imports
 from NanoQueries._QueryGrammar import QueryParser, tokenizeQuery
+import NanoTools.NanoCondition as NanoCondition
+
+# Globals
+PARAM_TOKEN = "?" # A placeholder for a parameter given when the query is executed
 
 class BaseQuery:
     queryParser = None
+    numParams = 0    # The number of parameters which must be given to execute this query
 
     def __init__(self, query):
-        queryTokens = tokenizeQuery(query)
+        queryTokens = self._numberParams(tokenizeQuery(query))
 
         if len(queryTokens) == 0:
             raise Exception("No query given")
@@ -21,13 +26,48 @@ class BaseQuery:
 
         self.queryParser.populate(self, queryTokens[1:])
 
+    def _numberParams(self, queryTokens):
+        """
+        Replaces each ? placeholder in the given tokens with a numbered placeholder, ?N, for the N'th parameter of the
+        query; in the order they appear.  Placeholders may also be numbered explicitly in the query.  Sets numParams.
+        """
+
+        numbered = 0
+        for idx, token in enumerate(queryTokens):
+            if token == PARAM_TOKEN:
+                queryTokens[idx] = "%s%d" % (PARAM_TOKEN, numbered)
+                numbered += 1
+            param = NanoCondition.PARAM_RE.match(queryTokens[idx])
+            if param:
+                self.numParams = max(self.numParams, int(param.group(1)) + 1)
+
+        return queryTokens
+
+
+    def _parseValue(self, token, params=()):
+        """
+        Converts a value token into the value it represents; string literals are stripped of their quotes, and
+        placeholders are replaced by the parameter they stand for.
+        """
+
+        param = NanoCondition.PARAM_RE.match(token)
+        if param:
+            return params[int(param.group(1))]
+        if len(token) > 1 and token[0] in ('"', "'") and token[-1] == token[0]:
+            return token[1:-1]
+        if token.lower() == "null":
+            return None
+        return token
+
     def executeQuery(self, conn):
         """
         Function which executes this instance of the query.
 
-        Inputs: conn - The NanoConnection calling us.
+        Inputs: conn - The NanoConnection calling us.  The parameters bound to this execution of the query are
+                       available as conn._params; queries must not be modified when executed, so that they may be
+                       executed again with other parameters.
 
-        Outputs: A dictionary to be wrapped as a NanoResult.
+        Outputs: None, or a dictionary of keyword arguments to construct a NanoConnection.Result from.
         """
 
         raise NotImplementedError
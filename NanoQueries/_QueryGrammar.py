@@ -278,7 +278,8 @@ class QueryParser:
 ##
 
 # Tokenizing regex
-TOKENIZE_RE = re.compile("""("[^"]*"|'[^']*'|[\w.]+|%s|\S)""" % ("|".join(NanoTools.NanoCondition.LOGICAL_OPERATORS)))
+TOKENIZE_RE = re.compile("""("[^"]*"|'[^']*'|[\w.]+|\?\d*|%s|\S)""" %
+                         ("|".join(NanoTools.NanoCondition.LOGICAL_OPERATORS)))
 
 # Function to tokenize a query
 def tokenizeQuery(query):
@@ -13,6 +13,8 @@ class TestIndexBlock(NanoTests.NanoTestCase):
         self.assertEqual(block1.dataType.quantifier, block2.dataType.quantifier)
         self.assertSequenceEqual(block1.keys, block2.keys)
         self.assertSequenceEqual(block1.addresses, block2.addresses)
+        if not block1.isLeaf:
+            self.assertSequenceEqual(block1.positions, block2.positions)
 
     def testLookup(self):
         # Leaf block
@@ -39,12 +41,14 @@ class TestIndexBlock(NanoTests.NanoTestCase):
 
         block.keys = [1]
         block.addresses = [1]
+        block.positions = [0] * len(block.keys)
         self.assertRaises(NanoBlocks.Index.KeyNotFound, block.lookup, 0)
         self.assertEqual(block.lookup(1), 1)
         self.assertEqual(block.lookup(2), 1)
 
         block.keys = [1, 3]
         block.addresses = ['a', 'b']
+        block.positions = [0] * len(block.keys)
         self.assertRaises(NanoBlocks.Index.KeyNotFound, block.lookup, 0)
         self.assertEqual(block.lookup(1), 'a')
         self.assertEqual(block.lookup(2), 'a')
@@ -61,22 +65,26 @@ class TestIndexBlock(NanoTests.NanoTestCase):
                 block2 = blockClass(101, NanoTypes.getType(keyType))
                 block.keys = []
                 block.addresses = []
+                block.positions = [0] * len(block.keys)
 
                 block2.fromString(block.toString())
                 self.assertBlocksEqual(block, block2)
 
                 block.keys = [1]
                 block.addresses = [4]
+                block.positions = [0] * len(block.keys)
                 block2.fromString(block.toString())
                 self.assertBlocksEqual(block, block2)
 
                 block.keys = range(1, 40, 2)
                 block.addresses = [i * 2 for i in range(1, 40, 2)]
+                block.positions = [0] * len(block.keys)
                 block2.fromString(block.toString())
                 self.assertBlocksEqual(block, block2)
 
                 block.keys = [1] * block.maxKeys
                 block.addresses = range(block.maxKeys)
+                block.positions = [0] * len(block.keys)
                 block2.fromString(block.toString())
                 self.assertBlocksEqual(block, block2)
 
@@ -84,6 +92,7 @@ class TestIndexBlock(NanoTests.NanoTestCase):
 
                 block.keys = [block.dataType.nullVal] * (block.maxKeys + 1)
                 block.addresses = [NanoBlocks.Index.ADDRESS_TYPE.nullVal] * (block.maxKeys + 1)
+                block.positions = [0] * len(block.keys)
 
                 self.assertRaises(Exception, block.toString)
 
@@ -127,7 +136,10 @@ class TestIndexBlock(NanoTests.NanoTestCase):
         block.add(4, 5)
         block.add(5, 10)
         self.assertSequenceEqual(block.keys, [4, 5, 5, 6])
-        self.assertSequenceEqual(block.addresses, [5, 10, 7, 8])
+        self.assertSequenceEqual(block.addresses, [5, 7, 10, 8])
+        block.add(5, 9)
+        self.assertSequenceEqual(block.lookupAll(5), [7, 9, 10])
+        self.assertSequenceEqual(block.lookupAll(3), [])
 
         # Add to 1 off from full leaf block
         block.keys = [2] + ([3] * (block.maxKeys - 2))
@@ -159,6 +171,7 @@ class TestIndexBlock(NanoTests.NanoTestCase):
         block = NanoBlocks.Index.InteriorBlock(101, NanoTypes.getType("int1"))
         block.keys = []
         block.addresses = []
+        block.positions = [0] * len(block.keys)
         block.add(5, 7)
         block.add(6, 8)
         self.assertSequenceEqual(block.keys, [5, 6])
@@ -168,6 +181,7 @@ class TestIndexBlock(NanoTests.NanoTestCase):
         block = NanoBlocks.Index.InteriorBlock(101, NanoTypes.getType("int1"))
         block.keys = [4]
         block.addresses = [5]
+        block.positions = [0] * len(block.keys)
         block.add(5, 4)
         self.assertSequenceEqual(block.keys, [4, 5])
         self.assertSequenceEqual(block.addresses, [5, 4])
@@ -175,6 +189,7 @@ class TestIndexBlock(NanoTests.NanoTestCase):
         block = NanoBlocks.Index.InteriorBlock(101, NanoTypes.getType("int1"))
         block.keys = [4]
         block.addresses = [5]
+        block.positions = [0] * len(block.keys)
         block.add(3, 4)
         self.assertSequenceEqual(block.keys, [3, 4])
         self.assertSequenceEqual(block.addresses, [4, 5])
@@ -190,18 +205,21 @@ class TestIndexBlock(NanoTests.NanoTestCase):
         # Add to 1 off from full interior block
         block.keys = [2] + ([3] * (block.maxKeys - 2))
         block.addresses = [5] * (block.maxKeys - 1)
+        block.positions = [0] * len(block.keys)
         block.add(1, 1)
         self.assertSequenceEqual(block.keys, [1, 2] + ([3] * (block.maxKeys - 2)))
         self.assertSequenceEqual(block.addresses, [1] + ([5] * (block.maxKeys - 1)))
 
         block.keys = [2] + ([3] * (block.maxKeys - 2))
         block.addresses = [5] * (block.maxKeys - 1)
+        block.positions = [0] * len(block.keys)
         block.add(2, 2)
         self.assertSequenceEqual(block.keys, [2, 2] + ([3] * (block.maxKeys - 2)))
         self.assertSequenceEqual(block.addresses, [2] + ([5] * (block.maxKeys - 1)))
 
         block.keys = [2] + ([3] * (block.maxKeys - 2))
         block.addresses = [5] * (block.maxKeys - 1)
+        block.positions = [0] * len(block.keys)
         block.add(3, 3)
         self.assertSequenceEqual(block.keys, [2, 3] + ([3] * (block.maxKeys - 2)))
         self.assertSequenceEqual(block.addresses, [5, 3] + ([5] * (block.maxKeys - 2)))
@@ -251,6 +269,7 @@ class TestIndexBlock(NanoTests.NanoTestCase):
         block = NanoBlocks.Index.InteriorBlock(101, NanoTypes.getType("int1"))
         block.keys = [5]
         block.addresses = [6]
+        block.positions = [0] * len(block.keys)
         self.assertRaises(NanoBlocks.Index.KeyNotFound, block.delete, 4)
         self.assertRaises(NanoBlocks.Index.KeyNotFound, block.delete, 6)
         block.delete(5)
@@ -260,6 +279,7 @@ class TestIndexBlock(NanoTests.NanoTestCase):
         # Delete from the beginning of a half-full interior block
         block.keys = [3, 4, 5, 6, 7]
         block.addresses = [8, 9, 10, 11, 12]
+        block.positions = [0] * len(block.keys)
         self.assertRaises(NanoBlocks.Index.KeyNotFound, block.delete, 2)
         self.assertRaises(NanoBlocks.Index.KeyNotFound, block.delete, 8)
         block.delete(3)
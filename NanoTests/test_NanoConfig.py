@@ -50,6 +50,13 @@ class TestConfigs(NanoTests.NanoTestCase):
 
         self.assertIndicesEqual(index, index2)
 
+        # Configs serialized before the hashed & trailingColumns fields were added are still readable
+        index.fields = ['column', 'unique']
+        index3 = NanoConfig.Index.Config().fromString(index.toString())
+        self.assertIndicesEqual(index, index3)
+        self.assertEqual((index3.hashed, index3.trailingColumns), (0, []))
+        self.assertEqual(index3.indexName(), 'test')
+
     def testTable(self):
         table = NanoConfig.Table.Config()
         table2 = NanoConfig.Table.Config()
@@ -1,20 +1,25 @@
 # Standard imports
-import time, sys, random
+import os, time, sys, random, unittest, collections
 
 # Project imports
 import NanoTests
 import NanoTypes
 
 import NanoBlocks.Index
+from NanoBlocks._MemoryMappedBlock import MemoryMappedBlock
 
 import NanoIO.File
 import NanoIO.Index
+import NanoIO.HashIndex
+import NanoIO.Table
 
 import NanoConfig
 import NanoConfig.Table
 import NanoConfig.Column
 import NanoConfig.Index
 
+import NanoTools.NanoCondition as NanoCondition
+
 
 class TestIndex(NanoTests.NanoTestCase):
     tableName = "IOTestIndex"
@@ -44,12 +49,50 @@ class TestIndex(NanoTests.NanoTestCase):
         self.assertSequenceEqual(indexBlock2.keys, indexBlock.keys)
         self.assertSequenceEqual(indexBlock2.addresses, indexBlock.addresses)
 
+    def _assertLeafChain(self):
+        """ Asserts that walking the chain of leaves in either direction visits every leaf of the tree in order. """
+
+        leaves = []
+        def collectLeaves(address):
+            block = self.IndexIO._getBlockAtAddress(address)
+            if isinstance(block, NanoBlocks.Index.InteriorBlock):
+                for childAddress in block.addresses:
+                    collectLeaves(childAddress)
+            else:
+                leaves.append(block.address)
+        collectLeaves(0)
+
+        chain = [leaves[0]]
+        while self.IndexIO._getBlockAtAddress(chain[-1]).nextLeaf:
+            chain.append(self.IndexIO._getBlockAtAddress(chain[-1]).nextLeaf)
+        self.assertSequenceEqual(chain, leaves)
+
+        chain = [leaves[-1]]
+        while self.IndexIO._getBlockAtAddress(chain[-1]).prevLeaf:
+            chain.append(self.IndexIO._getBlockAtAddress(chain[-1]).prevLeaf)
+        self.assertSequenceEqual(chain, leaves[::-1])
+
+    def _assertParentKeys(self, address=0):
+        """ Asserts that every interior block knows each of its children by the child's first key and position. """
+
+        block = self.IndexIO._getBlockAtAddress(address)
+        if isinstance(block, NanoBlocks.Index.InteriorBlock):
+            for key, pos, childAddress in zip(block.keys, block.positions, block.addresses):
+                self.assertEqual(self.IndexIO._firstEntry(self.IndexIO._getBlockAtAddress(childAddress)), (key, pos))
+                self._assertParentKeys(childAddress)
+
     def testGetAndWriteBlockAtIndex(self):
         # Test getting a block from an index with no keys
         self._assertIndexBlockEqual(self.IndexIO._getBlockAtAddress(0), NanoBlocks.Index.LeafBlock(0, self.IndexIO.colType))
 
+        # Blocks read from the file should be cached
+        self.assertTrue(0 in self.IndexIO.cacheMgr)
+        self.assertIs(self.IndexIO._getBlockAtAddress(0), self.IndexIO._getBlockAtAddress(0))
+
         # Test getting a fresh block
+        self.IndexIO.cacheMgr.truncate()
         indexBlock = NanoBlocks.Index.LeafBlock(0, NanoTypes.Int(4))
+        self.IndexIO.indexFD.seek(0)
         self.IndexIO.indexFD.write(indexBlock.toString())
 
         self.assertFalse(0 in self.IndexIO.cacheMgr)
@@ -134,26 +177,707 @@ class TestIndex(NanoTests.NanoTestCase):
 
         for k, a in pairs:
             self.IndexIO.add(k, a)
+        self._assertLeafChain()
 
-        for k, a in reversed(pairs):
+        for i, (k, a) in enumerate(reversed(pairs)):
             self.assertEqual(self.IndexIO.lookup(k), a)
             self.IndexIO.delete(k)
             self.assertRaises(NanoBlocks.Index.KeyNotFound, self.IndexIO.lookup, k)
+            if i == len(pairs) / 2:
+                self._assertLeafChain()
 
         root = self.IndexIO._getBlockAtAddress(0)
         self.assertEqual(len(root.keys), 0)
 
+    def testPostingLists(self):
+        random.seed(22)
+        entries = set()
+        for pos in random.sample(range(100000), 3000):
+            key = random.choice([1, 2, 3, 4, 5, random.randint(6, 1000)])
+            self.IndexIO.add(key, pos)
+            entries.add((key, pos))
+        self._assertLeafChain()
+        self.assertEqual(list(self.IndexIO._iterate()), sorted(entries))
+
+        # The posting list of a hot key spans several leaves, but is found in a single descent
+        self.assertGreater(len(self.IndexIO.lookupAll(3)), self.IndexIO._getBlockAtAddress(0).maxKeys)
+        for key in (1, 3, 5, 1001):
+            self.assertEqual(self.IndexIO.lookupAll(key), sorted(pos for k, pos in entries if k == key))
+
+        # Deleting a key and position removes exactly that entry
+        for key, pos in random.sample(sorted(entries), 2000):
+            self.IndexIO.delete(key, pos)
+            entries.remove((key, pos))
+            self.assertRaises(NanoBlocks.Index.KeyNotFound, self.IndexIO.delete, key, pos)
+        self._assertLeafChain()
+        self.assertEqual(list(self.IndexIO._iterate()), sorted(entries))
+
+        smallest = min(pos for k, pos in entries if k == 2)
+        self.IndexIO.delete(2)
+        self.assertNotIn(smallest, self.IndexIO.lookupAll(2))
+
+    def testPostingListDescent(self):
+        # A single hot key, whose posting list spans dozens of leaves
+        self.IndexIO.bulkLoad([(7, pos) for pos in range(0, 40000, 2)])
+        height, block = 1, self.IndexIO._getBlockAtAddress(0)
+        while not block.isLeaf:
+            height, block = height + 1, self.IndexIO._getBlockAtAddress(block.addresses[-1])
+
+        reads = []
+        getBlockAtAddress = self.IndexIO._getBlockAtAddress
+        def countReads(address):
+            reads.append(address)
+            return getBlockAtAddress(address)
+        self.IndexIO._getBlockAtAddress = countReads
+
+        # Adding & deleting an entry anywhere within the posting list descends directly to its leaf; rather than
+        # walking the leaves of the posting list preceding it
+        for pos in (1, 20001, 39999):
+            del reads[:]
+            self.IndexIO.add(7, pos)
+            self.assertLessEqual(len(reads), height + 2)
+
+            del reads[:]
+            self.IndexIO.delete(7, pos - 1)
+            self.assertLessEqual(len(reads), height + 2)
+
+        del self.IndexIO._getBlockAtAddress
+        self.assertEqual(self.IndexIO.lookupAll(7), sorted(set(range(2, 39998, 2)) - {20000} | {1, 20001, 39999}))
+        self._assertParentKeys()
+
+    def testInterleavedAddDelete(self):
+        # Use small blocks, so that leaves are split & emptied often; including the first leaf of each interior block
+        oldBlockSize = NanoConfig.index_block_size
+        NanoConfig.index_block_size = 128
+        try:
+            NanoIO.File.deleteIndex(self.dbName, self.tableName, self.indexColName)
+            NanoIO.File.createIndex(self.dbName, self.tableName, self.indexColName).close()
+            self.IndexIO = NanoIO.Index.IndexIO(self.dbName, self.tableName, self.indexConfig)
+
+            random.seed(2)
+            entries = []
+            for step in range(3000):
+                if entries and random.random() < 0.45:
+                    key, pos = entries.pop(random.randrange(len(entries)))
+                    self.IndexIO.delete(key, pos)
+                else:
+                    key, pos = random.randint(0, 1000) / random.choice([1, 50]), step
+                    self.IndexIO.add(key, pos)
+                    entries.append((key, pos))
+                self.assertEqual(list(self.IndexIO._iterate()), sorted(entries))
+            self._assertLeafChain()
+            self._assertParentKeys()
+
+            # Adding below the smallest key once it has been deleted keeps each posting list in order of position
+            for key, pos in sorted(entries):
+                self.IndexIO.delete(key, pos)
+            for pos in range(200):
+                self.IndexIO.add(pos % 40, pos)
+            self.IndexIO.delete(35, 35)
+            for pos in range(1000, 1012) + [500]:
+                self.IndexIO.add(30, pos)
+            self.assertEqual(self.IndexIO.lookupAll(30), [30, 70, 110, 150, 190, 500] + range(1000, 1012))
+            self._assertParentKeys()
+        finally:
+            NanoConfig.index_block_size = oldBlockSize
+
+    def testUniqueIndex(self):
+        random.seed(23)
+        self.indexConfig.unique = True
+        keys = random.sample(xrange(100000), 3000)
+        for pos, key in enumerate(keys):
+            self.IndexIO.add(key, pos)
+        entries = list(self.IndexIO._iterate())
+
+        # Every existing key is rejected; including those at either end of a leaf
+        for key in keys:
+            self.assertRaises(NanoBlocks.Index.DuplicateKey, self.IndexIO.add, key, 100000)
+        self.assertEqual(list(self.IndexIO._iterate()), entries)
+        self._assertLeafChain()
+
+        # Adding many keys is all or nothing
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.IndexIO.addMany, [(-1, 1), (-2, 2), (keys[0], 3)])
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.IndexIO.addMany, [(-1, 1), (-1, 2)])
+        self.assertEqual(list(self.IndexIO._iterate()), entries)
+
+        # Point lookups stop at the first entry found, and are estimated without statistics
+        self.assertEqual(self.IndexIO.lookupMany([keys[0], keys[1], -1]), sorted([(keys[0], 0), (keys[1], 1)]))
+        self.assertEqual(self.IndexIO.estimateEntries(NanoCondition.Filter('c', 'in', {keys[0], -1})), 2)
+
+        # A deleted key may be added again
+        self.IndexIO.delete(keys[0], 0)
+        self.IndexIO.add(keys[0], 5)
+        self.assertEqual(self.IndexIO.lookupAll(keys[0]), [5])
+
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.IndexIO.bulkLoad, [(1, 1), (2, 2), (2, 3)])
+        self.assertEqual(self.IndexIO.lookupAll(keys[0]), [5])
+
+        # Keys added below the smallest key, after it has been deleted, are still checked for duplicates
+        smallest = min(keys)
+        self.IndexIO.delete(smallest, keys.index(smallest))
+        self.IndexIO.add(smallest - 1, 1)
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.IndexIO.add, smallest - 1, 2)
+        self.assertEqual(self.IndexIO.lookupAll(smallest - 1), [1])
+        self._assertParentKeys()
+
+    def testBulkLoad(self):
+        random.seed(125)
+        pairs = sorted(zip(random.sample(xrange(-100000, 100000), 3000), range(3000)))
+
+        for fillPercent in (100, 50, 1):
+            self.IndexIO.bulkLoad(pairs, fillPercent)
+
+            # Every block's parent should point back to it, and the leaves should hold every key in order
+            leafPairs = []
+            def checkBlock(address):
+                block = self.IndexIO._getBlockAtAddress(address)
+                if isinstance(block, NanoBlocks.Index.InteriorBlock):
+                    for key, childAddress in zip(block.keys, block.addresses):
+                        child = self.IndexIO._getBlockAtAddress(childAddress)
+                        self.assertEqual(child.parent, address)
+                        self.assertEqual(child.keys[0], key)
+                        checkBlock(childAddress)
+                else:
+                    leafPairs.extend(zip(block.keys, block.addresses))
+            checkBlock(0)
+            self.assertSequenceEqual(leafPairs, pairs)
+            self._assertLeafChain()
+
+            for key, pos in pairs[::50]:
+                self.assertEqual(self.IndexIO.lookup(key), pos)
+
+        # The index should remain usable after being bulk loaded
+        self.IndexIO.add(200000, 1)
+        self.assertEqual(self.IndexIO.lookup(200000), 1)
+        for key, pos in pairs:
+            self.IndexIO.delete(key)
+        self.IndexIO.delete(200000)
+        self.assertEqual(len(self.IndexIO._getBlockAtAddress(0).keys), 0)
+
+        # Bulk loading nothing should leave an empty index
+        self.IndexIO.bulkLoad([])
+        self.assertRaises(NanoBlocks.Index.KeyNotFound, self.IndexIO.lookup, pairs[0][0])
+
     def testDelete(self): # TODO
         pass
 
     def testLookup(self): # TODO
         pass
 
-    def testLookupCondition(self): # TODO
-        pass
+    def testLookupCondition(self):
+        for i in range(0, 1000, 2):
+            self.IndexIO.add(i, i + 1)
 
-    def testIterate(self): # TODO
-        pass
+        self.assertEqual(self.IndexIO.lookupCondition(NanoCondition.Filter('a', '<', 10)), [1, 3, 5, 7, 9])
+        self.assertEqual(self.IndexIO.lookupCondition(NanoCondition.Filter('a', '>=', 994)), [995, 997, 999])
+        self.assertEqual(self.IndexIO.lookupCondition(NanoCondition.Filter('a', 'in', [7, 6, 500, 2000])), [7, 501])
+
+        # Filters which have been merged together should satisfy all of their conditions
+        filt = NanoCondition.Filter('a', '>', 100).update(NanoCondition.Filter('a', '<=', 106))
+        self.assertEqual(self.IndexIO.lookupCondition(filt), [103, 105, 107])
+        filt.update(NanoCondition.Filter('a', 'in', [98, 104]))
+        self.assertEqual(self.IndexIO.lookupCondition(filt), [105])
+
+    def testLookupMany(self):
+        self.assertEqual(self.IndexIO.lookupMany([1, 2]), [])
+
+        # Duplicate keys span several leaves
+        self.IndexIO.bulkLoad([(i / 5, i) for i in range(5000)])
+        self.assertEqual(self.IndexIO.lookupMany([]), [])
+        self.assertEqual(self.IndexIO.lookupMany([3, -1, 1, 3]), [(1, 5), (1, 6), (1, 7), (1, 8), (1, 9),
+                                                                   (3, 15), (3, 16), (3, 17), (3, 18), (3, 19)])
+
+        random.seed(21)
+        keys = random.sample(range(-10, 1010), 300)
+        expected = [entry for key in sorted(keys) for entry in self.IndexIO._iterate(key, key, True, True)]
+        self.assertEqual(self.IndexIO.lookupMany(keys), expected)
+        self.assertEqual(len(expected), 5 * len([key for key in keys if 0 <= key < 1000]))
+
+        # Neighbouring keys share the blocks above them, rather than each descending from the root
+        reads = []
+        getBlock = self.IndexIO._getBlockAtAddress
+        self.IndexIO._getBlockAtAddress = lambda address: reads.append(address) or getBlock(address)
+        try:
+            self.IndexIO.lookupMany(range(0, 1000, 3))
+            manyReads = len(reads)
+            for key in range(0, 1000, 3):
+                list(self.IndexIO._iterate(key, key, True, True))
+        finally:
+            self.IndexIO._getBlockAtAddress = getBlock
+        self.assertLess(manyReads * 2, len(reads) - manyReads)
+
+    def testStatistics(self):
+        self.assertEqual(self.IndexIO.statistics(), {'entries': 0, 'distinct': 0, 'bounds': []})
+        self.assertEqual(self.IndexIO.estimateEntries(NanoCondition.Filter('a', '<', 10)), 0)
+
+        self.IndexIO.bulkLoad([(i / 2, i) for i in range(2000)])
+        stats = self.IndexIO.statistics()
+        self.assertEqual((stats['entries'], stats['distinct']), (2000, 1000))
+        self.assertEqual((stats['bounds'][0], stats['bounds'][-1]), (0, 999))
+        self.assertEqual(stats['bounds'], sorted(stats['bounds']))
+        self.assertLessEqual(len(stats['bounds']), 2 * NanoIO.Index.STATISTICS_BUCKETS + 2)
+
+        estimate = self.IndexIO.estimateEntries
+        self.assertEqual(estimate(NanoCondition.Filter('a', 'in', [3, 5, 2000])), 4)
+        self.assertAlmostEqual(estimate(NanoCondition.Filter('a', '<', 250)), 500, delta=50)
+        self.assertAlmostEqual(estimate(NanoCondition.Filter('a', '>=', 100)), 1800, delta=50)
+        self.assertEqual(estimate(NanoCondition.Filter('a', '>', 999)), 0)
+        self.assertEqual(estimate(NanoCondition.Filter('a', '<', 0)), 0)
+
+        # Statistics are reused until enough of the index has changed
+        for i in range(200):
+            self.IndexIO.add(5000, i)
+        self.assertIs(self.IndexIO.statistics(), stats)
+        self.IndexIO.add(5000, 200)
+        self.assertEqual(self.IndexIO.statistics()['entries'], 2201)
+
+        # Statistics are written alongside the index, so reopening it does not regather them
+        stats = self.IndexIO.statistics()
+        self.IndexIO.close()
+        self.IndexIO = NanoIO.Index.IndexIO(self.dbName, self.tableName, self.indexConfig)
+        self.IndexIO._iterate = None
+        self.assertEqual(self.IndexIO.statistics(), stats)
+
+        # In the meantime their number of entries is kept up to date
+        self.IndexIO.delete(5000, 0)
+        self.assertEqual(self.IndexIO.statistics()['entries'], 2200)
+        self.IndexIO.close()
+        self.assertTrue(NanoIO.File.checkStatsExists(self.dbName,
+                                                     NanoIO.File.indexFileName(self.tableName, self.indexColName)))
+        NanoIO.File.deleteIndex(self.dbName, self.tableName, self.indexColName)
+        self.assertFalse(NanoIO.File.checkStatsExists(self.dbName,
+                                                      NanoIO.File.indexFileName(self.tableName, self.indexColName)))
+
+    def testIterate(self):
+        self.assertEqual(list(self.IndexIO._iterate()), [])
+
+        random.seed(126)
+        keys = [random.randint(0, 500) for i in range(2000)]
+        for pos, key in enumerate(keys):
+            self.IndexIO.add(key, pos)
+        self._assertLeafChain()
+
+        pairs = sorted(zip(keys, range(len(keys))))
+        iterKeys = lambda *args, **kwargs: [key for key, pos in self.IndexIO._iterate(*args, **kwargs)]
+
+        self.assertEqual(iterKeys(), [key for key, pos in pairs])
+        self.assertEqual(iterKeys(reverse=True), [key for key, pos in reversed(pairs)])
+        self.assertItemsEqual(self.IndexIO._iterate(), pairs)
+
+        for minValue, maxValue in ((100, 200), (0, 500), (250, 250), (-5, 3), (499, 600), (None, 50), (450, None)):
+            for minEqual in (True, False):
+                for maxEqual in (True, False):
+                    expected = [key for key, pos in pairs if
+                                (minValue is None or (key >= minValue if minEqual else key > minValue)) and
+                                (maxValue is None or (key <= maxValue if maxEqual else key < maxValue))]
+                    self.assertEqual(iterKeys(minValue, maxValue, minEqual, maxEqual), expected)
+                    self.assertEqual(iterKeys(minValue, maxValue, minEqual, maxEqual, reverse=True), expected[::-1])
+
+
+class TestHashIndex(NanoTests.NanoTestCase):
+    tableName = "IOTestHashIndex"
+    indexColName = "IOTestHashedColumn"
+    indexConfig = None
+
+    def setUp(self):
+        # Use small blocks, so that buckets overflow & split and the directory spans several blocks
+        self.oldBlockSize = NanoConfig.index_block_size
+        NanoConfig.index_block_size = 256
+
+        col = NanoConfig.Column.Config()
+        col.name = self.indexColName
+        col.typeString = "int4"
+        self.indexConfig = NanoConfig.Index.Config()
+        self.indexConfig.column = col
+        self.indexConfig.unique = False
+        self.indexConfig.hashed = True
+
+        NanoIO.File.deleteIndex(self.dbName, self.tableName, self.indexColName)
+        NanoIO.File.createIndex(self.dbName, self.tableName, self.indexColName).close()
+        self.IndexIO = NanoIO.HashIndex.HashIndexIO(self.dbName, self.tableName, self.indexConfig)
+
+    def tearDown(self):
+        self.IndexIO.close()
+        NanoIO.File.deleteIndex(self.dbName, self.tableName, self.indexColName)
+        NanoConfig.index_block_size = self.oldBlockSize
+
+    def _reopen(self):
+        self.IndexIO.close()
+        self.IndexIO = NanoIO.HashIndex.HashIndexIO(self.dbName, self.tableName, self.indexConfig)
+
+    def testAddLookupDelete(self):
+        random.seed(24)
+        entries = set()
+        for pos in random.sample(xrange(100000), 3000):
+            key = random.choice([1, 2, 3, random.randint(-1000, 1000)])
+            self.IndexIO.add(key, pos)
+            entries.add((key, pos))
+
+        # The index has grown from its single bucket, and its directory no longer fits in a single block
+        self.assertGreater(len(self.IndexIO.directory), 1)
+        self.assertEqual(sorted(self.IndexIO._iterate()), sorted(entries))
+        self._reopen()
+        self.assertEqual(sorted(self.IndexIO._iterate()), sorted(entries))
+
+        for key in (1, 3, 7, -1000, 1001):
+            self.assertEqual(self.IndexIO.lookupAll(key), sorted(pos for k, pos in entries if k == key))
+        self.assertEqual(self.IndexIO.lookup(2), min(pos for k, pos in entries if k == 2))
+        self.assertRaises(NanoBlocks.Index.KeyNotFound, self.IndexIO.lookup, 5000)
+        self.assertEqual(self.IndexIO.lookupMany([7, 2, 7]), sorted((k, pos) for k, pos in entries if k in (2, 7)))
+        self.assertEqual(list(self.IndexIO.iterateCondition(NanoCondition.Filter('c', '<', -990), reverse=True)),
+                         sorted([(k, pos) for k, pos in entries if k < -990], reverse=True))
+
+        stats = self.IndexIO.statistics()
+        self.assertEqual((stats['entries'], stats['distinct']), (len(entries), len(set(k for k, pos in entries))))
+
+        # A key which is not repeated is found by reading a single block
+        counts = collections.Counter(k for k, pos in entries)
+        key = next(k for k in sorted(counts) if counts[k] == 1)
+        read = []
+        getBlock = self.IndexIO._getBlockAtAddress
+        self.IndexIO._getBlockAtAddress = lambda address: read.append(address) or getBlock(address)
+        self.IndexIO.lookup(key)
+        self.assertEqual(len(read), 1)
+        del self.IndexIO._getBlockAtAddress
+
+        for key, pos in random.sample(sorted(entries), 2500):
+            self.IndexIO.delete(key, pos)
+            entries.remove((key, pos))
+            self.assertRaises(NanoBlocks.Index.KeyNotFound, self.IndexIO.delete, key, pos)
+        self.assertEqual(sorted(self.IndexIO._iterate()), sorted(entries))
+
+        smallest = min(pos for k, pos in entries if k == 1)
+        self.IndexIO.delete(1)
+        self.assertNotIn(smallest, self.IndexIO.lookupAll(1))
+
+    def testBulkLoad(self):
+        random.seed(124)
+        pairs = sorted(zip(random.sample(xrange(-100000, 100000), 3000), range(3000)))
+        self.IndexIO.bulkLoad(pairs)
+        self.assertEqual(sorted(self.IndexIO._iterate()), pairs)
+        self.IndexIO.add(100001, 3000)
+        self._reopen()
+        self.assertEqual(sorted(self.IndexIO._iterate()), pairs + [(100001, 3000)])
+        for key, pos in pairs[::100]:
+            self.assertEqual(self.IndexIO.lookup(key), pos)
+
+        # Adding many keys to an empty index loads it in bulk
+        self.IndexIO.bulkLoad([])
+        self.assertEqual(list(self.IndexIO._iterate()), [])
+        self.IndexIO.addMany(reversed(pairs))
+        self.assertEqual(sorted(self.IndexIO._iterate()), pairs)
+
+    def testUniqueIndex(self):
+        self.indexConfig.unique = True
+        for key in range(500):
+            self.IndexIO.add(key, key)
+        for key in range(500):
+            self.assertRaises(NanoBlocks.Index.DuplicateKey, self.IndexIO.add, key, 1000)
+
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.IndexIO.addMany, [(-1, 1), (-2, 2), (5, 3)])
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.IndexIO.bulkLoad, [(1, 1), (2, 2), (1, 3)])
+        self.assertEqual(sorted(self.IndexIO._iterate()), [(key, key) for key in range(500)])
+        self.assertEqual(self.IndexIO.estimateEntries(NanoCondition.Filter('c', 'in', {1, 2, 1000})), 3)
+
+
+class TestTable(NanoTests.NanoTestCase):
+    tableName = "IOTestTable"
+    columns = (('a', 'int4'), ('b', 'char5'))
+    oldGrowthSize = NanoConfig.table_growth_size
+
+    def setUp(self):
+        NanoConfig.table_growth_size = 64
+
+        config = NanoConfig.Table.Config()
+        config.name = self.tableName
+        config.columns = []
+        config.indices = []
+        config.rowSize = 1
+        for name, typeString in self.columns:
+            col = NanoConfig.Column.Config()
+            col.name = name
+            col.typeString = typeString
+            config.columns.append(col)
+            config.rowSize += NanoTypes.getType(typeString).size
+
+        index = NanoConfig.Index.Config()
+        index.column = config.columns[0]
+        index.unique = False
+        config.indices.append(index)
+
+        NanoIO.File.deleteTable(self.dbName, self.tableName)
+        NanoIO.File.deleteIndex(self.dbName, self.tableName, 'a')
+        NanoIO.File.createIndex(self.dbName, self.tableName, 'a').close()
+        configFD = NanoIO.File.createTable(self.dbName, self.tableName)
+        configFD.write(config.toString())
+        configFD.close()
+        self.tableIO = NanoIO.Table.TableIO(self.dbName, self.tableName)
+
+    def tearDown(self):
+        self.tableIO.close()
+        NanoIO.File.deleteTable(self.dbName, self.tableName)
+        NanoIO.File.deleteIndex(self.dbName, self.tableName, 'a')
+        NanoConfig.table_growth_size = self.oldGrowthSize
+
+    def testInsertGetRow(self):
+        self.assertRaises(Exception, self.tableIO.getRow, 0)
+
+        for i in range(20):
+            self.tableIO.insertRow(i, "r%d" % i)
+
+        for i in range(20):
+            row = self.tableIO.getRow(i)
+            self.assertEqual(row.a, i)
+            self.assertEqual(row.b, "r%d" % i)
+
+        self.assertRaises(Exception, self.tableIO.getRow, 20)
+        self.assertEqual(self.tableIO.tableSize, 20 * self.tableIO.config.rowSize)
+
+        # The mapping should have grown in steps of table_growth_size rather than one row at a time
+        self.assertEqual(len(self.tableIO.tableMap) % NanoConfig.table_growth_size, 0)
+        self.assertGreaterEqual(len(self.tableIO.tableMap), self.tableIO.tableSize)
+
+    def testUpdateDeleteRow(self):
+        for i in range(5):
+            self.tableIO.insertRow(i, "r%d" % i)
+
+        self.tableIO.updateRow(2, b="upd")
+        self.assertEqual(self.tableIO.getRow(2).b, "upd")
+        self.assertEqual(self.tableIO.getRow(2).a, 2)
+
+        self.tableIO.deleteRow(3)
+        self.assertRaises(Exception, self.tableIO.getRow, 3)
+        self.assertRaises(Exception, self.tableIO.updateRow, 3, a=1)
+
+        # Inserting should reuse the deleted row's position
+        self.assertEqual(self.tableIO.insertRow(30, "new"), 3)
+        self.assertEqual(self.tableIO.getRow(3).a, 30)
+
+        # Indices should follow the updates and deletes
+        index = self.tableIO.indices['a']
+        self.assertEqual(index.lookup(30), 3)
+        self.tableIO.updateRow(4, a=40)
+        self.assertEqual(index.lookup(40), 4)
+        self.assertRaises(NanoBlocks.Index.KeyNotFound, index.lookup, 4)
+        self.tableIO.deleteRow(1)
+        self.assertRaises(NanoBlocks.Index.KeyNotFound, index.lookup, 1)
+
+        # Only the entry of the row being updated or deleted is removed from the posting list of its value
+        positions = [self.tableIO.insertRow(7, "dup") for i in range(5)]
+        self.assertEqual(index.lookupAll(7), sorted(positions))
+        self.tableIO.updateRow(positions[1], a=70)
+        self.tableIO.deleteRow(positions[3])
+        self.assertEqual(index.lookupAll(7), sorted(positions[:1] + positions[2:3] + positions[4:]))
+
+    def testInsertRows(self):
+        self.assertEqual(self.tableIO.insertRows([]), [])
+
+        positions = self.tableIO.insertRows([(i, str(i)) for i in range(100, 0, -1)])
+        self.assertSequenceEqual(positions, range(100))
+        for pos in positions:
+            self.assertEqual(self.tableIO.getRow(pos).a, 100 - pos)
+            self.assertEqual(self.tableIO.indices['a'].lookup(100 - pos), pos)
+
+        self.tableIO.deleteRow(10)
+        self.tableIO.deleteRow(20)
+
+        # Deleted positions are reused before rows are appended; rows may also be given as dictionaries
+        positions = self.tableIO.insertRows([{'a': 1000, 'b': 'x'}, (1001, 'y'), (1002, 'z')])
+        self.assertSequenceEqual(positions, [20, 10, 100])
+        self.assertEqual(self.tableIO.getRow(20).b, 'x')
+        self.assertEqual(self.tableIO.getRow(100).b, 'z')
+        self.assertEqual(self.tableIO.indices['a'].lookup(1001), 10)
+
+        # An invalid row should prevent the whole batch from being inserted
+        size = self.tableIO.tableSize
+        self.assertRaises(ValueError, self.tableIO.insertRows, [(1, 'a'), ('b', 'b')])
+        self.assertEqual(self.tableIO.tableSize, size)
+
+    def testRowStruct(self):
+        self.assertIsNotNone(self.tableIO.memoryMappedRow.rowStruct)
+
+        # Rows packed with the row's struct should be identical to rows serialized field by field
+        for vals in ((1, "abc"), (-5, "abcde"), (None, None), ('7', 'a'), (2**31 - 1, ''), (0, u'uni')):
+            row = self.tableIO._valsToRow(*vals)
+            serialized = row.toString()
+            self.assertEqual(serialized, MemoryMappedBlock.toString(row))
+
+            row2 = self.tableIO.memoryMappedRow().fromString(serialized)
+            row3 = MemoryMappedBlock.fromString(self.tableIO.memoryMappedRow(), serialized)
+            for fieldName in self.tableIO.memoryMappedRow.fields:
+                self.assertEqual(getattr(row2, fieldName), getattr(row3, fieldName))
+
+        # Invalid values should still be rejected
+        self.assertRaises(ValueError, self.tableIO._valsToRow(2**31, "a").toString)
+        self.assertRaises(ValueError, self.tableIO._valsToRow('a', "a").toString)
+        self.assertRaises(Exception, self.tableIO._valsToRow(1, "abcdef").toString)
+        self.assertRaises(Exception, self.tableIO.memoryMappedRow().fromString, "\x00")
+
+    def testAddIndexReindex(self):
+        for i in range(50):
+            self.tableIO.insertRow(i, "r%d" % (i % 7))
+        self.tableIO.deleteRow(5)
+
+        self.tableIO.addIndex('b')
+        self.assertRaises(Exception, self.tableIO.addIndex, 'b')
+        self.assertRaises(Exception, self.tableIO.addIndex, 'c')
+        self.assertEqual(self.tableIO.getRow(self.tableIO.indices['b'].lookup("r3")).b, "r3")
+        self.assertRaises(NanoBlocks.Index.KeyNotFound, self.tableIO.indices['a'].lookup, 5)
+
+        # The new index should be recorded in the table's configuration
+        self.tableIO.close()
+        self.tableIO = NanoIO.Table.TableIO(self.dbName, self.tableName)
+        self.assertItemsEqual(self.tableIO.indices.keys(), ['a', 'b'])
+
+        self.tableIO.reindex()
+        self.tableIO.reindex('a')
+        self.assertRaises(Exception, self.tableIO.reindex, 'c')
+        self.assertEqual(self.tableIO.indices['a'].lookup(7), 7)
+        self.assertEqual(self.tableIO.indices['b'].lookup("r0"), 49)
+        self.tableIO.close()
+        NanoIO.File.deleteIndex(self.dbName, self.tableName, 'b')
+
+    def testUniqueIndex(self):
+        for i in range(20):
+            self.tableIO.insertRow(i, "r%d" % (i % 7))
+
+        # A unique index cannot be built over repeated values, and leaves no trace behind if attempted
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.tableIO.addIndex, 'b', unique=True)
+        self.assertFalse(NanoIO.File.checkIndexExists(self.dbName, self.tableName, 'b'))
+        for i in range(7, 20):
+            self.tableIO.deleteRow(i)
+        self.tableIO.addIndex('b', unique=True)
+
+        # Rows repeating a unique key are rejected, along with every other entry they would have made
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.tableIO.insertRow, 100, "r3")
+        self.assertRaises(NanoBlocks.Index.KeyNotFound, self.tableIO.indices['a'].lookup, 100)
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.tableIO.insertRows, [(101, "r8"), (102, "r8")])
+        self.assertRaises(NanoBlocks.Index.KeyNotFound, self.tableIO.indices['b'].lookup, "r8")
+        self.assertEqual(self.tableIO.numRows(), 7)
+
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.tableIO.updateRow, 2, a=200, b="r4")
+        self.assertEqual((self.tableIO.getRow(2).a, self.tableIO.getRow(2).b), (2, "r2"))
+        self.assertEqual(self.tableIO.indices['a'].lookupAll(2), [2])
+        self.assertRaises(NanoBlocks.Index.KeyNotFound, self.tableIO.indices['a'].lookup, 200)
+
+        pos = self.tableIO.insertRow(100, "r100")
+        self.tableIO.updateRow(pos, b="r101")
+        self.assertEqual(self.tableIO.indices['b'].lookup("r101"), pos)
+
+        self.tableIO.close()
+        self.tableIO = NanoIO.Table.TableIO(self.dbName, self.tableName)
+        self.assertTrue(self.tableIO.indices['b'].indexConfig.unique)
+        self.assertFalse(self.tableIO.indices['a'].indexConfig.unique)
+        self.tableIO.close()
+        NanoIO.File.deleteIndex(self.dbName, self.tableName, 'b')
+
+    def testCompositeIndex(self):
+        for i in range(60):
+            self.tableIO.insertRow(i % 4, "r%d" % i)
+        self.tableIO.deleteRow(5)
+
+        self.tableIO.addIndex(['a', 'b'], unique=True)
+        self.assertRaises(Exception, self.tableIO.addIndex, ('a', 'b'))
+        self.assertRaises(Exception, self.tableIO.addIndex, ['b', 'b'])
+        self.assertRaises(Exception, self.tableIO.addIndex, ['b', 'c'])
+        index = self.tableIO.indices['a,b']
+        self.assertEqual(index.lookup((2, "r6")), 6)
+        self.assertEqual([key for key, pos in index.iterateCondition(NanoCondition.Filter('a,b', 'in', [(1, "r5")]))],
+                         [])
+
+        # Keys are kept up to date with every column they are made of, and a combination of values may not be repeated
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.tableIO.insertRow, 1, "r9")
+        pos = self.tableIO.insertRow(2, "r9")
+        self.tableIO.updateRow(pos, b="r99")
+        self.tableIO.updateRow(6, a=3)
+        self.assertEqual(index.lookupAll((2, "r99")), [pos])
+        self.assertEqual(index.lookup((3, "r6")), 6)
+        self.assertRaises(NanoBlocks.Index.KeyNotFound, index.lookup, (2, "r6"))
+
+        self.tableIO.close()
+        self.tableIO = NanoIO.Table.TableIO(self.dbName, self.tableName)
+        self.assertEqual(self.tableIO.indices['a,b'].indexConfig.colNames(), ['a', 'b'])
+        self.tableIO.reindex('a,b')
+        self.assertEqual(self.tableIO.indices['a,b'].lookup((3, "r6")), 6)
+        self.tableIO.close()
+        NanoIO.File.deleteIndex(self.dbName, self.tableName, 'a,b')
+
+    def testPersistent(self):
+        for i in range(10):
+            self.tableIO.insertRow(i, str(i))
+
+        self.tableIO.close()
+
+        # Closing the table should trim any unused space the mapping was grown by
+        self.assertEqual(os.path.getsize(NanoIO.File.tablePath(self.dbName, self.tableName)),
+                         10 * self.tableIO.config.rowSize)
+
+        self.tableIO = NanoIO.Table.TableIO(self.dbName, self.tableName)
+        for i in range(10):
+            self.assertEqual(self.tableIO.getRow(i).a, i)
+
+    def testScan(self):
+        self.assertEqual(list(self.tableIO.scan()), [])
+
+        for i in range(50):
+            self.tableIO.insertRow(i, ("r%d" % i) if i % 3 else None)
+        for pos in (0, 7, 8, 49):
+            self.tableIO.deleteRow(pos)
+
+        expected = [(pos, (pos, ("r%d" % pos) if pos % 3 else None)) for pos in range(50) if pos not in (0, 7, 8, 49)]
+        for batchRows in (None, 1, 7, 100):
+            self.assertEqual(list(self.tableIO.scan(batchRows)), expected)
+
+        self.assertEqual(list(self.tableIO.scan(4, ['b', 'a'])), [(pos, vals[::-1]) for pos, vals in expected])
+        self.assertEqual(list(self.tableIO.scan(columns=['a'])), [(pos, vals[:1]) for pos, vals in expected])
+        self.assertRaises(Exception, list, self.tableIO.scan(columns=['c']))
+
+        # Rows which can't be decoded with a single struct should be scanned the same way
+        self.tableIO.memoryMappedRow.rowStruct = None
+        self.assertEqual(list(self.tableIO.scan(3)), expected)
+
+    @unittest.skipIf(NanoIO.Table.numpy is None, "numpy is not installed")
+    def testAsNumpy(self):
+        self.assertEqual(len(self.tableIO.asNumpy()), 0)
+
+        for i in range(30):
+            self.tableIO.insertRow(i * 2, ("r%d" % i) if i % 4 else None)
+        for pos in (3, 10):
+            self.tableIO.deleteRow(pos)
+
+        array = self.tableIO.asNumpy()
+        self.assertEqual(len(array), 30)
+        self.assertIsInstance(array.data, NanoIO.Table.numpy.memmap)
+        self.assertEqual(array['a'].sum(), sum(i * 2 for i in range(30) if i not in (3, 10)))
+        self.assertEqual(array['a'].count(), 28)
+        self.assertEqual(array['b'].count(), len([i for i in range(30) if i % 4 and i not in (3, 10)]))
+        self.assertEqual(array['b'][1].lstrip('\x00'), "r1")
+
+        array = self.tableIO.asNumpy(['a'])
+        self.assertEqual(array.dtype.names, ('a',))
+        self.assertRaises(Exception, self.tableIO.asNumpy, ['c'])
+
+    def testRebuildFreeList(self):
+        for i in range(10):
+            self.tableIO.insertRow(i, str(i))
+        for pos in (6, 2, 8):
+            self.tableIO.deleteRow(pos)
+
+        self.tableIO.delMgr.truncate()
+        self.tableIO.rebuildFreeList()
+
+        self.assertEqual([self.tableIO.insertRow(i, str(i)) for i in range(4)], [2, 6, 8, 10])
+
+    def testTruncate(self):
+        for i in range(10):
+            self.tableIO.insertRow(i, str(i))
+        self.tableIO.deleteRow(4)
+
+        self.tableIO.truncate()
+
+        self.assertRaises(Exception, self.tableIO.getRow, 0)
+        self.tableIO.insertRow(1, "1")
+        self.assertEqual(self.tableIO.getRow(0).a, 1)
 
 
 class TestFile(NanoTests.NanoTestCase):
@@ -5,11 +5,15 @@ import os
 
 # Project imports
 import NanoTests
+import NanoConfig
 import NanoQueries
+import NanoBlocks.Index
 import NanoIO.File
+import NanoIO.HashIndex
 import NanoQueries._QueryGrammar as QueryGrammar
 import NanoTools.NanoCondition as NanoCondition
 import NanoTools.NanoConnection as NanoConnection
+import NanoTools.NanoExecutor as NanoExecutor
 
 from NanoQueries._BaseQuery import BaseQuery
 
@@ -32,6 +36,10 @@ class TestTokenizeQuery(NanoTests.NanoTestCase):
             ("a", ">", "<", "<=", ">=", "+", "-", "/", "%", "*", "!=", "=", ">", "<", "<=", ">=", "+", "-", "/", "%", "*")
         )
 
+        # Test placeholder tokens
+        self.assertSequenceEqual(QueryGrammar.tokenizeQuery("a==?and b in (?12, '?')"),
+                                 ("a", "==", "?", "and", "b", "in", "(", "?12", ",", "'?'", ")"))
+
 class TestQueryGrammar(NanoTests.NanoTestCase):
     def setUp(self):
         class Test(BaseQuery):
@@ -534,6 +542,18 @@ class TestNanoQueryParsing(NanoTests.NanoTestCase): # TODO test executing for ea
         self.assertEqual(config.indices[1].column.name, "colName2")
         self.assertEqual(config.indices[0].column.typeString, "int4")
         self.assertEqual(config.indices[1].column.typeString, "char15")
+        self.assertFalse(config.indices[0].unique)
+
+        a = NanoQueries.Create("Create table uniqueTable id int4 unique index id uniqueName char8 index uniqueName")
+        self.assertSequenceEqual(a.cols, ({'name': 'id', 'type': 'int4'}, {'name': 'uniqueName', 'type': 'char8'}))
+        self.assertSequenceEqual(a.uniqueIndices, ['id'])
+        self.assertSequenceEqual(a.indices, ['uniqueName'])
+        self.assertRaises(Exception, self.conn.execute, "Create table uniqueTable id int4 unique index id index id")
+
+        self.conn.execute("Create table uniqueTable id int4 unique index id uniqueName char8 index uniqueName")
+        config = self.conn._getTable("uniqueTable").config
+        self.assertEqual([(index.column.name, index.unique) for index in config.indices],
+                         [('uniqueName', False), ('id', True)])
 
     def testDrop(self):
         dbName3 = self.dbName + "3"
@@ -670,6 +690,15 @@ class TestNanoQueryParsing(NanoTests.NanoTestCase): # TODO test executing for ea
         self.assertEqual(a.orderByDir, 'asc')
         self.assertEqual(a.limit, '5')
 
+        # Test executing deletes
+        self.conn.execute("Create table testing a int4 index a b char5")
+        self.conn.execute("Insert into testing values (1, 'one'), (2, 'two'), (3, 'three'), (4, 'four'), (5, 'five')")
+
+        self.assertEqual(self.conn.execute("Delete from testing where a == 2 or a == 4").rowcount, 2)
+        self.assertEqual(self.conn.execute("Delete from testing order by a desc limit 1").rowcount, 1)
+        self.assertEqual(self.conn.execute("Select a from testing").fetchall(), [(1,), (3,)])
+        self.assertRaises(NanoBlocks.Index.KeyNotFound, self.conn._getTable("testing").indices['a'].lookup, 5)
+
     def testInsert(self): # TODO test execute
         q = """Insert into testing values 1 2 "val" 4 5"""
         a = NanoQueries.Insert(q)
@@ -677,6 +706,22 @@ class TestNanoQueryParsing(NanoTests.NanoTestCase): # TODO test executing for ea
         self.assertEqual(a.name, "testing")
         self.assertSequenceEqual(a.vals, ('1', '2', '"val"', '4', '5'))
 
+        q = """Insert into testing values (1, "a b"), (2, null)"""
+        a = NanoQueries.Insert(q)
+        self.assertSequenceEqual(a._parseRows(), [['1', 'a b'], ['2', None]])
+
+        self.assertRaises(Exception, NanoQueries.Insert("Insert into testing values (1, 2").executeQuery, self.conn)
+        self.assertRaises(Exception, NanoQueries.Insert("Insert into testing values 1 ( 2 )").executeQuery, self.conn)
+
+        self.conn.execute("Create table testing a int4 index a b char5")
+        self.conn.execute("Insert into testing values 1 'one'")
+        self.conn.execute("Insert into testing values (2, 'two'), (3, 'three')")
+        tableIO = self.conn._getTable("testing")
+        self.assertEqual(tableIO.getRow(0).b, "one")
+        self.assertEqual(tableIO.getRow(2).b, "three")
+        self.assertEqual(tableIO.indices['a'].lookup(2), 1)
+        self.assertRaises(Exception, self.conn.execute, "Insert into testing values (4, 'four'), (5)")
+
 
     def testSelect(self): # TODO test execute
         q = """Select distinct val from testing"""
@@ -930,6 +975,36 @@ class TestNanoQueryParsing(NanoTests.NanoTestCase): # TODO test executing for ea
         self.assertEqual(a.orderByDir, 'desc')
         self.assertEqual(a.limit, '4')
 
+        # Test executing selects
+        self.conn.execute("Create table people id int4 index id name char8 age int4")
+        self.conn.execute("Create table pets owner int4 pet char8")
+        self.conn.execute("Insert into people values (1, 'ann', 30), (2, 'bob', 25), (3, 'cat', 30), (4, 'dan', 41)")
+        self.conn.execute("Insert into pets values (1, 'rex'), (1, 'tom'), (3, 'kit')")
+
+        result = self.conn.execute("Select * from people")
+        self.assertEqual(result.columns, ['id', 'name', 'age'])
+        self.assertEqual(result.fetchone(), (1, 'ann', 30))
+        self.assertEqual(result.fetchmany(2), [(2, 'bob', 25), (3, 'cat', 30)])
+        self.assertEqual(result.fetchall(), [(4, 'dan', 41)])
+        self.assertIsNone(result.fetchone())
+
+        self.assertEqual(self.conn.execute("Select name from people where age == 30").fetchall(), [('ann',), ('cat',)])
+        self.assertEqual(self.conn.execute("Select name from people where id >= 2 and age < 40").fetchall(),
+                         [('bob',), ('cat',)])
+        self.assertEqual(self.conn.execute("Select name, age + 1 from people where 3 < id").fetchall(), [('dan', 42)])
+        self.assertEqual(self.conn.execute("Select name from people order by age desc limit 2").fetchall(),
+                         [('dan',), ('ann',)])
+        self.assertEqual(self.conn.execute("Select distinct age from people order by age asc").fetchall(),
+                         [(25,), (30,), (41,)])
+        self.assertEqual(list(self.conn.execute("Select id from people limit 2")), [(1,), (2,)])
+
+        result = self.conn.execute("Select name pet from people inner join pets on pets.owner == people.id")
+        self.assertEqual(result.fetchall(), [('ann', 'rex'), ('ann', 'tom'), ('cat', 'kit')])
+        result = self.conn.execute("Select name pet from people left join pets on owner == id where age >= 30")
+        self.assertEqual(result.fetchall(), [('ann', 'rex'), ('ann', 'tom'), ('cat', 'kit'), ('dan', None)])
+
+        self.assertRaises(Exception, self.conn.execute, "Select name from people order by height asc")
+
     def testUpdate(self): # TODO test execute
         q = """update test set a = 4"""
         a = NanoQueries.Update(q)
@@ -1004,6 +1079,36 @@ class TestNanoQueryParsing(NanoTests.NanoTestCase): # TODO test executing for ea
         self.assertEqual(a.orderByDir, 'asc')
         self.assertEqual(a.limit, '5')
 
+        # Test executing updates
+        self.conn.execute("Create table testing a int4 index a b char5")
+        self.conn.execute("Insert into testing values (1, 'one'), (2, 'two'), (3, 'three'), (4, 'four')")
+
+        self.assertEqual(self.conn.execute("Update testing set b = 'big' where a > 2").rowcount, 2)
+        self.assertEqual(self.conn.execute("Update testing set a = 10 order by a desc limit 1").rowcount, 1)
+        self.assertEqual(self.conn.execute("Select a b from testing").fetchall(),
+                         [(1, 'one'), (2, 'two'), (3, 'big'), (10, 'big')])
+        self.assertEqual(self.conn._getTable("testing").indices['a'].lookup(10), 3)
+
+    def testReindex(self):
+        q = """Reindex table testing"""
+        a = NanoQueries.Reindex(q)
+
+        self.assertEqual(a.name, 'testing')
+        self.assertIsNone(a.column)
+
+        q = """Reindex table testing a"""
+        a = NanoQueries.Reindex(q)
+
+        self.assertEqual(a.name, 'testing')
+        self.assertEqual(a.column, 'a')
+
+        self.conn.execute("Create table testing a int4 index a")
+        self.conn.execute("Insert into testing values (3), (1), (2)")
+        self.conn.execute(q)
+        index = self.conn._getTable("testing").indices['a']
+        self.assertSequenceEqual([index.lookup(k) for k in (1, 2, 3)], [1, 2, 0])
+        self.assertRaises(Exception, self.conn.execute, "Reindex table testing b")
+
     def testUse(self): # TODO test execute
         q = """Use test"""
         a = NanoQueries.Use(q)
@@ -1049,3 +1154,269 @@ class TestNanoQueryParsing(NanoTests.NanoTestCase): # TODO test executing for ea
 
         q = 'show tables in testDB in testDB'
         self.assertRaises(Exception, NanoQueries.Show, q)
+
+    def testExplain(self):
+        a = NanoQueries.Explain("Explain select a from testing where b == 'b c'")
+        self.assertEqual(a.query, ['select', 'a', 'from', 'testing', 'where', 'b', '==', "'b c'"])
+
+        self.conn.execute("Create table testing a int4 index a b int4 index b c int4")
+        self.conn._getTable("testing").insertRows([(i, (i * 7) % 1000, i % 10) for i in range(1000)])
+
+        def accessPath(q):
+            plan = self.conn.execute("Explain " + q).fetchall()
+            return plan[-1][0].strip().split(" ")[0]
+
+        self.assertEqual(accessPath("Select a from testing"), "TableScan")
+        self.assertEqual(accessPath("Select a from testing where c == 5"), "TableScan")
+        self.assertEqual(accessPath("Select a from testing where a == 5 and c == 5"), "IndexScan")
+        self.assertEqual(accessPath("Select a from testing where a < 900 and b < 900"), "TableScan")
+        self.assertEqual(accessPath("Select a from testing where b < 900 and a == 5"), "IndexScan")
+        self.assertEqual(accessPath("Select a from testing where a < 100 and b < 100"), "IndexIntersection")
+        self.assertEqual(accessPath("Select a from testing where a == 5 or b == 7"), "IndexUnion")
+        self.assertEqual(accessPath("Update testing set c = 1 where a == 5 or b == 7 limit 1"), "IndexUnion")
+        self.assertEqual(accessPath("Delete from testing where a == 5 or c == 7"), "TableScan")
+
+        plan = self.conn.execute("Explain select a from testing where a == 5 order by a asc limit 1")
+        self.assertEqual(plan.columns, ['plan', 'rows', 'cost'])
+        self.assertEqual([row[0] for row in plan.fetchall()],
+                         ["Limit 1", "  Project a", "    Filter (((a) == (5)))",
+                          "      IndexScan on testing using a (a in [5])"])
+
+        # Ordering by an indexed column scans its index in order, stopping once the limit is reached
+        tableIO = self.conn._getTable("testing")
+        fetched = []
+        getRow = tableIO.getRow
+        tableIO.getRow = lambda pos: fetched.append(pos) or getRow(pos)
+        try:
+            self.assertEqual(accessPath("Select a from testing order by b desc limit 3"), "IndexScan")
+            self.assertEqual(self.conn.execute("Select a, b from testing order by b desc limit 3").fetchall(),
+                             [(857, 999), (714, 998), (571, 997)])
+            self.assertEqual(len(fetched), 3)
+            del fetched[:]
+            self.assertEqual(self.conn.execute("Select a from testing where c == 1 order by b asc limit 2").fetchall(),
+                             [(1,), (431,)])
+            self.assertLess(len(fetched), 100)
+        finally:
+            tableIO.getRow = getRow
+
+        plan = self.conn.execute("Explain select a from testing order by b desc limit 3").fetchall()
+        self.assertEqual(plan[-1][0].strip(), "IndexScan on testing using b descending")
+        self.assertEqual(accessPath("Select a from testing order by c asc limit 3"), "TableScan")
+        self.assertEqual(accessPath("Select a from testing where b == 7 order by a asc"), "IndexScan")
+        self.assertEqual(self.conn.execute("Select a from testing where b < 30 order by a desc").fetchall(),
+                         [(i,) for i in range(999, -1, -1) if (i * 7) % 1000 < 30])
+
+        # Each plan produces the same rows as the condition it was chosen for
+        for where in ("a < 100 and b < 100", "a == 5 or b == 7", "b < 100 and a > 950", "not a < 990"):
+            expected = sorted((i,) for i, b, c in [(i, (i * 7) % 1000, i % 10) for i in range(1000)]
+                              if eval(where, {'a': i, 'b': b, 'c': c}))
+            self.assertEqual(sorted(self.conn.execute("Select a from testing where " + where)), expected)
+
+        self.assertEqual(self.conn.execute("Delete from testing order by a desc limit 2").rowcount, 2)
+        self.assertEqual(self.conn.execute("Select a from testing order by a desc limit 1").fetchall(), [(997,)])
+
+        self.assertRaises(Exception, self.conn.execute, "Explain drop table testing")
+
+    def testBuiltinNamedColumns(self):
+        # A column named like a builtin, compared to an indexed column, is a condition on the row; not a constant
+        self.conn.execute("Create table builtins a int4 index a id int4 b int4")
+        self.conn._getTable("builtins").insertRows([(i, i, i) for i in range(5)])
+
+        for q in ("Select a from builtins where a == id", "Select a from builtins where a >= id"):
+            self.assertEqual(self.conn.execute("Explain " + q).fetchall()[-1][0].strip(), "TableScan on builtins")
+            self.assertEqual(sorted(self.conn.execute(q)), [(i,) for i in range(5)])
+        self.assertEqual(sorted(self.conn.execute("Select a from builtins where a == b")), [(i,) for i in range(5)])
+        self.assertEqual(self.conn.execute("Select b from builtins where a == 3").fetchall(), [(3,)])
+
+    def testPrepare(self):
+        self.assertEqual(NanoQueries.Select("Select a from t where a == ? or b > ?").numParams, 2)
+        self.assertEqual(NanoQueries.Select("Select a from t where a == ?1 or b > ?").numParams, 2)
+        self.assertEqual(NanoQueries.Select("Select a from t where a == '?'").numParams, 0)
+
+        self.conn.execute("Create table people id int4 index id name char8 age int4")
+        insert = self.conn.prepare("Insert into people values (?, ?, ?)")
+        for row in ((1, 'ann', 30), (2, 'bob', 25), (3, 'cat', 30)):
+            self.assertEqual(insert.execute(row).rowcount, 1)
+        self.conn.execute("Insert into people values ? ? 41", [4, 'dan'])
+
+        select = self.conn.prepare("Select name from people where id == ? and age < ?")
+        self.assertEqual(select.execute([3, 40]).fetchall(), [('cat',)])
+        self.assertEqual(select.execute([4, 40]).fetchall(), [])
+        self.assertRaises(Exception, select.execute, [3])
+        self.assertRaises(Exception, select.execute, [3, 40, 5])
+
+        # Results produced lazily keep the parameters they were executed with
+        first, second = select.execute([1, 40]), select.execute([2, 40])
+        self.assertEqual((second.fetchall(), first.fetchall()), ([('bob',)], [('ann',)]))
+
+        # Placeholders in an indexed condition are used to scan the index
+        for i in range(100, 200):
+            insert.execute([i, 'extra', 20])
+        plan = self.conn.execute("Explain select name from people where id == ?", [2]).fetchall()
+        self.assertEqual(plan[-1][0].strip(), "IndexScan on people using id (id in [2])")
+
+        self.assertEqual(self.conn.execute("Select name, age + ?0 from people where id == ?1 or age == ?0",
+                                           [25, 1]).fetchall(), [('ann', 55), ('bob', 50)])
+        self.assertEqual(self.conn.execute("Update people set age = ? where name == ?", [31, 'cat']).rowcount, 1)
+        self.assertEqual(self.conn.execute("Delete from people where age > ?", [30]).rowcount, 2)
+        self.assertEqual(self.conn.execute("Select id from people where id < ?", [100]).fetchall(), [(1,), (2,)])
+
+    def testIndexJoin(self):
+        self.conn.execute("Create table owners id int4 index id name char8")
+        self.conn._getTable("owners").insertRows([(i, "o%d" % i) for i in range(1000)])
+        self.conn.execute("Create table pets owner int4 name char8")
+        self.conn._getTable("pets").insertRows([(5, 'rex'), (999, 'tom'), (5, 'kit'), (2000, 'cow')])
+
+        # A small outer table looks up its rows in the index of the inner table
+        q = "Select pets.name owners.name from pets %s join owners on owners.id == pets.owner"
+        plan = self.conn.execute("Explain " + q % "inner").fetchall()
+        self.assertEqual(plan[1][0].strip(), "IndexJoin on pets.owner = owners.id")
+        expected = [('rex', 'o5'), ('tom', 'o999'), ('kit', 'o5')]
+        self.assertEqual(self.conn.execute(q % "inner").fetchall(), expected)
+        self.assertEqual(self.conn.execute(q % "left").fetchall(), expected + [('cow', None)])
+
+        # Left rows are looked up in batches, and produced in their original order
+        oldBatch = NanoExecutor.JOIN_PROBE_BATCH
+        try:
+            NanoExecutor.JOIN_PROBE_BATCH = 3
+            self.assertEqual(self.conn.execute(q % "left").fetchall(), expected + [('cow', None)])
+        finally:
+            NanoExecutor.JOIN_PROBE_BATCH = oldBatch
+
+        # A large outer table is hashed instead
+        plan = self.conn.execute("Explain select pets.name from owners inner join pets on owners.id == pets.owner")
+        self.assertEqual(plan.fetchall()[1][0].strip().split(" ")[0], "HashJoin")
+
+    def testUniqueIndex(self):
+        self.conn.execute("Create table users id int4 unique index id name char8 index name")
+        self.conn.execute("Insert into users values (1, 'ann'), (2, 'bob'), (3, 'ann')")
+
+        # A row repeating a unique key is rejected, leaving no trace in the table or its other indices
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.conn.execute, "Insert into users values 2 'cat'")
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.conn.execute,
+                          "Insert into users values (4, 'a'), (4, 'b')")
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.conn.execute, "Update users set id = 1 where id == 3")
+        self.assertEqual(self.conn.execute("Select id, name from users order by id asc").fetchall(),
+                         [(1, 'ann'), (2, 'bob'), (3, 'ann')])
+        self.assertEqual(self.conn._getTable("users").indices['name'].lookupAll('cat'), [])
+
+        # A point read on a unique key goes straight to its index
+        self.conn._getTable("users").insertRows([(i, "u%d" % (i % 10)) for i in range(10, 1000)])
+        plan = self.conn.execute("Explain select name from users where id == 500 and name == 'u0'").fetchall()
+        self.assertEqual(plan[-1][0].strip(), "IndexScan on users using id (id in [500])")
+        self.assertEqual(self.conn.execute("Select name from users where id == 500").fetchall(), [('u0',)])
+
+    def testHashIndex(self):
+        self.conn.execute("Create table accounts id int4 unique hash index id owner char8 hash index owner rank int4")
+        tableIO = self.conn._getTable("accounts")
+        self.assertIsInstance(tableIO.indices['id'], NanoIO.HashIndex.HashIndexIO)
+        self.assertTrue(tableIO.indices['id'].indexConfig.unique)
+        tableIO.insertRows([(i, "o%d" % (i % 50), i % 7) for i in range(2000)])
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.conn.execute, "Insert into accounts values 5 'x' 1")
+
+        def accessPath(q):
+            return self.conn.execute("Explain " + q).fetchall()[-1][0].strip()
+
+        # Hash indices are used to look up values, but not ranges of values or to order rows
+        self.assertEqual(accessPath("Select rank from accounts where id == 1500"),
+                         "IndexScan on accounts using id (id in [1500])")
+        self.assertEqual(accessPath("Select rank from accounts where owner == 'o3' or id == 7").split(" ")[0],
+                         "IndexUnion")
+        self.assertEqual(accessPath("Select rank from accounts where id < 10"), "TableScan on accounts")
+        self.assertEqual(accessPath("Select rank from accounts where id < 10 or owner == 'o3'"),
+                         "TableScan on accounts")
+        self.assertEqual(accessPath("Select id from accounts order by id asc limit 1").split(" ")[0], "TableScan")
+
+        self.assertEqual(self.conn.execute("Select owner from accounts where id == 1500").fetchall(), [('o0',)])
+        self.assertEqual(sorted(self.conn.execute("Select id from accounts where owner in ('o3', 'o4') and id < 200")),
+                         [(i,) for i in range(200) if i % 50 in (3, 4)])
+        self.assertEqual(self.conn.execute("Select id from accounts where id < 3 order by id desc").fetchall(),
+                         [(2,), (1,), (0,)])
+
+    def testCompositeIndex(self):
+        self.conn.execute("Create table events tenant int4 ts int4 kind char4 "
+                          "index (tenant, ts) unique index (ts, kind)")
+        tableIO = self.conn._getTable("events")
+        self.assertEqual(tableIO.indices['tenant,ts'].indexConfig.colNames(), ['tenant', 'ts'])
+        self.assertTrue(tableIO.indices['ts,kind'].indexConfig.unique)
+        tableIO.insertRows([(i % 20, i, "k%d" % (i % 3)) for i in range(2000)])
+
+        def accessPath(q):
+            return self.conn.execute("Explain " + q).fetchall()[-1][0].strip()
+
+        # Equalities on the leading columns narrow the range of keys scanned, followed by any range of the next column
+        self.assertEqual(accessPath("Select ts from events where tenant == 3 and ts > 1900"),
+                         "IndexScan on events using tenant,ts (tenant,ts > (3, 1900, MAX) and tenant,ts <= (3, MAX))")
+        self.assertIn("tenant,ts (tenant,ts >= (3,) and tenant,ts <= (3, 100, MAX))",
+                      accessPath("Select ts from events where tenant == 3 and ts <= 100"))
+        self.assertEqual(accessPath("Select ts from events where ts == 7 and kind == 'k1'"),
+                         "IndexScan on events using ts,kind (ts,kind in [(7, 'k1')])")
+        self.assertEqual(accessPath("Select ts from events where kind == 'k1'"), "TableScan on events")
+
+        self.assertEqual(self.conn.execute("Select ts from events where tenant == 3 and ts > 1900 order by ts asc")
+                         .fetchall(), [(i,) for i in range(1901, 2000) if i % 20 == 3])
+        self.assertEqual(sorted(self.conn.execute("Select ts from events where tenant == 3 and ts <= 100")),
+                         [(3,), (23,), (43,), (63,), (83,)])
+        self.assertEqual(sorted(self.conn.execute("Select tenant from events where tenant in (1, 2) and ts < 45")),
+                         [(1,), (1,), (1,), (2,), (2,), (2,)])
+        self.assertEqual(self.conn.execute("Select tenant from events where ts == 7 and kind == 'k1'").fetchall(),
+                         [(7,)])
+        self.assertRaises(NanoBlocks.Index.DuplicateKey, self.conn.execute, "Insert into events values 1 7 'k1'")
+
+        self.assertRaises(Exception, self.conn.execute, "Create table bad a int4 index (a, b)")
+        self.assertRaises(Exception, self.conn.execute, "Create table bad a int4 index (a, a)")
+
+    def testAggregate(self):
+        a = NanoQueries.Select("Select name count(*) from people where age > 1 group by name, age order by name asc")
+        self.assertEqual(a.attrs, ['name', 'count', '(', '*', ')'])
+        self.assertEqual(a.groupBy, ['name', ',', 'age'])
+        self.assertEqual((a.orderBy, a.orderByDir), ('name', 'asc'))
+
+        self.conn.execute("Create table people id int4 index id name char8 age int4")
+        self.conn._getTable("people").insertRows([(1, 'ann', 30), (2, 'bob', 25), (3, 'ann', 40), (4, 'dan', 25),
+                                                  (5, 'bob', 35)])
+
+        result = self.conn.execute("Select count(*), sum(age), min(age), max(age), avg(age) from people")
+        self.assertEqual(result.columns, ['count ( * )', 'sum ( age )', 'min ( age )', 'max ( age )', 'avg ( age )'])
+        self.assertEqual(result.fetchall(), [(5, 155, 25, 40, 31.0)])
+        self.assertEqual(self.conn.execute("Select count ( * ) sum(age) from people where id > 9").fetchall(),
+                         [(0, None)])
+
+        result = self.conn.execute("Select name, count(*), sum(age) / count(*) + ? from people group by name "
+                                   "order by name desc", [1])
+        self.assertEqual(result.fetchall(), [('dan', 1, 26), ('bob', 2, 31), ('ann', 2, 36)])
+        self.assertEqual(self.conn.execute("Select age from people where id < 5 group by age order by age asc limit 1")
+                         .fetchall(), [(25,)])
+        self.assertEqual(sorted(self.conn.execute("Select name from people group by name")),
+                         [('ann',), ('bob',), ('dan',)])
+
+        plan = self.conn.execute("Explain select name max(age) from people group by name").fetchall()
+        self.assertEqual([row[0].strip() for row in plan[:2]], ["Project name, max ( age )",
+                                                                "Aggregate max(age) by name"])
+
+        self.assertRaises(Exception, self.conn.execute, "Select name, count(*) from people")
+        self.assertRaises(Exception, self.conn.execute, "Select name, count(*) from people group by height")
+
+    def testQueryCache(self):
+        oldSize = NanoConfig.query_cache_size
+        try:
+            NanoConfig.query_cache_size = 2
+            q1, q2, q3 = "Show tables", "Show tables in a", "Show tables in b"
+            parsed = self.conn._parseQuery(q1)
+            self.assertIs(self.conn._parseQuery(q1), parsed)
+
+            # The least recently used query is evicted
+            self.conn._parseQuery(q2)
+            self.conn._parseQuery(q1)
+            self.conn._parseQuery(q3)
+            self.assertEqual(self.conn._queryCache.keys(), [q1, q3])
+            self.assertIs(self.conn._parseQuery(q1), parsed)
+
+            NanoConfig.query_cache_size = 0
+            self.conn._queryCache.clear()
+            self.conn._parseQuery(q1)
+            self.assertEqual(len(self.conn._queryCache), 0)
+
+            self.assertRaises(Exception, self.conn._parseQuery, "Frobnicate tables")
+        finally:
+            NanoConfig.query_cache_size = oldSize
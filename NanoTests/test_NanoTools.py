@@ -1,4 +1,6 @@
 # Standard imports
+import os
+import random
 import traceback
 
 # Project imports
@@ -6,6 +8,7 @@ import NanoTools
 import NanoBlocks
 import NanoIO.File
 import NanoTools.NanoCondition as NanoCondition
+import NanoTools.NanoExecutor as NanoExecutor
 import NanoConfig
 import NanoTests
 import NanoTypes
@@ -226,6 +229,244 @@ class TestNanoCondition(NanoTests.NanoTestCase):
         self.assertStatement(cond.statements[3].statement.statements[0], ['7', '+', '4', '-', '(', '9', '/', '1', ')'])
         self.assertStatement(cond.statements[3].statement.statements[1], ['(', '5', '*', '6', ')'], '==', '4')
 
+    def testFilters(self):
+        bounds = lambda filt: (filt.greaterThan, filt.greaterThanEqual, filt.lessThan, filt.lessThanEqual)
+
+        # Only filters bounded on one side can be inversed
+        self.assertEqual(bounds(NanoCondition.Filter('a', '<', 5).inverse()), (5, True, None, None))
+        self.assertEqual(bounds(NanoCondition.Filter('a', '>=', 5).inverse()), (None, None, 5, False))
+        self.assertIsNone(NanoCondition.Filter('a', '==', 5).inverse())
+        self.assertIsNone(NanoCondition.Filter('a', '<', 5).update(NanoCondition.Filter('a', '>', 1)).inverse())
+
+        filt = NanoCondition.Filter('a', 'in', [1, 2]).union(NanoCondition.Filter('a', 'in', [2, 3]))
+        self.assertEqual((filt.inItems, bounds(filt)), ([1, 2, 3], (None, None, None, None)))
+        filt = NanoCondition.Filter('a', '<', 5).union(NanoCondition.Filter('a', '==', 7))
+        self.assertEqual((filt.inItems, bounds(filt)), (None, (None, None, 7, True)))
+        filt = NanoCondition.Filter('a', '>', 5).union(NanoCondition.Filter('a', '>=', 5))
+        self.assertEqual(bounds(filt), (5, True, None, None))
+        self.assertEqual(bounds(filt.union(NanoCondition.Filter('a', '<', 2))), (None, None, None, None))
+
+    def testRowFunction(self):
+        columns = [('t', 'a'), ('t', 'b'), ('u', 'a'), ('u', 'c')]
+        self.assertEqual(NanoCondition.columnIndices(columns), {'t.a': 0, 't.b': 1, 'u.a': 2, 'u.c': 3, 'b': 1, 'c': 3})
+
+        cond = NanoCondition.NanoCondition(
+            NanoQueries._QueryGrammar.tokenizeQuery("(t.a < u.a or c == 'x y') and not b in (1, 2)"))
+        satisfies = cond.rowFunction(columns)
+        cond.rowFunction(columns)
+        self.assertEqual(len(cond._rowFunctions), 1)
+        self.assertTrue(satisfies((1, 3, 2, 'z')))
+        self.assertTrue(satisfies((2, 3, 1, 'x y')))
+        self.assertFalse(satisfies((2, 3, 1, 'x')))
+        self.assertFalse(satisfies((1, 2, 2, 'x y')))
+
+        # Names which are ambiguous are left unresolved
+        cond = NanoCondition.NanoCondition(['a', '>', '1'])
+        self.assertRaises(NameError, cond.rowFunction(columns), (1, 2, 3, 4))
+        self.assertTrue(cond.rowFunction(columns[:2])((2, 0)))
+
+        # Placeholders are replaced by the parameters the function is requested with
+        cond = NanoCondition.NanoCondition(['t.a', '>', '?0', 'and', 'b', '==', '?1'])
+        self.assertTrue(cond.rowFunction(columns, (1, 'x'))((2, 'x', 0, 0)))
+        self.assertFalse(cond.rowFunction(columns, (2, 'x'))((2, 'x', 0, 0)))
+        self.assertEqual(len(cond._rowFunctions), 1)
+
+    def testLookupStrategy(self):
+        strategy = lambda q: NanoCondition.NanoCondition(NanoQueries._QueryGrammar.tokenizeQuery(q)).lookupStrategy(
+            set(['a', 'b']))
+        describe = lambda passes: passes and [dict((name, str(filt)) for name, filt in filters.items())
+                                              for filters in passes]
+
+        self.assertEqual(describe(strategy("a > 5 and b == 2 and c < 1")), [{'a': 'a > 5', 'b': 'b in [2]'}])
+        self.assertEqual(describe(strategy("not a > 5 and (a == 1 or a == 7)")), [{'a': 'a <= 5 and a in [1, 7]'}])
+        self.assertEqual(describe(strategy("a > 5 or (b == 2 and c < 1)")), [{'a': 'a > 5'}, {'b': 'b in [2]'}])
+        self.assertIsNone(strategy("a > 5 or c < 1"))
+        self.assertIsNone(strategy("not (a > 5 and b == 2)"))
+
+
+class TestNanoExecutor(NanoTests.NanoTestCase):
+
+    class Rows(NanoExecutor.Operator):
+        """ Operator producing a list of rows, recording how many have been pulled from it. """
+
+        def __init__(self, tableName, colNames, rows):
+            self.columns = [(tableName, colName) for colName in colNames]
+            self.rows = rows
+            self.numPulled = 0
+
+        def __iter__(self):
+            for row in self.rows:
+                self.numPulled += 1
+                yield row
+
+    def testOperators(self):
+        rows = self.Rows('t', ['a', 'b'], [(i, i % 3) for i in range(100)])
+
+        # Limits should only pull as many rows as they produce
+        plan = NanoExecutor.Limit(NanoExecutor.Filter(rows, NanoCondition.NanoCondition(['b', '==', '1'])), 3)
+        self.assertEqual(list(plan), [(1, 1), (4, 1), (7, 1)])
+        self.assertEqual(rows.numPulled, 8)
+
+        plan = NanoExecutor.Distinct(NanoExecutor.Project(NanoExecutor.Sort(rows, 't.b', True), ['b', 'b * 2']))
+        self.assertEqual(list(plan), [(2, 4), (1, 2), (0, 0)])
+
+        self.assertEqual(rows.columnIndex('b'), 1)
+        self.assertRaises(Exception, rows.columnIndex, 'c')
+
+    def testNestedLoopJoin(self):
+        left = self.Rows('l', ['id', 'v'], [(1, 'a'), (2, 'b'), (3, 'c')])
+        right = self.Rows('r', ['id', 'w'], [(1, 'x'), (3, 'y'), (3, 'z')])
+        condition = NanoCondition.NanoCondition(['l.id', '==', 'r.id'])
+
+        self.assertEqual(list(NanoExecutor.NestedLoopJoin(left, right, condition)),
+                         [(1, 'a', 1, 'x'), (3, 'c', 3, 'y'), (3, 'c', 3, 'z')])
+        self.assertEqual(list(NanoExecutor.NestedLoopJoin(left, right, condition, outer=True)),
+                         [(1, 'a', 1, 'x'), (2, 'b', None, None), (3, 'c', 3, 'y'), (3, 'c', 3, 'z')])
+
+        # Unqualified names are only available for columns which are not ambiguous
+        self.assertRaises(Exception, NanoExecutor.NestedLoopJoin(left, right, condition).columnIndex, 'id')
+        self.assertEqual(list(NanoExecutor.Project(NanoExecutor.NestedLoopJoin(left, right, condition), ['v', 'w'])),
+                         [('a', 'x'), ('c', 'y'), ('c', 'z')])
+
+    def testExternalSort(self):
+        random.seed(17)
+        rows = [(random.randint(0, 20), i) for i in range(500)]
+
+        spillFiles = []
+        oldSpillFile, oldBufferSize = NanoExecutor.SpillFile, NanoConfig.sort_buffer_size
+        class SpillFile(oldSpillFile):
+            def __init__(self, dbName):
+                oldSpillFile.__init__(self, dbName)
+                spillFiles.append(self)
+
+        NanoExecutor.SpillFile = SpillFile
+        try:
+            for bufferSize in (oldBufferSize, 2000):
+                NanoConfig.sort_buffer_size = bufferSize
+                for descending in (False, True):
+                    sort = NanoExecutor.Sort(self.Rows('t', ['a', 'b'], rows), 'a', descending, self.dbName)
+                    self.assertEqual(list(sort), sorted(rows, key=lambda row: row[0], reverse=descending))
+
+                self.assertEqual(len(spillFiles) > 1, bufferSize != oldBufferSize)
+
+            self.assertTrue(all(spillFile.fd.closed for spillFile in spillFiles))
+
+            # Rows are only sorted in memory when there is no database to write runs in
+            del spillFiles[:]
+            self.assertEqual(list(NanoExecutor.Sort(self.Rows('t', ['a', 'b'], rows), 'a')), sorted(rows))
+            self.assertEqual(spillFiles, [])
+
+            # Only a heap of the required rows is kept when sorting with a limit
+            for descending in (False, True):
+                sort = NanoExecutor.Sort(self.Rows('t', ['a', 'b'], rows), 'a', descending, self.dbName, 10)
+                self.assertEqual(list(sort), sorted(rows, key=lambda row: row[0], reverse=descending)[:10])
+            self.assertEqual(spillFiles, [])
+        finally:
+            NanoExecutor.SpillFile = oldSpillFile
+            NanoConfig.sort_buffer_size = oldBufferSize
+
+    def testAggregate(self):
+        tokens = NanoQueries._QueryGrammar.tokenizeQuery("sum(a) / count ( * ) + max((b))")
+        self.assertEqual([call[:3] for call in NanoExecutor.findAggregates(tokens)],
+                         [(0, 4, 'sum'), (5, 9, 'count'), (10, 16, 'max')])
+
+        random.seed(20)
+        rows = [(random.randint(0, 300), random.choice([None, 1, 2, 3])) for i in range(2000)]
+        expected = dict()
+        for a, b in rows:
+            group = expected.setdefault(a, [0, []])
+            group[0] += 1
+            group[1].extend([b] if b is not None else [])
+        expected = sorted((a, count, len(bs), sum(bs) if bs else None, min(bs) if bs else None, max(bs) if bs else None,
+                           sum(bs) / float(len(bs)) if bs else None) for a, (count, bs) in expected.items())
+
+        spillFiles = []
+        oldSpillFile, oldBufferSize = NanoExecutor.SpillFile, NanoConfig.group_buffer_size
+        class SpillFile(oldSpillFile):
+            def __init__(self, dbName):
+                oldSpillFile.__init__(self, dbName)
+                spillFiles.append(self)
+
+        NanoExecutor.SpillFile = SpillFile
+        try:
+            for bufferSize in (oldBufferSize, 2000):
+                NanoConfig.group_buffer_size = bufferSize
+                plan, expressions = NanoExecutor.planAggregate(
+                    self.Rows('t', ['a', 'b'], rows), ['a', 'count(*)', 'count(b)', 'sum(b)', 'min(b)', 'max(b)',
+                                                       'avg(b)'], ['a'], dbName=self.dbName)
+                self.assertEqual(expressions, ['a', '_agg0', '_agg1', '_agg2', '_agg3', '_agg4', '_agg5'])
+                self.assertEqual(sorted(plan), expected)
+                self.assertEqual(bool(spillFiles), bufferSize != oldBufferSize)
+        finally:
+            NanoExecutor.SpillFile = oldSpillFile
+            NanoConfig.group_buffer_size = oldBufferSize
+
+        self.assertTrue(all(spillFile.fd.closed for spillFile in spillFiles))
+
+        plan, expressions = NanoExecutor.planAggregate(self.Rows('t', ['a', 'b'], rows), ['max(b) - min(b) * ?0'],
+                                                       params=[2])
+        self.assertEqual(expressions, ['_agg0 - _agg1 * ?0'])
+        self.assertEqual(list(NanoExecutor.Project(plan, expressions, [2])), [(1,)])
+        self.assertRaises(Exception, NanoExecutor.planAggregate, self.Rows('t', ['a', 'b'], rows), ['b', 'sum(a)'])
+
+    def testHashJoin(self):
+        cond = lambda q: NanoCondition.NanoCondition(NanoQueries._QueryGrammar.tokenizeQuery(q))
+        leftColumns, rightColumns = [('l', 'id'), ('l', 'v')], [('r', 'id'), ('r', 'w')]
+        self.assertEqual(NanoExecutor.joinKeys(cond("l.id == r.id and v < w"), leftColumns, rightColumns), ([0], [0]))
+        self.assertEqual(NanoExecutor.joinKeys(cond("w == v and r.id == l.id"), leftColumns, rightColumns),
+                         ([1, 0], [1, 0]))
+        self.assertEqual(NanoExecutor.joinKeys(cond("l.id == v or l.id == r.id"), leftColumns, rightColumns), ([], []))
+        self.assertEqual(NanoExecutor.joinKeys(cond("id == r.id"), leftColumns, rightColumns), ([], []))
+
+        random.seed(15)
+        leftRows = [(random.randint(0, 50), i) for i in range(300)]
+        rightRows = [(random.randint(0, 50), i) for i in range(200)]
+        condition = cond("l.id == r.id and v % 3 != w % 3")
+
+        # Count the temporary files partitions are written to
+        spillFiles = []
+        oldSpillFile, oldBufferSize = NanoExecutor.SpillFile, NanoConfig.join_buffer_size
+        class SpillFile(oldSpillFile):
+            def __init__(self, dbName):
+                oldSpillFile.__init__(self, dbName)
+                spillFiles.append(self)
+
+        NanoExecutor.SpillFile = SpillFile
+        try:
+            for bufferSize in (oldBufferSize, 2000):
+                NanoConfig.join_buffer_size = bufferSize
+                for leftEstimate in (None, 1):
+                    for outer in (False, True):
+                        left = self.Rows('l', ['id', 'v'], leftRows)
+                        right = self.Rows('r', ['id', 'w'], rightRows)
+                        left.estimatedRows = left.estimatedCost = leftEstimate
+                        right.estimatedRows = right.estimatedCost = 10
+
+                        join = NanoExecutor.planJoin(left, right, condition, outer, dbName=self.dbName)
+                        self.assertIsInstance(join, NanoExecutor.HashJoin)
+                        self.assertEqual(join.buildLeft, leftEstimate is not None)
+                        expected = list(NanoExecutor.NestedLoopJoin(left, right, condition, outer))
+                        self.assertItemsEqual(list(join), expected)
+
+                self.assertEqual(bool(spillFiles), bufferSize != oldBufferSize)
+        finally:
+            NanoExecutor.SpillFile = oldSpillFile
+            NanoConfig.join_buffer_size = oldBufferSize
+
+        self.assertTrue(all(spillFile.fd.closed for spillFile in spillFiles))
+        self.assertIsInstance(NanoExecutor.planJoin(left, right, cond("l.id < r.id")), NanoExecutor.NestedLoopJoin)
+
+    def testConditionFilters(self):
+        condition = NanoCondition.NanoCondition(['a', '>', '5', 'and', '10', '>=', 't.a', 'and', 'b', '==', '2'])
+        filters = NanoExecutor.conditionFilters(condition, 't', ['a'])
+        self.assertEqual(filters.keys(), ['a'])
+        self.assertEqual((filters['a'].greaterThan, filters['a'].greaterThanEqual), (5, False))
+        self.assertEqual((filters['a'].lessThan, filters['a'].lessThanEqual), (10, True))
+
+        # Filters of or'd conditions need not hold for every row
+        condition = NanoCondition.NanoCondition(['a', '>', '5', 'or', 'b', '==', '2'])
+        self.assertEqual(NanoExecutor.conditionFilters(condition, 't', ['a', 'b']), {})
+
 
 class TestBlockCacheManager(NanoTests.NanoTestCase):
     tableName = "testIndexTable"
@@ -235,7 +476,7 @@ class TestBlockCacheManager(NanoTests.NanoTestCase):
 
     def setUp(self):
         NanoConfig.num_index_dirty_blocks = 4
-        NanoConfig.index_block_size = 29
+        NanoConfig.index_block_size = 45
 
         self.blocks = []
         self.blocks2 = []
@@ -333,6 +574,48 @@ class TestBlockCacheManager(NanoTests.NanoTestCase):
         self.fd.seek(0)
         self.assertIn("blk0", self.fd.read())
 
+    def testFlushCoalesced(self):
+        runs = []
+        writeRun = self.dirtyMgr._writeRun
+        def recordRun(address, blockStrings):
+            runs.append((address, len(blockStrings)))
+            writeRun(address, blockStrings)
+        self.dirtyMgr._writeRun = recordRun
+
+        # Add the blocks out of order, leaving a gap between the second and third block
+        self.blocks[2].address = 5 * NanoConfig.index_block_size
+        self.blocks[3].address = 6 * NanoConfig.index_block_size
+        for block in reversed(self.blocks):
+            self.dirtyMgr.addBlock(block)
+
+        self.dirtyMgr.flushAll()
+        self.assertEqual(runs, [(0, 2), (5 * NanoConfig.index_block_size, 2)])
+        self.assertEqual(len(self.dirtyMgr), 0)
+
+        for block in self.blocks:
+            self.fd.seek(block.address)
+            self.assertEqual(self.fd.read(NanoConfig.index_block_size), block.toString())
+
+    def testFlushOldest(self):
+        oldMaxDirty = NanoConfig.max_num_dirty_blocks
+        NanoConfig.max_num_dirty_blocks = 3
+
+        try:
+            for block in self.blocks:
+                self.dirtyMgr.addBlock(block)
+
+            self.assertEqual(len(self.dirtyMgr), 4)
+
+            # Exceeding max_num_dirty_blocks should flush the least recently used half of the dirty blocks
+            self.blocks2[0].address = 4 * NanoConfig.index_block_size
+            self.dirtyMgr.addBlock(self.blocks2[0])
+            self.assertItemsEqual(self.dirtyMgr.keys(), [b.address for b in self.blocks[2:] + self.blocks2[:1]])
+            self.assertIn(self.blocks[0].address, self.dirtyMgr.cleanDict)
+            self.assertIn(self.blocks[1].address, self.dirtyMgr.cleanDict)
+
+        finally:
+            NanoConfig.max_num_dirty_blocks = oldMaxDirty
+
 
     def testTruncate(self):
         self.assertEqual(len(self.dirtyMgr), 0)
@@ -345,6 +628,41 @@ class TestBlockCacheManager(NanoTests.NanoTestCase):
         for block in self.blocks:
             self.assertNotIn(block.address, self.dirtyMgr)
 
+    def testCleanBlocks(self):
+        oldCacheSize = NanoConfig.block_cache_size
+        NanoConfig.block_cache_size = 3 * NanoConfig.index_block_size
+
+        try:
+            for block in self.blocks:
+                self.dirtyMgr.addCleanBlock(block)
+
+            # The least recently used block should have been evicted
+            self.assertEqual(len(self.dirtyMgr), 0)
+            self.assertNotIn(self.blocks[0].address, self.dirtyMgr)
+            for block in self.blocks[1:]:
+                self.assertIn(block.address, self.dirtyMgr)
+            self.assertEqual(self.dirtyMgr.cleanSize, 3 * NanoConfig.index_block_size)
+
+            # Using a block should protect it from eviction
+            self.assertIs(self.dirtyMgr.getBlock(self.blocks[1].address), self.blocks[1])
+            self.dirtyMgr.addCleanBlock(self.blocks[0])
+            self.assertIn(self.blocks[1].address, self.dirtyMgr)
+            self.assertNotIn(self.blocks[2].address, self.dirtyMgr)
+
+            # Dirtying a clean block should supersede it
+            self.dirtyMgr.addBlock(self.blocks2[1])
+            self.assertEqual(len(self.dirtyMgr), 1)
+            self.assertNotIn(self.blocks2[1].address, self.dirtyMgr.cleanDict)
+            self.assertIs(self.dirtyMgr.getBlock(self.blocks2[1].address), self.blocks2[1])
+
+            # Flushing a dirty block should keep it cached as a clean block
+            self.dirtyMgr.flushAll()
+            self.assertEqual(len(self.dirtyMgr), 0)
+            self.assertIs(self.dirtyMgr.cleanDict[self.blocks2[1].address], self.blocks2[1])
+
+        finally:
+            NanoConfig.block_cache_size = oldCacheSize
+
 
 class TestDeletedBlockManager(NanoTests.NanoTestCase):
     tableName = "DelBlockTestTable"
@@ -365,6 +683,33 @@ class TestDeletedBlockManager(NanoTests.NanoTestCase):
 
         self.assertIsNone(self.delMgr.popRef())
 
+    def testBatchedWrites(self):
+        oldMaxDirtyRefs = NanoConfig.max_num_dirty_refs
+        NanoConfig.max_num_dirty_refs = 10
+
+        try:
+            # References should only be written to file once enough changes have been made
+            self.delMgr.addRefs(range(9))
+            self.delMgr.fd.seek(0, os.SEEK_END)
+            self.assertEqual(self.delMgr.fd.tell(), 0)
+
+            self.delMgr.addRef(9)
+            self.delMgr.fd.seek(0, os.SEEK_END)
+            self.assertEqual(self.delMgr.fd.tell(), 10 * NanoTools.DeletedBlockManager.POINTER_TYPE.size)
+
+            self.assertEqual(self.delMgr.popRefs(3), [9, 8, 7])
+            self.delMgr.addRefs([20, 21])
+            self.assertEqual(len(self.delMgr), 9)
+
+            # Closing the manager should write any outstanding changes
+            self.delMgr.close()
+            self.delMgr = NanoTools.DeletedBlockManager.DeletedBlockManager(self.dbName, self.tableName)
+            self.assertEqual(self.delMgr.popRefs(20), [21, 20, 6, 5, 4, 3, 2, 1, 0])
+            self.assertEqual(self.delMgr.popRefs(1), [])
+
+        finally:
+            NanoConfig.max_num_dirty_refs = oldMaxDirtyRefs
+
 
     def testTruncate(self):
         self.assertIsNone(self.delMgr.popRef())
@@ -392,3 +737,30 @@ class TestDeletedBlockManager(NanoTests.NanoTestCase):
             self.assertEqual(self.delMgr.popRef(), i)
 
         self.assertIsNone(self.delMgr.popRef())
+
+    def testBatchedWrites(self):
+        oldMaxDirtyRefs = NanoConfig.max_num_dirty_refs
+        NanoConfig.max_num_dirty_refs = 10
+
+        try:
+            # References should only be written to file once enough changes have been made
+            self.delMgr.addRefs(range(9))
+            self.delMgr.fd.seek(0, os.SEEK_END)
+            self.assertEqual(self.delMgr.fd.tell(), 0)
+
+            self.delMgr.addRef(9)
+            self.delMgr.fd.seek(0, os.SEEK_END)
+            self.assertEqual(self.delMgr.fd.tell(), 10 * NanoTools.DeletedBlockManager.POINTER_TYPE.size)
+
+            self.assertEqual(self.delMgr.popRefs(3), [9, 8, 7])
+            self.delMgr.addRefs([20, 21])
+            self.assertEqual(len(self.delMgr), 9)
+
+            # Closing the manager should write any outstanding changes
+            self.delMgr.close()
+            self.delMgr = NanoTools.DeletedBlockManager.DeletedBlockManager(self.dbName, self.tableName)
+            self.assertEqual(self.delMgr.popRefs(20), [21, 20, 6, 5, 4, 3, 2, 1, 0])
+            self.assertEqual(self.delMgr.popRefs(1), [])
+
+        finally:
+            NanoConfig.max_num_dirty_refs = oldMaxDirtyRefs
@@ -99,6 +99,19 @@ class TestNanoTypes(NanoTests.NanoTestCase):
             self.assertEqual(c.fromString(c.toString(None)), None)
             self.assertRaises(ValueError, c.toString, 54)
 
+    def testComposite(self):
+        c = NanoTypes.Composite([NanoTypes.getType("int4"), NanoTypes.getType("char3"), NanoTypes.getType("uint2")])
+        self.assertEqual(c.size, 9)
+
+        self.assertEqual(c.isValid((1, "abc", 5)), True)
+        self.assertEqual(c.isValid((1, None, 5)), True)
+        self.assertEqual(c.isValid((1, "abc")), False)
+        self.assertEqual(c.isValid([1, "abc", 5]), False)
+        self.assertEqual(c.isValid((1, 2, 5)), False)
+        self.assertEqual(c.fromString(c.toString((-7, "ab", 300))), (-7, "ab", 300))
+        self.assertEqual(c.fromString(c.toString((-7, None, 300))), (-7, None, 300))
+        self.assertRaises(ValueError, c.toString, (1, 2, 3))
+
     '''def testVarchar(self): # TODO
         fd = NanoIO.File.createPtrFstr(self.dbName, 'NanoTypes', 'Varchar')
 
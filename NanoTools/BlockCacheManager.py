@@ -10,28 +10,37 @@ class BlockCacheManager:
     """
     Class which provides caching functionality; operates entirely in memory.
 
-    If using this manager, before any reads from the file one should first
-    check the manager to see if a dirty version of the block exists.  Ie: the file
-    may not have the most updated form of the block.
+    Acts as a buffer pool for the blocks of a file, holding two kinds of blocks:
+        Dirty blocks - Blocks which have been modified, and whose changes have not yet been written to the file.
+                       Up to NanoConfig.max_num_dirty_blocks are held before the least recently used half of them are
+                       written to the file.
+        Clean blocks - Blocks which are identical to their form in the file; either read from the file and handed to
+                       us, or dirty blocks which have since been flushed.  Up to NanoConfig.block_cache_size bytes of
+                       clean blocks are held, evicting the least recently used when we exceed this.
+
+    If using this manager, before any reads from the file one should first check the manager to see if the block is
+    cached.  Ie: the file may not have the most updated form of the block, and if it does there's no need to read it.
 
     Requires the block objects it handles to extend the CacheableBlock class.
     """
 
-    dirtyDict = None # Maps addressess to blocks
+    dirtyDict = None # Maps addressess to dirty blocks, in least to most recently used order
+    cleanDict = None # Maps addressess to clean blocks, in least to most recently used order
+    cleanSize = None # Number of bytes of clean blocks in cleanDict
     fd = None        # File descriptor used to flush blocks to the file
 
     def __init__(self, fd):
         self.fd = fd
-        self.dirtyDict = collections.OrderedDict()
+        self.truncate()
 
     def __contains__(self, val):
         """
         Data model function for handling `in`.  Keyed on addresses.
 
-        Inputs: val - The address to test if is dirty.
+        Inputs: val - The address to test if is cached, whether dirty or clean.
         """
 
-        return val in self.dirtyDict
+        return val in self.dirtyDict or val in self.cleanDict
 
 
     def __len__(self):
@@ -50,6 +59,16 @@ class BlockCacheManager:
         return self.dirtyDict.items()
 
 
+    # Private methods
+    def _removeClean(self, address):
+        """ Removes the clean block at the given address from the cache, if it is in it. """
+
+        block = self.cleanDict.pop(address, None)
+        if block is not None:
+            self.cleanSize -= block.blockSize
+
+
+    # Public methods
     def addBlock(self, block):
         """
         Writes a block to the manager indicating it is dirty.
@@ -61,35 +80,105 @@ class BlockCacheManager:
         if not isinstance(block, CacheableBlock):
             raise TypeError("%s does not subclass CacheableBlock" % block)
 
-        if block.address in self:
+        self._removeClean(block.address)
+
+        if block.address in self.dirtyDict:
             del self.dirtyDict[block.address]
 
         elif len(self) > NanoConfig.max_num_dirty_blocks:
-            self.flushBlock()
+            self.flushOldest()
 
         self.dirtyDict[block.address] = block
 
 
+    def addCleanBlock(self, block):
+        """
+        Adds a block which is identical to its form in the file to the manager; evicting the least recently used clean
+        blocks if this brings us over NanoConfig.block_cache_size bytes of clean blocks.
+
+        Inputs: block - The block to add to the manager.
+        """
+
+        if not isinstance(block, CacheableBlock):
+            raise TypeError("%s does not subclass CacheableBlock" % block)
+
+        # A dirty version of the block supersedes the one given
+        if block.address in self.dirtyDict:
+            return
+
+        self._removeClean(block.address)
+        self.cleanDict[block.address] = block
+        self.cleanSize += block.blockSize
+
+        while self.cleanSize > NanoConfig.block_cache_size and self.cleanDict:
+            self._removeClean(next(iter(self.cleanDict)))
+
+
     def getBlock(self, address):
-        if address not in self:
-            raise Exception("Given address %d not in dirty block manager" % address)
-        self.dirtyDict[address] = self.dirtyDict.pop(address)
-        return self.dirtyDict[address]
+        if address in self.dirtyDict:
+            self.dirtyDict[address] = self.dirtyDict.pop(address)
+            return self.dirtyDict[address]
+
+        if address in self.cleanDict:
+            self.cleanDict[address] = self.cleanDict.pop(address)
+            return self.cleanDict[address]
 
+        raise Exception("Given address %d not in block cache manager" % address)
 
-    def flushBlock(self, address=None): # TODO be smart about combining blocks
+
+    def _writeRun(self, address, blockStrings):
+        """
+        Writes a number of adjacent blocks to the file in a single write.
+
+        Inputs: address      - The address of the first block in the run.
+                blockStrings - The string representations of the blocks in the run, in address order.
+        """
+
+        self.fd.seek(address)
+        self.fd.write(''.join(blockStrings))
+
+
+    def _flushAddresses(self, addresses):
+        """
+        Writes the dirty blocks at the given addresses to the file, in address order; merging blocks which are adjacent
+        in the file into single writes.  The flushed blocks are retained as clean blocks.
+
+        Inputs: addresses - An iterable of addresses of dirty blocks to flush.
+        """
+
+        blocks = sorted((self.dirtyDict.pop(address) for address in addresses), key=lambda block: block.address)
+
+        runStart = 0
+        for i in range(1, len(blocks) + 1):
+            if i == len(blocks) or blocks[i].address != blocks[i - 1].address + blocks[i - 1].blockSize:
+                self._writeRun(blocks[runStart].address, [block.toString() for block in blocks[runStart:i]])
+                runStart = i
+
+        # Now that the file is up to date with the blocks, keep them around as clean blocks
+        for block in blocks:
+            self.addCleanBlock(block)
+
+
+    def flushBlock(self, address=None):
         if address is None:
             address = self.dirtyDict.keys()[0]
-        elif address not in self:
+        elif address not in self.dirtyDict:
             raise Exception("Given address: %d not in dirty block manager" % address)
 
-        self.dirtyDict.pop(address)._write(self.fd)
+        self._flushAddresses([address])
+
+
+    def flushOldest(self):
+        """ Flushes the least recently used half of the dirty blocks to the file. """
+
+        self._flushAddresses(self.dirtyDict.keys()[:max(1, len(self.dirtyDict) / 2)])
 
 
     def flushAll(self):
-        for blockAddress in self.dirtyDict:
-            self.flushBlock(blockAddress)
+        self._flushAddresses(self.dirtyDict.keys())
 
 
     def truncate(self):
         self.dirtyDict = collections.OrderedDict()
+        self.cleanDict = collections.OrderedDict()
+        self.cleanSize = 0
@@ -1,22 +1,37 @@
-# Standard imports
-import os
-
 # Project imports
 import NanoTypes
+import NanoConfig
 import NanoIO.File
 
 POINTER_TYPE = NanoTypes.Uint(8)
 
 class DeletedBlockManager:
+    """
+    Class which keeps a stack of references to deleted blocks, so that they may be reused.
+
+    The stack is held in memory, and is written to its file in batches; once NanoConfig.max_num_dirty_refs changes have
+    been made to it, and when the manager is flushed or closed.
+    """
+
     fd = None
     name = None
     db = None
+    refs = None       # The stack of references, most recently added last
+    syncedLen = None  # The number of references at the bottom of self.refs which are unchanged in our file
+    numChanges = None # The number of changes made to self.refs since it was last written to our file
 
     def __init__(self, db, name):
         self.db = db
         self.name = name
         self.fd = NanoIO.File.openReadWriteFile(NanoIO.File.delMgrPath(db, name))
 
+        self.fd.seek(0)
+        refString = self.fd.read()
+        self.refs = [POINTER_TYPE.fromString(refString[idx: idx + POINTER_TYPE.size])
+                     for idx in range(0, len(refString) - POINTER_TYPE.size + 1, POINTER_TYPE.size)]
+        self.syncedLen = len(self.refs)
+        self.numChanges = 0
+
 
     def __del__(self):
         try:
@@ -25,25 +40,78 @@ class DeletedBlockManager:
             pass
 
 
+    def __len__(self):
+        return len(self.refs)
+
+
+    # Private methods
+    def _changed(self, numChanges):
+        """ Records that changes have been made to self.refs, writing it to our file if enough have been made. """
+
+        self.syncedLen = min(self.syncedLen, len(self.refs))
+        self.numChanges += numChanges
+        if self.numChanges >= NanoConfig.max_num_dirty_refs:
+            self.flush()
+
+
+    # Public methods
+    def flush(self):
+        """ Writes the references which have changed since we were last flushed to our file. """
+
+        self.fd.seek(self.syncedLen * POINTER_TYPE.size)
+        self.fd.truncate()
+        self.fd.write("".join([POINTER_TYPE.toString(ref) for ref in self.refs[self.syncedLen:]]))
+        self.fd.flush()
+        self.syncedLen = len(self.refs)
+        self.numChanges = 0
+
+
     def truncate(self):
+        self.refs = []
+        self.syncedLen = 0
+        self.numChanges = 0
         self.fd.seek(0)
         self.fd.truncate()
 
 
     def close(self):
+        if not self.fd.closed:
+            self.flush()
         self.fd.close()
 
 
     def addRef(self, val):
-        self.fd.write(POINTER_TYPE.toString(val))
+        self.refs.append(val)
+        self._changed(1)
+
+
+    def addRefs(self, vals):
+        """ Adds many references; the last of which will be the first to be popped. """
+
+        self.refs.extend(vals)
+        self._changed(len(vals))
 
 
     def popRef(self):
-        self.fd.seek(0, os.SEEK_END)
-        if self.fd.tell() == 0:
+        if not self.refs:
             return None
-        self.fd.seek(-POINTER_TYPE.size, os.SEEK_END)
-        ret = self.fd.read()
-        self.fd.seek(-POINTER_TYPE.size, os.SEEK_END)
-        self.fd.truncate()
-        return POINTER_TYPE.fromString(ret)
+
+        ref = self.refs.pop()
+        self._changed(1)
+        return ref
+
+
+    def popRefs(self, num):
+        """
+        Pops up to num references at once.
+
+        Returns a list of the references popped, in the order that repeated calls to popRef would have returned them.
+        """
+
+        if num <= 0 or not self.refs:
+            return []
+
+        popped = self.refs[-num:][::-1]
+        del self.refs[-num:]
+        self._changed(len(popped))
+        return popped
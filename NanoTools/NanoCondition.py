@@ -2,11 +2,78 @@
 File containing tools used by NanoIndices & NanoQueries for the handling and usage of conditions in queries.
 """
 
+# Standard imports
+import re
+
 # Globals
 BINARY_OPERATORS = ("+", "-", "/", "*", "%")
 LOGICAL_OPERATORS = ("!=", "<=", ">=", "==", "<", ">", "in")
 UNARY_NEGATIONS = ("not",)
 BINARY_CONJUNCTIONS = ("and", "or")
+ROW_NAME = "_row"       # Name of the argument holding the row a compiled row function is evaluated against
+PARAMS_NAME = "_params" # Name of the variable holding the parameters bound to a query when it is evaluated
+PARAM_RE = re.compile(r"^\?(\d+)$") # Matches a numbered placeholder token, ?N, for the N'th parameter of a query
+
+
+###
+# Helper functions
+###
+def columnIndices(columns):
+    """
+    Returns a dictionary mapping the names which may refer to each value of a row to the index of the value in the row.
+    Values may be referred to as `table.col`, or as `col` if no other value in the row has the same name.
+
+    Inputs: columns - A list of (tableName, colName) tuples describing each value in the row.  tableName may be None.
+    """
+
+    indices = dict()
+    ambiguous = set()
+    for idx, (tableName, colName) in enumerate(columns):
+        if tableName is not None:
+            indices["%s.%s" % (tableName, colName)] = idx
+        if colName in indices or colName in ambiguous:
+            ambiguous.add(colName)
+            indices.pop(colName, None)
+        else:
+            indices[colName] = idx
+
+    return indices
+
+
+def tokensToString(tokens, indices=None):
+    """
+    Joins a list of tokens into a string suitable for passing to eval.  Placeholder tokens, ?N, are replaced by the N'th
+    value of the tuple of parameters named PARAMS_NAME.
+
+    Inputs: tokens  - The list of tokens to join.
+            indices - An optional dictionary mapping names to indices within a row, as returned by columnIndices.
+                      Tokens it contains are replaced by an index into the row named ROW_NAME; see rowFunction.
+    """
+
+    indices = indices or {}
+    strings = []
+    for tok in tokens:
+        tok = str(tok)
+        param = PARAM_RE.match(tok)
+        if param:
+            strings.append("%s[%s]" % (PARAMS_NAME, param.group(1)))
+        elif tok in indices:
+            strings.append("%s[%d]" % (ROW_NAME, indices[tok]))
+        else:
+            strings.append(tok)
+
+    return " ".join(strings)
+
+
+def rowFunction(expression):
+    """
+    Compiles an expression returned by tokensToString (or toString) with indices into a function accepting a tuple of
+    parameters, which returns a function accepting a row tuple that returns the value of the expression for that row.
+    This allows an expression to be compiled once, then evaluated with any number of different parameters.
+    """
+
+    return eval("lambda %s: lambda %s: (%s)" % (PARAMS_NAME, ROW_NAME, expression))
+
 
 
 ###
@@ -44,9 +111,11 @@ class EvalStatement:
         except NotImplementedError:
             return repr(self)
 
-    def toString(self):
+    def toString(self, indices=None):
         """
         Returns a string representation of this class, suitable for passing to eval.
+
+        Inputs: indices - An optional dictionary mapping names to indices within a row; see tokensToString.
         """
 
         raise NotImplementedError
@@ -75,11 +144,12 @@ class BaseStatement(EvalStatement):
     Super class of statements.
     """
 
-    def _getFilters(self, filterNames):
+    def _getFilters(self, filterNames, params=()):
         """
         Returns a list of filters which must be used for passes over an index.
 
         Inputs: filterNames - A set of tokens which can be filtered upon.
+                params      - A tuple of the parameters bound to the query, for any placeholders in the statement.
         """
 
         raise NotImplementedError
@@ -133,15 +203,92 @@ class Filter:
         if opr in self._equalFlag:
             setattr(self, *(self._equalFlag[opr]))
 
+    def __str__(self):
+        parts = []
+        if self.greaterThan is not None:
+            parts.append("%s %s %r" % (self.filterName, ">=" if self.greaterThanEqual else ">", self.greaterThan))
+        if self.lessThan is not None:
+            parts.append("%s %s %r" % (self.filterName, "<=" if self.lessThanEqual else "<", self.lessThan))
+        if self.inItems is not None:
+            parts.append("%s in %r" % (self.filterName, self.inItems))
+        return " and ".join(parts)
+
+
+    def withinBounds(self, value):
+        """ Returns whether or not the given value lies within the range (ignoring any inItems) of this filter. """
+
+        if self.greaterThan is not None and (value < self.greaterThan if self.greaterThanEqual else
+                                             value <= self.greaterThan):
+            return False
+        if self.lessThan is not None and (value > self.lessThan if self.lessThanEqual else value >= self.lessThan):
+            return False
+        return True
+
+
     def inverse(self):
         """
-        Inverses all the filters on this instance.  Used when a NegateStatement nots a filter.
+        Inverses the filter on this instance.  Used when a NegateStatement nots a filter.
+
+        Only filters bounded on a single side can be inversed into another filter, ie: not (a < 5) is a >= 5, whereas
+        not (1 < a < 5) and not (a == 5) cannot be represented by a single filter.
+
+        Returns: This filter, inversed; or None if it cannot be inversed.
         """
 
+        # We can't filter on =='s if we've inversed # TODO record !='s so we can flip them
+        if self.inItems is not None or (self.greaterThan is None) == (self.lessThan is None):
+            return None
+
+        greaterThanEqual, lessThanEqual = self.greaterThanEqual, self.lessThanEqual
         self.greaterThan, self.lessThan = self.lessThan, self.greaterThan
-        self.greaterThanEqual, self.lessThanEqual = self.lessThanEqual, self.greaterThanEqual
+        self.greaterThanEqual = None if self.greaterThan is None else not lessThanEqual
+        self.lessThanEqual = None if self.lessThan is None else not greaterThanEqual
 
-        # We can't filter on =='s if we've inversed # TODO record !='s so we can flip them
+        return self
+
+
+    def union(self, otherFilter):
+        """
+        Merges another filter into this filter; such that the resulting filter passes any values which satisfy either.
+        The resulting filter may pass values that satisfy neither, as the union of two ranges is widened to a single
+        range covering both.
+        """
+
+        # Ensure the filterNames are the same
+        if otherFilter.filterName != self.filterName:
+            raise Exception("Cannot merge filter: %s into self: %s" % (otherFilter.filterName, self.filterName))
+
+        filters = (self, otherFilter)
+
+        # If both filters only pass specific values, pass the values of either
+        if all(filt.inItems is not None and filt.greaterThan is None and filt.lessThan is None for filt in filters):
+            self.inItems = self.inItems + [item for item in otherFilter.inItems if item not in self.inItems]
+            return self
+
+        # Otherwise find the lowest lower bound and highest upper bound of the two filters; treating the smallest and
+        # largest specific value passed by a filter as a bound if it has no other
+        bounds = []
+        for filt in filters:
+            lower = (filt.greaterThan, bool(filt.greaterThanEqual))
+            upper = (filt.lessThan, bool(filt.lessThanEqual))
+            if filt.inItems:
+                if lower[0] is None:
+                    lower = (min(filt.inItems), True)
+                if upper[0] is None:
+                    upper = (max(filt.inItems), True)
+            bounds.append((lower, upper))
+
+        lowers, uppers = zip(*bounds)
+        if any(value is None for value, equal in lowers):
+            self.greaterThan, self.greaterThanEqual = None, None
+        else:
+            self.greaterThan = min(value for value, equal in lowers)
+            self.greaterThanEqual = any(equal for value, equal in lowers if value == self.greaterThan)
+        if any(value is None for value, equal in uppers):
+            self.lessThan, self.lessThanEqual = None, None
+        else:
+            self.lessThan = max(value for value, equal in uppers)
+            self.lessThanEqual = any(equal for value, equal in uppers if value == self.lessThan)
         self.inItems = None
 
         return self
@@ -149,7 +296,7 @@ class Filter:
 
     def update(self, otherFilter):
         """
-        Merges another filter into this filter.
+        Merges another filter into this filter; such that the resulting filter only passes values which satisfy both.
         """
 
         # Ensure the filterNames are the same
@@ -166,9 +313,7 @@ class Filter:
             if self.inItems is None:
                 self.inItems = otherFilter.inItems
             else:
-                for item in otherFilter.inItems:
-                    if item not in self.inItems:
-                        self.inItems.append(item)
+                self.inItems = [item for item in self.inItems if item in otherFilter.inItems]
 
         return self
 
@@ -204,37 +349,41 @@ class Statement(BaseStatement):
                 invalidSyntax += " ".join([str(tok) for tok in right])
             raise ConditionParsingException("Invalid Syntax: %s" % invalidSyntax)
 
-    def toString(self):
+    def toString(self, indices=None):
         if self.opr:
-            return "((%s) %s (%s))" % (" ".join([str(tok) for tok in self.left]),
-                                       self.opr,
-                                       " ".join([str(tok) for tok in self.right]))
+            return "((%s) %s (%s))" % (tokensToString(self.left, indices), self.opr,
+                                       tokensToString(self.right, indices))
         else:
-            return " ".join([str(tok) for tok in self.left])
+            return tokensToString(self.left, indices)
 
-    def _getFilters(self, filterNames):
+    def _getFilters(self, filterNames, params=()):
         # Ensure our operator is filterable
         if self.opr not in ('>', '<', '<=', '>=', '==', 'in'):
             return []
 
         # Determine if either our right or left is a filterable name
+        opr = self.opr
         if len(self.left) == 1 and self.left[0] in filterNames:
             filterName = self.left[0]
-            filterValue = " ".join([str(tok) for tok in self.right])
-        elif len(self.right) == 1 and self.right[0] in filterNames:
+            filterValue = tokensToString(self.right)
+        elif len(self.right) == 1 and self.right[0] in filterNames and opr != 'in':
             filterName = self.right[0]
-            filterValue = " ".join([str(tok) for tok in self.left])
+            filterValue = tokensToString(self.left)
+            # The name is on the right of the operator; mirror it so that it reads as though it were on the left
+            opr = {'>': '<', '<': '>', '>=': '<=', '<=': '>='}.get(opr, opr)
         else:
             return []
 
-        # Ensure that the other side is a constant; ie it does not require any name mappings to evaluate
+        # Ensure that the other side is a constant; ie it does not require any name mappings (or parameters which were
+        # not given) to evaluate.  Builtins are hidden, so that a column named like one (eg: id) is not mistaken for it
         try:
-            filterValue = eval(filterValue)
-        except NameError:
+            filterValue = eval(filterValue, {'__builtins__': {'True': True, 'False': False, 'None': None},
+                                             PARAMS_NAME: tuple(params)})
+        except (NameError, IndexError):
             return []
 
         # If everything checked out, return a filter
-        return [Filter(filterName, self.opr, filterValue)]
+        return [Filter(filterName, opr, filterValue)]
 
 
 class NegateStatement(BaseStatement):
@@ -247,11 +396,16 @@ class NegateStatement(BaseStatement):
     def __init__(self, statement):
         self.statement = statement
 
-    def toString(self):
-        return "not (%s)" % self.statement.toString()
+    def toString(self, indices=None):
+        return "not (%s)" % self.statement.toString(indices)
+
+    def _getFilters(self, filterNames, params=()):
+        # Only the filter of a single statement can be inversed; the inverse of and'd or or'd filters is not a filter
+        if not isinstance(self.statement, Statement):
+            return []
 
-    def _getFilters(self, filterName):
-        return [filt.inverse() for filt in self.statement._getFilters()]
+        filters = [filt.inverse() for filt in self.statement._getFilters(filterNames, params)]
+        return [filt for filt in filters if filt is not None]
 
 
 class OrStatement(BaseStatement):
@@ -264,18 +418,24 @@ class OrStatement(BaseStatement):
     def __init__(self, *statements):
         self.statements = statements
 
-    def toString(self):
-        return " or ".join([statement.toString() for statement in self.statements])
+    def toString(self, indices=None):
+        return " or ".join(["(%s)" % statement.toString(indices) for statement in self.statements])
 
-    def _getFilters(self, filterNames):
-        filters = dict()
+    def _getFilters(self, filterNames, params=()):
+        # A value must be filtered by a name in every or'd statement for the name to be filtered upon
+        filters = None
         for statement in self.statements:
-            for filt in statement._getFilters(filterNames):
-                if filt.filterName in filters:
-                    filters[filt.filterName].update(filt)
-                else:
-                    filters[filt.filterName] = filt
-        return filters.values()
+            statementFilters = dict()
+            for filt in statement._getFilters(filterNames, params):
+                statementFilters[filt.filterName] = filt
+
+            if filters is None:
+                filters = statementFilters
+            else:
+                filters = dict((name, filters[name].union(statementFilters[name]))
+                               for name in filters if name in statementFilters)
+
+        return filters.values() if filters else []
 
 class AndStatement(BaseStatement):
     """
@@ -287,13 +447,13 @@ class AndStatement(BaseStatement):
     def __init__(self, *statements):
         self.statements = statements
 
-    def toString(self):
-        return " and ".join([statement.toString() for statement in self.statements])
+    def toString(self, indices=None):
+        return " and ".join(["(%s)" % statement.toString(indices) for statement in self.statements])
 
-    def _getFilters(self, filterNames):
+    def _getFilters(self, filterNames, params=()):
         filters = dict()
         for statement in self.statements:
-            for filt in statement._getFilters(filterNames):
+            for filt in statement._getFilters(filterNames, params):
                 if filt.filterName in filters:
                     filters[filt.filterName].update(filt)
                 else:
@@ -310,6 +470,7 @@ class NanoCondition:
     """
 
     mainStatement = None # An instance of AndStatement, OrStatement or BaseStatement for this condition.
+    _rowFunctions = None # A dictionary mapping tuples of columns to functions evaluating this condition against rows
     _statementDict = {'and': AndStatement, 'or': OrStatement, 'not': NegateStatement}
 
     def __init__(self, tokens):
@@ -320,6 +481,7 @@ class NanoCondition:
         """
 
         self.mainStatement = self.parse(tokens)
+        self._rowFunctions = dict()
 
 
     def _findMatchedBracket(self, tokens):
@@ -498,11 +660,47 @@ class NanoCondition:
         return statements[0]
 
 
-    def lookupStrategy(self): # TODO
+    def rowFunction(self, columns, params=()):
+        """
+        Returns a function accepting a row tuple, which returns whether or not the row satisfies this condition.  Names
+        of values in the row are resolved to indices within it when the function is compiled, rather than each time it
+        is called; the function is compiled once for each layout of columns it is requested for.
+
+        Inputs: columns - A list of (tableName, colName) tuples describing each value of the rows; see columnIndices.
+                params  - A tuple of the parameters bound to the query, for any placeholders in this condition.
+        """
+
+        key = tuple(columns)
+        if key not in self._rowFunctions:
+            self._rowFunctions[key] = rowFunction(self.mainStatement.toString(columnIndices(columns)))
+
+        return self._rowFunctions[key](tuple(params))
+
+
+    def lookupStrategy(self, filterNames, params=()):
         """
-        Returns a list of dictionaries, where each indicates a pass over the index that must be made, filters that
-        should be used to restrict the number of tuples that needed to be considered for each pass, and the condition
-        that each tuple considered in the pass must satisfy.  
+        Returns a list of dictionaries, where each indicates a pass over the indices that must be made, and the filters
+        that should be used to restrict the number of tuples that need to be considered for each pass.  Every tuple
+        satisfying this condition satisfies all the filters of at least one pass; though the tuples found by the passes
+        must still be checked against the condition itself.
+
+        If this condition is or'd, a pass is made for each of the or'd statements; otherwise a single pass is made.
+
+        Inputs: filterNames - A set of tokens which can be filtered upon.
+                params      - A tuple of the parameters bound to the query, for any placeholders in this condition.
+
+        Returns: A list of dictionaries mapping filter names to NanoCondition.Filters, or None if there are tuples which
+                 could satisfy this condition without satisfying any filters.  (ie, all tuples must be considered)
         """
 
-        filters = self.mainStatement._getFilters()
+        statements = self.mainStatement.statements if isinstance(self.mainStatement, OrStatement) \
+                     else [self.mainStatement]
+
+        passes = []
+        for statement in statements:
+            filters = dict((filt.filterName, filt) for filt in statement._getFilters(filterNames, params))
+            if not filters:
+                return None
+            passes.append(filters)
+
+        return passes
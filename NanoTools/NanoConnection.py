@@ -3,9 +3,10 @@ File containing a connection class which can be instantiated and used to access
 """
 
 # Standard imports
-import collections
+import collections, itertools
 
 # Project imports
+import NanoConfig
 import NanoIO.Table
 import NanoQueries
 import NanoQueries._QueryGrammar
@@ -39,14 +40,64 @@ def parseQuery(query):
 
 
 class Result:
-    rowcount = None
-    rows = None
+    """
+    The result of executing a query.  Rows may be produced lazily as they are fetched from the result, in which case the
+    query only does as much work as is required to produce the rows actually fetched.
+    """
 
-    def __init__(self, rows, rowcount=None):
-        self.rows = rows
+    rowcount = None # The number of rows in or affected by the result; -1 if it cannot be known until rows are fetched
+    rows = None     # An iterator over the rows of the result which have not yet been fetched
+    columns = None  # A list of the names of the values in each row, if the result has rows
+
+    def __init__(self, rows=(), rowcount=None, columns=None):
+        self.rows = iter(rows)
         self.rowcount = rowcount
+        self.columns = columns
         if self.rowcount is None:
-            self.rowcount = len(rows)
+            self.rowcount = len(rows) if hasattr(rows, '__len__') else -1
+
+    def __iter__(self):
+        return self.rows
+
+    def fetchone(self):
+        """ Returns the next row of the result, or None if there are no rows remaining. """
+
+        return next(self.rows, None)
+
+    def fetchmany(self, size=1):
+        """ Returns a list of up to size of the next rows of the result. """
+
+        return list(itertools.islice(self.rows, size))
+
+    def fetchall(self):
+        """ Returns a list of all the remaining rows of the result. """
+
+        return list(self.rows)
+
+
+class PreparedQuery:
+    """
+    A query which has been parsed once by NanoConnection.prepare, and may be executed any number of times.  Any ?
+    placeholders in the query are replaced by the parameters given each time it is executed.
+    """
+
+    connection = None # The NanoConnection which prepared this query
+    query = None      # The parsed NanoQueries query
+
+    def __init__(self, connection, query):
+        self.connection = connection
+        self.query = query
+
+    def execute(self, params=()):
+        """
+        Executes this query.
+
+        Inputs: params - A sequence of values for the placeholders in the query; one for each placeholder.
+
+        Returns: A NanoConnection.Result.
+        """
+
+        return self.connection._execute(self.query, params)
 
 
 class NanoConnection:
@@ -54,13 +105,16 @@ class NanoConnection:
     dbName = None  # Name of the currently selected database, if one is selected. Else None
 
     # Private Attributes
-    _schemas = None # Dictionary mapping database names to dictionaries, mapping table names to TableIOs
+    _schemas = None    # Dictionary mapping database names to dictionaries, mapping table names to TableIOs
+    _queryCache = None # An OrderedDict mapping query strings to parsed queries; least recently used first
+    _params = ()       # A tuple of the parameters bound to the query currently being executed
 
     # Data Model methods
     def __init__(self, dbName=None):
         if dbName is not None:
             self.selectDB(dbName)
         self._schemas = collections.defaultdict(dict)
+        self._queryCache = collections.OrderedDict()
 
     def __enter__(self):
         return self
@@ -86,6 +140,43 @@ class NanoConnection:
         return self._schemas[dbName][tableName]
         
 
+    def _parseQuery(self, query):
+        """
+        Returns the parsed form of the given query string.  Parsed queries are kept in an LRU cache of up to
+        NanoConfig.query_cache_size queries, so that a query executed repeatedly is only parsed once.
+        """
+
+        if query in self._queryCache:
+            queryObj = self._queryCache.pop(query)
+        else:
+            queryObj = parseQuery(query)
+            if queryObj is None:
+                raise Exception("Unrecognized query: %s" % query)
+
+        if NanoConfig.query_cache_size > 0:
+            self._queryCache[query] = queryObj
+            while len(self._queryCache) > NanoConfig.query_cache_size:
+                self._queryCache.popitem(last=False)
+
+        return queryObj
+
+
+    def _execute(self, queryObj, params=()):
+        """ Executes a parsed query with the given parameters, returning a Result. """
+
+        params = tuple(params)
+        if len(params) != queryObj.numParams:
+            raise Exception("Query expects %d parameters; %d given" % (queryObj.numParams, len(params)))
+
+        self._params = params
+        try:
+            result = queryObj.executeQuery(self)
+        finally:
+            self._params = ()
+
+        return Result(**result) if result is not None else Result()
+
+
     def _parseName(self, name):
         if name.count(".") == 1:
             return name.split('.')
@@ -95,9 +186,26 @@ class NanoConnection:
 
 
     # Public methods
-    def execute(self, query):
-        queryObj = parseQuery(query)
-        return queryObj.executeQuery(self) # TODO handle wrapping in Result instance
+    def execute(self, query, params=()):
+        """
+        Executes a query.
+
+        Inputs: query  - The query string to execute.
+                params - A sequence of values for any ? placeholders in the query; one for each placeholder.
+
+        Returns: A NanoConnection.Result.
+        """
+
+        return self._execute(self._parseQuery(query), params)
+
+
+    def prepare(self, query):
+        """
+        Parses a query once, returning a PreparedQuery which may be executed any number of times with different
+        parameters for its ? placeholders.  Ie: conn.prepare("select name from people where id == ?").execute([4])
+        """
+
+        return PreparedQuery(self, self._parseQuery(query))
         
 
     def close(self, dbNames=None):
@@ -0,0 +1,1332 @@
+"""
+File containing the operators used to execute queries.
+
+Each operator is an iterable over the rows it produces, where each row is a tuple of values.  Operators are composed into
+a tree, and rows are lazily pulled up through it as they are consumed; so a query only does as much work as is required
+to produce the rows which are actually fetched from it.
+
+Each operator also records an estimate of the number of rows it produces and the cost of producing them, which are used
+to choose between the ways a table may be accessed and are shown by EXPLAIN.  Costs are relative to the cost of reading
+a single row while scanning a table file in order.
+"""
+
+# Standard imports
+import collections, heapq, itertools, operator, sys, cPickle
+
+# Project imports
+import NanoConfig
+import NanoIO.File
+import NanoTools.NanoCondition as NanoCondition
+import NanoQueries._QueryGrammar as QueryGrammar
+
+# Globals
+POSITION_COLUMN = '_pos' # Name of the column holding the position of each row, for scans asked to produce positions
+
+SEQUENTIAL_ROW_COST = 1.0 # Cost of reading a row while scanning the table file in order
+SORTED_ROW_COST = 2.0     # Cost of reading a row while reading a set of rows in order of position
+RANDOM_ROW_COST = 4.0     # Cost of reading a row at an arbitrary position in the table file
+INDEX_ENTRY_COST = 0.5    # Cost of reading an entry from an index
+INDEX_PROBE_COST = 2.0    # Cost of descending an index to the entries of a key
+
+JOIN_PARTITIONS = 16      # Number of partitions a hash join divides its inputs into when they exceed its memory budget
+JOIN_MAX_DEPTH = 3        # Maximum number of times a hash join will repartition a partition which exceeds its budget
+JOIN_PROBE_BATCH = 1024   # Number of left rows an index join reads before looking up their keys in the index
+
+GROUP_PARTITIONS = 16     # Number of partitions an aggregation which exceeds its memory budget divides its rows into
+GROUP_MAX_DEPTH = 3       # Maximum number of times an aggregation will repartition a partition which exceeds its budget
+AGGREGATE_COLUMN = "_agg%d" # Name of the column of an Aggregate's rows holding the value of its N'th aggregate function
+
+
+###
+# Helper functions / classes
+###
+def rowSize(row):
+    """ Returns an approximation of the number of bytes of memory used to hold a row. """
+
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+class SpillFile:
+    """ A temporary file in a database's directory which rows are written to, then read back in the order written. """
+
+    fd = None      # The temporary file rows are written to
+    numRows = None # The number of rows which have been written to the file
+
+    def __init__(self, dbName):
+        self.fd = NanoIO.File.createTempFile(dbName)
+        self.numRows = 0
+
+    def __iter__(self):
+        self.fd.seek(0)
+        for i in xrange(self.numRows):
+            yield cPickle.load(self.fd)
+
+    def append(self, row):
+        """ Writes a row to the end of the file. """
+
+        cPickle.dump(row, self.fd, cPickle.HIGHEST_PROTOCOL)
+        self.numRows += 1
+
+    def close(self):
+        """ Closes, and removes, the file. """
+
+        self.fd.close()
+
+
+###
+# Aggregate functions
+#
+# Each aggregate function is described by a tuple of: the initial state of a group, a function returning the state of a
+# group after including a value in it, and a function returning the result of a group from its state.  As in SQL, None
+# values are ignored.
+###
+def _sumStep(state, value):
+    if value is None:
+        return state
+    return value if state is None else state + value
+
+def _minStep(state, value):
+    return state if value is None or (state is not None and state <= value) else value
+
+def _maxStep(state, value):
+    return state if value is None or (state is not None and state >= value) else value
+
+AGGREGATE_FUNCTIONS = {
+    'count': (0, lambda state, value: state if value is None else state + 1, lambda state: state),
+    'sum': (None, _sumStep, lambda state: state),
+    'min': (None, _minStep, lambda state: state),
+    'max': (None, _maxStep, lambda state: state),
+    'avg': ((0, 0), lambda state, value: state if value is None else (state[0] + value, state[1] + 1),
+            lambda state: (state[0] / float(state[1])) if state[1] else None),
+}
+
+
+def findAggregates(tokens):
+    """
+    Finds the calls of aggregate functions in a list of tokens.
+
+    Inputs: tokens - A list of tokens, as returned by QueryGrammar.tokenizeQuery.
+
+    Returns: A list of (start, end, function, argument) tuples; where tokens[start:end] are the tokens of the call,
+             function is the lowercased name of the aggregate function, and argument is the list of tokens passed to it.
+    """
+
+    calls = []
+    idx = 0
+    while idx < len(tokens) - 1:
+        if str(tokens[idx]).lower() in AGGREGATE_FUNCTIONS and tokens[idx + 1] == "(":
+            depth = 0
+            for end in xrange(idx + 1, len(tokens)):
+                depth += {"(": 1, ")": -1}.get(tokens[end], 0)
+                if not depth:
+                    break
+            else:
+                raise Exception("Unmatched ( in call of %s" % tokens[idx])
+
+            calls.append((idx, end + 1, tokens[idx].lower(), tokens[idx + 2: end]))
+            idx = end
+        idx += 1
+
+    return calls
+
+
+###
+# Operators
+###
+class Operator:
+    """
+    Base class of operators.
+
+    Subclasses must set self.columns, and implement __iter__ to produce their rows.  Subclasses should set
+    self.estimatedRows and self.estimatedCost if they are able to estimate them.
+    """
+
+    columns = None       # A list of (tableName, columnName) tuples describing the values in each row we produce
+    estimatedRows = None # An estimate of the number of rows we produce
+    estimatedCost = None # An estimate of the cost of producing all of our rows
+
+    def __iter__(self):
+        raise NotImplementedError
+
+
+    def children(self):
+        """ Returns a list of the operators we pull rows from. """
+
+        return []
+
+
+    def describe(self):
+        """ Returns a description of this operator, for EXPLAIN. """
+
+        return self.__class__.__name__
+
+
+    def columnIndex(self, name):
+        """
+        Returns the index of a column within the rows we produce.
+
+        Inputs: name - The name of the column; either `col`, or `table.col`.
+
+        Raises an Exception if the column does not exist, or if an unqualified name matches columns of multiple tables.
+        """
+
+        if '.' in name:
+            tableName, colName = name.rsplit('.', 1)
+            matches = [idx for idx, column in enumerate(self.columns) if column == (tableName, colName)]
+        else:
+            matches = [idx for idx, (tableName, colName) in enumerate(self.columns) if colName == name]
+
+        if not matches:
+            raise Exception("Unknown column: %s" % name)
+        if len(matches) > 1:
+            raise Exception("Ambiguous column: %s" % name)
+
+        return matches[0]
+
+
+class _TableAccess(Operator):
+    """ Base class of operators producing rows read from a table. """
+
+    tableIO = None   # The NanoIO.Table.TableIO to read rows from
+    tableName = None # The name the table is referred to by in the query
+    positions = None # Whether or not the position of each row is produced as its first value
+
+    def __init__(self, tableIO, tableName, positions=False):
+        self.tableIO = tableIO
+        self.tableName = tableName
+        self.positions = positions
+        self.columns = [(tableName, col.name) for col in tableIO.config.columns]
+        if positions:
+            self.columns.insert(0, (tableName, POSITION_COLUMN))
+
+    def _fetch(self, pos):
+        """ Returns the row at the given position in the table. """
+
+        row = self.tableIO.getRow(pos)
+        values = tuple(getattr(row, col.name) for col in self.tableIO.config.columns)
+        return ((pos,) + values) if self.positions else values
+
+
+class TableScan(_TableAccess):
+    """ Operator producing every row of a table, in order of position. """
+
+    def __init__(self, tableIO, tableName, positions=False):
+        _TableAccess.__init__(self, tableIO, tableName, positions)
+        self.estimatedRows = tableIO.numRows()
+        self.estimatedCost = tableIO.numPositions() * SEQUENTIAL_ROW_COST
+
+    def __iter__(self):
+        for pos, values in self.tableIO.scan():
+            yield ((pos,) + values) if self.positions else values
+
+    def describe(self):
+        return "TableScan on %s" % self.tableName
+
+
+class IndexScan(_TableAccess):
+    """ Operator producing the rows of a table which satisfy a filter on an indexed column, in order of that column. """
+
+    colName = None # The name of the indexed column to scan
+    filter = None  # A NanoCondition.Filter on the indexed column
+    reverse = None # Whether or not rows are produced in descending order of the indexed column
+
+    def __init__(self, tableIO, tableName, colName, filter, reverse=False, positions=False):
+        _TableAccess.__init__(self, tableIO, tableName, positions)
+        self.colName = colName
+        self.filter = filter
+        self.reverse = reverse
+
+        # Each entry read from the index leads us to a row at an arbitrary position in the table
+        self.estimatedRows = tableIO.indices[colName].estimateEntries(filter)
+        self.estimatedCost = self.estimatedRows * (INDEX_ENTRY_COST + RANDOM_ROW_COST)
+
+    def __iter__(self):
+        for key, pos in self.tableIO.indices[self.colName].iterateCondition(self.filter, self.reverse):
+            yield self._fetch(pos)
+
+    def describe(self):
+        filt = str(self.filter)
+        return "IndexScan on %s using %s%s%s" % (self.tableName, self.colName, " (%s)" % filt if filt else "",
+                                                 " descending" if self.reverse else "")
+
+
+class _IndexSetScan(_TableAccess):
+    """
+    Base class of operators which combine the positions found by scanning several indices into a set, then produce the
+    rows at those positions in order of position.
+
+    Subclasses must implement _positionSet, and set self.estimatedRows.
+    """
+
+    filters = None # A list of (colName, NanoCondition.Filter) tuples; the filters used to scan each index
+
+    def __init__(self, tableIO, tableName, filters, positions=False):
+        _TableAccess.__init__(self, tableIO, tableName, positions)
+        self.filters = filters
+
+    def _positionSet(self):
+        """ Returns the set of positions of the rows we produce. """
+
+        raise NotImplementedError
+
+    def _setCost(self):
+        """ Sets our estimatedCost, from the entries read from each index and our estimatedRows. """
+
+        entries = sum(self.tableIO.indices[colName].estimateEntries(filt) for colName, filt in self.filters)
+        self.estimatedCost = entries * INDEX_ENTRY_COST + self.estimatedRows * SORTED_ROW_COST
+
+    def __iter__(self):
+        for pos in sorted(self._positionSet()):
+            yield self._fetch(pos)
+
+    def describe(self):
+        return "%s on %s using %s" % (self.__class__.__name__, self.tableName,
+                                      ", ".join("%s (%s)" % (colName, filt) for colName, filt in self.filters))
+
+
+class IndexIntersection(_IndexSetScan):
+    """ Operator producing the rows of a table which satisfy each of several filters on indexed columns. """
+
+    def __init__(self, tableIO, tableName, filters, positions=False):
+        _IndexSetScan.__init__(self, tableIO, tableName, filters, positions)
+
+        # Assume the columns filtered upon are independent of one another
+        self.estimatedRows = float(tableIO.numRows())
+        for colName, filt in filters:
+            self.estimatedRows *= tableIO.indices[colName].estimateEntries(filt) / max(1.0, tableIO.numRows())
+        self._setCost()
+
+    def _positionSet(self):
+        positions = None
+        for colName, filt in self.filters:
+            found = set(pos for key, pos in self.tableIO.indices[colName].iterateCondition(filt))
+            positions = found if positions is None else positions & found
+            if not positions:
+                break
+        return positions
+
+
+class IndexUnion(_IndexSetScan):
+    """ Operator producing the rows of a table which satisfy any of several filters on indexed columns. """
+
+    def __init__(self, tableIO, tableName, filters, positions=False):
+        _IndexSetScan.__init__(self, tableIO, tableName, filters, positions)
+
+        # Assume no row satisfies more than one filter
+        self.estimatedRows = min(float(tableIO.numRows()),
+                                 sum(tableIO.indices[colName].estimateEntries(filt) for colName, filt in filters))
+        self._setCost()
+
+    def _positionSet(self):
+        positions = set()
+        for colName, filt in self.filters:
+            positions.update(pos for key, pos in self.tableIO.indices[colName].iterateCondition(filt))
+        return positions
+
+
+class Filter(Operator):
+    """ Operator producing the rows of its child which satisfy a condition. """
+
+    child = None     # The operator whose rows we filter
+    condition = None # The NanoCondition.NanoCondition rows must satisfy
+    params = None    # A tuple of the parameters bound to the query, for any placeholders in the condition
+
+    def __init__(self, child, condition, params=()):
+        self.child = child
+        self.condition = condition
+        self.params = tuple(params)
+        self.columns = child.columns
+        self.estimatedRows = child.estimatedRows
+        self.estimatedCost = child.estimatedCost
+
+    def __iter__(self):
+        satisfies = self.condition.rowFunction(self.columns, self.params)
+        for row in self.child:
+            if satisfies(row):
+                yield row
+
+    def children(self):
+        return [self.child]
+
+    def describe(self):
+        return "Filter (%s)" % self.condition.mainStatement
+
+
+class Project(Operator):
+    """
+    Operator producing the result of evaluating a list of expressions against each row of its child.  Expressions which
+    are simply the name of a column are copied from the row without being evaluated.
+    """
+
+    child = None       # The operator whose rows we project
+    expressions = None # A list of expression strings to produce the values of
+    params = None      # A tuple of the parameters bound to the query, for any placeholders in the expressions
+    names = None       # A list of the names of the columns we produce; by default, the expressions themselves
+
+    def __init__(self, child, expressions, params=(), names=None):
+        self.child = child
+        self.expressions = expressions
+        self.params = tuple(params)
+        self.names = names or expressions
+        self.columns = [(None, name) for name in self.names]
+        self.estimatedRows = child.estimatedRows
+        self.estimatedCost = child.estimatedCost
+
+    def __iter__(self):
+        # Compile every expression into a single function producing the projected row; copying the values of columns
+        indices = NanoCondition.columnIndices(self.child.columns)
+        expressions = []
+        for expression in self.expressions:
+            try:
+                expressions.append("%s[%d]" % (NanoCondition.ROW_NAME, self.child.columnIndex(expression)))
+            except Exception:
+                expressions.append(NanoCondition.tokensToString(QueryGrammar.tokenizeQuery(expression), indices))
+        project = NanoCondition.rowFunction("(%s,)" % ", ".join(expressions))(self.params)
+
+        for row in self.child:
+            yield project(row)
+
+    def children(self):
+        return [self.child]
+
+    def describe(self):
+        return "Project %s" % ", ".join(self.names)
+
+
+class _Descending:
+    """ Wraps a value such that it compares in the opposite order to the value itself. """
+
+    value = None
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class _KeyMaximum:
+    """
+    Value which compares greater than every other value; appended to a prefix of the key of an index over several
+    columns, it bounds every key beginning with that prefix from above.
+    """
+
+    def __repr__(self):
+        return "MAX"
+
+    def __eq__(self, other):
+        return isinstance(other, _KeyMaximum)
+
+    def __ne__(self, other):
+        return not isinstance(other, _KeyMaximum)
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return isinstance(other, _KeyMaximum)
+
+    def __gt__(self, other):
+        return not isinstance(other, _KeyMaximum)
+
+    def __ge__(self, other):
+        return True
+
+KEY_MAXIMUM = _KeyMaximum()
+
+
+class Sort(Operator):
+    """
+    Operator producing the rows of its child ordered by one of its columns.  Rows with equal values are produced in the
+    order they were read from the child.
+
+    Rows are sorted in memory until they exceed NanoConfig.sort_buffer_size, at which point they are written to a
+    temporary file as a sorted run.  Once every row has been read, the runs are lazily merged together.  If only the
+    first rows are required, a heap of at most that many rows is kept instead.
+    """
+
+    child = None      # The operator whose rows we sort
+    colName = None    # The name of the column to order rows by
+    colIdx = None     # The index of the column to order rows by
+    descending = None # Whether or not to order rows in descending order
+    dbName = None     # The name of the database to write sorted runs in; if None, rows are only sorted in memory
+    limit = None      # If not None, the maximum number of rows to produce
+
+    def __init__(self, child, colName, descending=False, dbName=None, limit=None):
+        self.child = child
+        self.colName = colName
+        self.descending = descending
+        self.dbName = dbName
+        self.limit = None if limit is None else int(limit)
+        self.columns = child.columns
+        self.colIdx = self.columnIndex(colName)
+        self.estimatedRows = child.estimatedRows
+        self.estimatedCost = child.estimatedCost
+        if None not in (self.limit, child.estimatedRows):
+            self.estimatedRows = min(child.estimatedRows, self.limit)
+
+    def __iter__(self):
+        idx = self.colIdx
+        sortKey = _Descending if self.descending else (lambda value: value)
+
+        # Each row is decorated with the order it was read in, so rows with equal values keep their order
+        if self.limit is not None:
+            rows = ((sortKey(row[idx]), seq, row) for seq, row in enumerate(self.child))
+            for key, seq, row in heapq.nsmallest(self.limit, rows):
+                yield row
+            return
+
+        runs = []
+        run = []
+        size = 0
+        try:
+            for seq, row in enumerate(self.child):
+                run.append((sortKey(row[idx]), seq, row))
+                size += rowSize(row)
+
+                if size > NanoConfig.sort_buffer_size and self.dbName is not None:
+                    run.sort()
+                    spillFile = SpillFile(self.dbName)
+                    runs.append(spillFile)
+                    for item in run:
+                        spillFile.append(item)
+                    run = []
+                    size = 0
+
+            run.sort()
+            for key, seq, row in heapq.merge(run, *runs):
+                yield row
+
+        finally:
+            for spillFile in runs:
+                spillFile.close()
+
+    def children(self):
+        return [self.child]
+
+    def describe(self):
+        return "Sort by %s%s%s" % (self.colName, " descending" if self.descending else "",
+                                   "" if self.limit is None else " (top %d)" % self.limit)
+
+
+class Limit(Operator):
+    """ Operator producing at most a given number of rows of its child; pulling no more rows from it than required. """
+
+    child = None # The operator whose rows we limit
+    limit = None # The maximum number of rows to produce
+
+    def __init__(self, child, limit):
+        self.child = child
+        self.limit = int(limit)
+        self.columns = child.columns
+        self.estimatedCost = child.estimatedCost
+        if child.estimatedRows is not None:
+            self.estimatedRows = min(child.estimatedRows, self.limit)
+
+    def __iter__(self):
+        return itertools.islice(self.child, self.limit)
+
+    def children(self):
+        return [self.child]
+
+    def describe(self):
+        return "Limit %d" % self.limit
+
+
+class Distinct(Operator):
+    """ Operator producing the first occurrence of each distinct row of its child. """
+
+    child = None # The operator whose rows we deduplicate
+
+    def __init__(self, child):
+        self.child = child
+        self.columns = child.columns
+        self.estimatedRows = child.estimatedRows
+        self.estimatedCost = child.estimatedCost
+
+    def __iter__(self):
+        seen = set()
+        for row in self.child:
+            if row not in seen:
+                seen.add(row)
+                yield row
+
+    def children(self):
+        return [self.child]
+
+
+class NestedLoopJoin(Operator):
+    """
+    Operator joining the rows of two operators; producing each combination of their rows which satisfies a condition.
+    The rows of the right operator are read once, and held in memory.
+    """
+
+    left = None      # The operator producing the outer rows of the join
+    right = None     # The operator producing the inner rows of the join
+    condition = None # The NanoCondition.NanoCondition combined rows must satisfy
+    outer = None     # If True, left rows matching no right rows are produced once, with None for each right value
+    params = None    # A tuple of the parameters bound to the query, for any placeholders in the condition
+
+    def __init__(self, left, right, condition, outer=False, params=()):
+        self.left = left
+        self.right = right
+        self.condition = condition
+        self.outer = outer
+        self.params = tuple(params)
+        self.columns = left.columns + right.columns
+        if None not in (left.estimatedRows, right.estimatedRows, left.estimatedCost, right.estimatedCost):
+            self.estimatedRows = left.estimatedRows * right.estimatedRows
+            self.estimatedCost = left.estimatedCost + right.estimatedCost
+
+    def __iter__(self):
+        satisfies = self.condition.rowFunction(self.columns, self.params)
+        rightRows = None
+        nullRow = (None,) * len(self.right.columns)
+
+        for leftRow in self.left:
+            # Only read the right rows once we know there is a left row to join them to
+            if rightRows is None:
+                rightRows = list(self.right)
+
+            matched = False
+            for rightRow in rightRows:
+                row = leftRow + rightRow
+                if satisfies(row):
+                    matched = True
+                    yield row
+
+            if self.outer and not matched:
+                yield leftRow + nullRow
+
+    def children(self):
+        return [self.left, self.right]
+
+    def describe(self):
+        return "NestedLoopJoin%s (%s)" % (" outer" if self.outer else "", self.condition.mainStatement)
+
+
+class HashJoin(Operator):
+    """
+    Operator joining the rows of two operators on the equality of one or more of their columns; producing each
+    combination of their rows which satisfies a condition.
+
+    The rows of the smaller input (the build input) are read into a hash table keyed on their join columns, then each
+    row of the other input (the probe input) is combined only with rows having the same key.  If the build input does
+    not fit within NanoConfig.join_buffer_size, both inputs are partitioned by key into temporary files; and each pair
+    of partitions is joined in turn.
+    """
+
+    left = None      # The operator producing the outer rows of the join
+    right = None     # The operator producing the inner rows of the join
+    condition = None # The NanoCondition.NanoCondition combined rows must satisfy
+    leftKeys = None  # A list of the indices of the join columns in the left rows
+    rightKeys = None # A list of the indices of the join columns in the right rows; corresponding to leftKeys
+    outer = None     # If True, left rows matching no right rows are produced once, with None for each right value
+    params = None    # A tuple of the parameters bound to the query, for any placeholders in the condition
+    dbName = None    # The name of the database to create temporary files in, if the inputs must be partitioned
+    buildLeft = None # Whether the left input (rather than the right input) is the build input
+
+    def __init__(self, left, right, condition, leftKeys, rightKeys, outer=False, params=(), dbName=None):
+        self.left = left
+        self.right = right
+        self.condition = condition
+        self.leftKeys = leftKeys
+        self.rightKeys = rightKeys
+        self.outer = outer
+        self.params = tuple(params)
+        self.dbName = dbName
+        self.columns = left.columns + right.columns
+
+        self.buildLeft = None not in (left.estimatedRows, right.estimatedRows) and \
+                         left.estimatedRows < right.estimatedRows
+        if None not in (left.estimatedRows, right.estimatedRows, left.estimatedCost, right.estimatedCost):
+            self.estimatedRows = max(left.estimatedRows, right.estimatedRows)
+            self.estimatedCost = left.estimatedCost + right.estimatedCost
+
+    def __iter__(self):
+        satisfies = self.condition.rowFunction(self.columns, self.params)
+        build, probe = (self.left, self.right) if self.buildLeft else (self.right, self.left)
+
+        for row in self._join(build, probe, satisfies, 0):
+            yield row
+
+    def _keyFunctions(self):
+        """ Returns functions returning the join key of a build row, and of a probe row. """
+
+        leftKey, rightKey = operator.itemgetter(*self.leftKeys), operator.itemgetter(*self.rightKeys)
+        return (leftKey, rightKey) if self.buildLeft else (rightKey, leftKey)
+
+    def _join(self, buildRows, probeRows, satisfies, depth):
+        """
+        Joins the given build and probe rows; partitioning them if the build rows do not fit within our memory budget.
+
+        Inputs: buildRows - An iterable over the rows of the build input to join.
+                probeRows - An iterable over the rows of the probe input to join.
+                satisfies - A function returning whether or not a combined row satisfies our condition.
+                depth     - The number of times the rows have been partitioned.
+        """
+
+        buildKey, probeKey = self._keyFunctions()
+
+        # Hash each build row by its key, recording the order it was read in
+        table = dict()
+        size = 0
+        buildRows = iter(buildRows)
+        for idx, row in enumerate(buildRows):
+            table.setdefault(buildKey(row), []).append((idx, row))
+            size += rowSize(row)
+
+            if size > NanoConfig.join_buffer_size and depth < JOIN_MAX_DEPTH and self.dbName is not None:
+                held = (row for idx, row in sorted(itertools.chain(*table.values())))
+                for row in self._partitionedJoin(itertools.chain(held, buildRows), probeRows, satisfies, depth):
+                    yield row
+                return
+
+        # Combine each probe row with the build rows having the same key
+        nullRow = (None,) * len(self.right.columns)
+        matched = set()
+        for probeRow in probeRows:
+            probeMatched = False
+            for idx, buildRow in table.get(probeKey(probeRow), ()):
+                row = (buildRow + probeRow) if self.buildLeft else (probeRow + buildRow)
+                if satisfies(row):
+                    probeMatched = True
+                    matched.add(idx)
+                    yield row
+
+            if self.outer and not self.buildLeft and not probeMatched:
+                yield probeRow + nullRow
+
+        # When the left rows were hashed, the left rows which did not match any right rows are only known at the end
+        if self.outer and self.buildLeft:
+            for idx, row in sorted(itertools.chain(*table.values())):
+                if idx not in matched:
+                    yield row + nullRow
+
+    def _partitionedJoin(self, buildRows, probeRows, satisfies, depth):
+        """
+        Partitions the given build and probe rows by their keys into JOIN_PARTITIONS pairs of temporary files, then
+        joins each pair of partitions.  Rows with equal keys are always written to the same partition.
+        """
+
+        buildKey, probeKey = self._keyFunctions()
+        buildParts = [SpillFile(self.dbName) for i in range(JOIN_PARTITIONS)]
+        probeParts = [SpillFile(self.dbName) for i in range(JOIN_PARTITIONS)]
+
+        try:
+            # Include the depth in each hash, so that repartitioning a partition divides its rows differently
+            for row in buildRows:
+                buildParts[hash((depth, buildKey(row))) % JOIN_PARTITIONS].append(row)
+            for row in probeRows:
+                probeParts[hash((depth, probeKey(row))) % JOIN_PARTITIONS].append(row)
+
+            for buildPart, probePart in zip(buildParts, probeParts):
+                if buildPart.numRows or (self.outer and not self.buildLeft):
+                    for row in self._join(buildPart, probePart, satisfies, depth + 1):
+                        yield row
+
+        finally:
+            for part in buildParts + probeParts:
+                part.close()
+
+    def children(self):
+        return [self.left, self.right]
+
+    def describe(self):
+        keys = ", ".join("%s.%s = %s.%s" % (self.left.columns[leftKey] + self.right.columns[rightKey])
+                         for leftKey, rightKey in zip(self.leftKeys, self.rightKeys))
+        return "HashJoin%s on %s building %s" % (" outer" if self.outer else "", keys,
+                                                 "left" if self.buildLeft else "right")
+
+
+class Aggregate(Operator):
+    """
+    Operator producing a row for each group of its child's rows having equal values in a list of columns; consisting of
+    those values, followed by the result of each of a list of aggregate functions over the rows of the group.  Without
+    any columns to group by, a single row is produced for all of the child's rows.
+
+    Rows are aggregated into a hash table of the state of each group.  If the groups exceed
+    NanoConfig.group_buffer_size, the states of the groups held are written to GROUP_PARTITIONS temporary files by the
+    hash of their values, followed by the remaining rows; then each partition is aggregated in turn.
+    """
+
+    child = None      # The operator whose rows we aggregate
+    groupBy = None    # A list of the names of the columns to group rows by
+    aggregates = None # A list of (function, argument) tuples; the name of an aggregate function, and the expression
+                      # string whose values it aggregates, or `*`
+    params = None     # A tuple of the parameters bound to the query, for any placeholders in the arguments
+    dbName = None     # The name of the database to write partitions in; if None, groups are only held in memory
+
+    def __init__(self, child, groupBy, aggregates, params=(), dbName=None):
+        self.child = child
+        self.groupBy = groupBy
+        self.aggregates = aggregates
+        self.params = tuple(params)
+        self.dbName = dbName
+        self.columns = [child.columns[child.columnIndex(name)] for name in groupBy] + \
+                       [(None, AGGREGATE_COLUMN % idx) for idx in range(len(aggregates))]
+
+        self.estimatedCost = child.estimatedCost
+        if not groupBy:
+            self.estimatedRows = 1
+        elif child.estimatedRows is not None:
+            # Assume the columns grouped by are as distinct as the square root of the number of rows
+            self.estimatedRows = child.estimatedRows ** 0.5
+
+    def _rowFunctions(self):
+        """ Returns functions returning the values a row is grouped by, and the values it is aggregated by. """
+
+        indices = NanoCondition.columnIndices(self.child.columns)
+        key = ["%s[%d]" % (NanoCondition.ROW_NAME, self.child.columnIndex(name)) for name in self.groupBy]
+        values = ["1" if argument == "*" else
+                  NanoCondition.tokensToString(QueryGrammar.tokenizeQuery(argument), indices)
+                  for function, argument in self.aggregates]
+        return tuple(NanoCondition.rowFunction("(%s)" % "".join("%s, " % expression for expression in expressions))
+                     (self.params) for expressions in (key, values))
+
+    def __iter__(self):
+        groupKey, groupValues = self._rowFunctions()
+
+        # Read each row, decorated with the values it is grouped by
+        groups = self._aggregate(((groupKey(row), groupValues(row)) for row in self.child), (), 0)
+        if not self.groupBy:
+            # Without any rows there are no groups; but aggregating every row still produces a row
+            initialStates = [AGGREGATE_FUNCTIONS[function][0] for function, argument in self.aggregates]
+            groups = list(groups) or [((), initialStates)]
+
+        results = [AGGREGATE_FUNCTIONS[function][2] for function, argument in self.aggregates]
+        for key, states in groups:
+            yield key + tuple(result(state) for result, state in zip(results, states))
+
+    def _aggregate(self, rows, states, depth):
+        """
+        Aggregates rows into groups; partitioning them if the groups do not fit within our memory budget.
+
+        Inputs: rows   - An iterable over (key, values) tuples of the rows to aggregate.
+                states - An iterable over (key, states) tuples of groups which rows should be aggregated into.
+                depth  - The number of times the rows have been partitioned.
+
+        Returns: An iterable over (key, states) tuples of each group.
+        """
+
+        functions = [AGGREGATE_FUNCTIONS[function] for function, argument in self.aggregates]
+        initialStates = [functionTuple[0] for functionTuple in functions]
+        steps = [functionTuple[1] for functionTuple in functions]
+
+        groups = dict(states)
+        size = sum(rowSize(key) + rowSize(groupStates) for key, groupStates in groups.iteritems())
+        rows = iter(rows)
+        for key, values in rows:
+            groupStates = groups.get(key)
+            if groupStates is None:
+                groupStates = groups[key] = list(initialStates)
+                size += rowSize(key) + rowSize(groupStates)
+
+                if size > NanoConfig.group_buffer_size and depth < GROUP_MAX_DEPTH and self.dbName is not None:
+                    return self._partitionedAggregate(itertools.chain([(key, values)], rows), groups, depth)
+
+            for idx, (step, value) in enumerate(zip(steps, values)):
+                groupStates[idx] = step(groupStates[idx], value)
+
+        return groups.items()
+
+    def _partitionedAggregate(self, rows, groups, depth):
+        """
+        Partitions the given groups and rows by their keys into GROUP_PARTITIONS pairs of temporary files, then
+        aggregates each partition.  Groups and rows with equal keys are always written to the same partition.
+        """
+
+        stateParts = [SpillFile(self.dbName) for i in range(GROUP_PARTITIONS)]
+        rowParts = [SpillFile(self.dbName) for i in range(GROUP_PARTITIONS)]
+
+        try:
+            # Include the depth in each hash, so that repartitioning a partition divides its rows differently
+            for key, groupStates in groups.iteritems():
+                stateParts[hash((depth, key)) % GROUP_PARTITIONS].append((key, groupStates))
+            groups.clear()
+            for key, values in rows:
+                rowParts[hash((depth, key)) % GROUP_PARTITIONS].append((key, values))
+
+            for stateFile, rowFile in zip(stateParts, rowParts):
+                for group in self._aggregate(rowFile, stateFile, depth + 1):
+                    yield group
+
+        finally:
+            for part in stateParts + rowParts:
+                part.close()
+
+    def children(self):
+        return [self.child]
+
+    def describe(self):
+        aggregates = ", ".join("%s(%s)" % aggregate for aggregate in self.aggregates)
+        return "Aggregate %s%s" % (aggregates, " by %s" % ", ".join(self.groupBy) if self.groupBy else "")
+
+
+class IndexJoin(Operator):
+    """
+    Operator joining the rows of an operator to the rows of a table, by looking up the value of one of the operator's
+    columns in an index of the table; producing each combination of their rows which satisfies a condition.
+
+    Left rows are read in batches of JOIN_PROBE_BATCH rows.  The distinct keys of each batch are looked up in the index
+    in sorted order, so that its blocks are visited in order, and the matching rows are read from the table in order of
+    position.
+    """
+
+    left = None      # The operator producing the outer rows of the join
+    right = None     # A TableScan of the table whose rows are looked up
+    condition = None # The NanoCondition.NanoCondition combined rows must satisfy
+    leftKey = None   # The index of the column in the left rows whose value is looked up
+    colName = None   # The name of the indexed column of the table which values are looked up in
+    outer = None     # If True, left rows matching no right rows are produced once, with None for each right value
+    params = None    # A tuple of the parameters bound to the query, for any placeholders in the condition
+
+    def __init__(self, left, right, condition, leftKey, colName, outer=False, params=()):
+        self.left = left
+        self.right = right
+        self.condition = condition
+        self.leftKey = leftKey
+        self.colName = colName
+        self.outer = outer
+        self.params = tuple(params)
+        self.columns = left.columns + right.columns
+
+        if None not in (left.estimatedRows, left.estimatedCost):
+            stats = right.tableIO.indices[colName].statistics()
+            perKey = stats['entries'] / float(max(1, stats['distinct']))
+            self.estimatedRows = left.estimatedRows * perKey
+            self.estimatedCost = left.estimatedCost + left.estimatedRows * \
+                                 (INDEX_PROBE_COST + perKey * (INDEX_ENTRY_COST + RANDOM_ROW_COST))
+
+    def __iter__(self):
+        satisfies = self.condition.rowFunction(self.columns, self.params)
+        tableIO = self.right.tableIO
+        index = tableIO.indices[self.colName]
+        nullRow = (None,) * len(self.right.columns)
+
+        leftRows = iter(self.left)
+        while True:
+            batch = list(itertools.islice(leftRows, JOIN_PROBE_BATCH))
+            if not batch:
+                return
+
+            # Convert each value to the key it would have in the index; values which cannot be cannot match any rows
+            keys = dict()
+            for row in batch:
+                try:
+                    keys[row[self.leftKey]] = tableIO._indexKey(self.colName, row[self.leftKey])
+                except Exception:
+                    pass
+
+            entries = index.iterateCondition(NanoCondition.Filter(self.colName, 'in', set(keys.values())))
+            matches = collections.defaultdict(list)
+            for pos, key in sorted((pos, key) for key, pos in entries):
+                matches[key].append(self.right._fetch(pos))
+
+            for leftRow in batch:
+                matched = False
+                if leftRow[self.leftKey] in keys:
+                    for rightRow in matches.get(keys[leftRow[self.leftKey]], ()):
+                        row = leftRow + rightRow
+                        if satisfies(row):
+                            matched = True
+                            yield row
+
+                if self.outer and not matched:
+                    yield leftRow + nullRow
+
+    def children(self):
+        return [self.left]
+
+    def describe(self):
+        return "IndexJoin%s on %s.%s = %s.%s" % ((" outer" if self.outer else "",) + self.left.columns[self.leftKey] +
+                                                 (self.right.tableName, self.colName))
+
+
+###
+# Planning functions
+###
+def _mergeFilters(filters, names):
+    """
+    Merges filters named as they are in a condition into a dictionary mapping column names to a filter on each column.
+
+    Inputs: filters - An iterable of NanoCondition.Filter instances.
+            names   - A dictionary mapping each name a filter may have to the name of the column it refers to.
+    """
+
+    merged = dict()
+    for filt in filters:
+        filt.filterName = names[filt.filterName]
+        if filt.filterName in merged:
+            merged[filt.filterName].update(filt)
+        else:
+            merged[filt.filterName] = filt
+
+    return merged
+
+
+def _filterNames(tableName, colNames):
+    """ Returns a dictionary mapping the names columns may be referred to by in a condition to the column names. """
+
+    names = dict((colName, colName) for colName in colNames)
+    names.update(("%s.%s" % (tableName, colName), colName) for colName in colNames)
+    return names
+
+
+def conditionFilters(condition, tableName, colNames, params=()):
+    """
+    Returns filters on the given columns which every row satisfying the given condition must also satisfy.
+
+    Inputs: condition - A NanoCondition.NanoCondition.
+            tableName - The name of the table the columns belong to; columns may be referred to as `table.col`.
+            colNames  - The names of the columns to find filters for.
+            params    - A tuple of the parameters bound to the query, for any placeholders in the condition.
+
+    Returns: A dictionary mapping column names to NanoCondition.Filter instances.
+    """
+
+    names = _filterNames(tableName, colNames)
+    return _mergeFilters(condition.mainStatement._getFilters(names, params), names)
+
+
+def _lookupFilters(tableIO, filters):
+    """
+    Returns those of the given filters which the index on their column can look up the entries satisfying.  Hash
+    indices can only look up sets of values, not ranges.
+
+    Inputs: tableIO - The NanoIO.Table.TableIO of the table the filtered columns belong to.
+            filters - A dictionary mapping index names to NanoCondition.Filter instances.
+    """
+
+    return dict((colName, filt) for colName, filt in filters.items()
+                if tableIO.indices[colName].ordered or filt.inItems is not None)
+
+
+def _prefixFilter(indexName, colNames, filters):
+    """
+    Returns a filter on the keys of an index over several columns which every row satisfying the given filters on its
+    columns must also satisfy, or None if its first column is not filtered.  As its keys are ordered by the value of
+    its first column, then its second, etc. a range of its keys can only be found from single values the leading
+    columns are equal to, followed by a range of values of the next column.
+
+    Inputs: indexName - The name of the index.
+            colNames  - The names of the columns of the index, in the order their values appear in its keys.
+            filters   - A dictionary mapping column names to NanoCondition.Filter instances.
+    """
+
+    prefix = ()
+    for colName in colNames:
+        filt = filters.get(colName)
+        if filt is None or filt.inItems is None or len(set(filt.inItems)) != 1:
+            break
+        prefix += (filt.inItems[0],)
+    else:
+        return NanoCondition.Filter(indexName, 'in', [prefix])
+
+    filt = filters.get(colNames[len(prefix)])
+    if not prefix and filt is None:
+        return None
+
+    # Every key beginning with the prefix, narrowed by any range of values of the next column
+    greaterThan, greaterThanEqual, lessThan, lessThanEqual = None, True, None, True
+    if filt is not None:
+        greaterThan, greaterThanEqual = filt.greaterThan, filt.greaterThanEqual
+        lessThan, lessThanEqual = filt.lessThan, filt.lessThanEqual
+        if filt.inItems:
+            greaterThan, greaterThanEqual = min(filt.inItems), True
+            lessThan, lessThanEqual = max(filt.inItems), True
+
+    prefixFilter = NanoCondition.Filter(indexName, '<=', prefix + (KEY_MAXIMUM,))
+    if lessThan is not None:
+        prefixFilter.lessThan = prefix + ((lessThan, KEY_MAXIMUM) if lessThanEqual else (lessThan,))
+        prefixFilter.lessThanEqual = bool(lessThanEqual)
+    if greaterThan is not None:
+        prefixFilter.greaterThan = prefix + ((greaterThan,) if greaterThanEqual else (greaterThan, KEY_MAXIMUM))
+        prefixFilter.greaterThanEqual = bool(greaterThanEqual)
+    elif prefix:
+        prefixFilter.greaterThan, prefixFilter.greaterThanEqual = prefix, True
+
+    return prefixFilter
+
+
+def candidatePaths(tableIO, tableName, condition=None, positions=False, params=()):
+    """
+    Returns a list of operators which each produce the rows of a table which may satisfy a condition.  These are:
+      - A scan of the entire table.
+      - A scan of each index on a column the condition filters.
+      - A scan of each index over several columns whose first column the condition filters; of the keys beginning
+        with the values the condition compares its leading columns to, within any range of the next column.
+      - Intersections of the indices of the most selective filtered columns; the two most selective, three most, etc.
+      - If the condition is or'd and each or'd statement filters an indexed column, a union of the most selective index
+        of each statement.
+
+    If the condition compares a column with a unique index to a single value, the scan of that index reads at most one
+    row and cannot be bettered; so it is returned alone, without estimating the cost of any other candidate.
+
+    Inputs: See accessPath.
+    """
+
+    candidates = [TableScan(tableIO, tableName, positions)]
+    if condition is None or not tableIO.indices:
+        return candidates
+
+    singleColumn = [name for name, index in tableIO.indices.items() if not index.indexConfig.trailingColumns]
+    colNames = set(colName for index in tableIO.indices.values() for colName in index.indexConfig.colNames())
+    columnFilters = conditionFilters(condition, tableName, colNames, params)
+
+    filters = dict((colName, columnFilters[colName]) for colName in singleColumn if colName in columnFilters)
+    for indexName, index in tableIO.indices.items():
+        if index.indexConfig.trailingColumns:
+            prefixFilter = _prefixFilter(indexName, index.indexConfig.colNames(), columnFilters)
+            if prefixFilter is not None:
+                filters[indexName] = prefixFilter
+
+    filters = _lookupFilters(tableIO, filters)
+    for colName, filt in sorted(filters.items()):
+        if tableIO.indices[colName].indexConfig.unique and filt.inItems is not None and len(set(filt.inItems)) == 1:
+            return [IndexScan(tableIO, tableName, colName, filt, positions=positions)]
+
+    scans = [IndexScan(tableIO, tableName, colName, filt, positions=positions) for colName, filt in filters.items()]
+    scans.sort(key=lambda scan: (scan.estimatedRows, scan.colName))
+    candidates.extend(scans)
+
+    for num in range(2, len(scans) + 1):
+        candidates.append(IndexIntersection(tableIO, tableName, [(scan.colName, scan.filter) for scan in scans[:num]],
+                                            positions))
+
+    names = _filterNames(tableName, singleColumn)
+    passes = condition.lookupStrategy(names, params)
+    if passes is not None and len(passes) > 1:
+        unionFilters = []
+        for passFilters in passes:
+            passFilters = _lookupFilters(tableIO, _mergeFilters(passFilters.values(), names))
+            if not passFilters:
+                break
+            unionFilters.append(min(passFilters.items(),
+                                    key=lambda (colName, filt): tableIO.indices[colName].estimateEntries(filt)))
+        else:
+            candidates.append(IndexUnion(tableIO, tableName, unionFilters, positions))
+
+    return candidates
+
+
+def accessPath(tableIO, tableName, condition=None, positions=False, params=()):
+    """
+    Returns the operator estimated to be the cheapest way of producing the rows of a table which may satisfy a
+    condition; see candidatePaths.  The condition itself is not applied to the rows produced.
+
+    Inputs: tableIO   - The NanoIO.Table.TableIO of the table to produce rows of.
+            tableName - The name the table is referred to by in the query.
+            condition - An optional NanoCondition.NanoCondition which rows will be filtered by.
+            positions - Whether or not the position of each row should be produced as its first value.
+            params    - A tuple of the parameters bound to the query, for any placeholders in the condition.
+    """
+
+    return min(candidatePaths(tableIO, tableName, condition, positions, params), key=lambda path: path.estimatedCost)
+
+
+def planScan(tableIO, tableName, condition=None, orderBy=None, descending=False, limit=None, positions=False, params=(),
+             dbName=None):
+    """
+    Returns an operator producing the rows of a table which satisfy a condition, optionally ordered by one of its
+    columns.  If that column is indexed, scanning its index in order produces rows already ordered; which, when only
+    the first rows are required, may stop long before reading every row the condition could be satisfied by.  This is
+    chosen over the cheapest access path (see accessPath) followed by a sort, if it is estimated to be cheaper.
+
+    Inputs: tableIO    - The NanoIO.Table.TableIO of the table to produce rows of.
+            tableName  - The name the table is referred to by in the query.
+            condition  - An optional NanoCondition.NanoCondition rows must satisfy.
+            orderBy    - An optional name of a column to order the rows by.
+            descending - Whether or not to order the rows in descending order.
+            limit      - An optional number of rows; if given, at most this many rows will be consumed.
+            positions  - Whether or not the position of each row should be produced as its first value.
+            params     - A tuple of the parameters bound to the query, for any placeholders in the condition.
+            dbName     - The name of the database the table is in; in which rows being ordered may be written.
+    """
+
+    candidates = candidatePaths(tableIO, tableName, condition, positions, params)
+    colName = _filterNames(tableName, [name for name, index in tableIO.indices.items()
+                                       if index.ordered and not index.indexConfig.trailingColumns]).get(orderBy)
+
+    ordered = None
+    if colName is not None:
+        filt = None
+        if condition is not None:
+            filt = conditionFilters(condition, tableName, [colName], params).get(colName)
+        ordered = IndexScan(tableIO, tableName, colName, filt or NanoCondition.Filter(colName, '>', None), descending,
+                            positions)
+
+        # Only as much of the index needs to be scanned as will produce the rows which are consumed
+        orderedCost = ordered.estimatedCost
+        if limit is not None:
+            matching = min(path.estimatedRows for path in candidates)
+            orderedCost *= min(1.0, int(limit) / max(1.0, matching))
+
+    plan = min(candidates, key=lambda path: path.estimatedCost)
+    sort = orderBy is not None
+    if ordered is not None and orderedCost <= plan.estimatedCost:
+        plan = ordered
+        sort = False
+
+    if condition is not None:
+        plan = Filter(plan, condition, params)
+    if sort:
+        plan = Sort(plan, orderBy, descending, dbName, limit)
+
+    return plan
+
+
+def planModification(tableIO, tableName, condition=None, orderBy=None, orderByDir=None, limit=None, params=(),
+                     dbName=None):
+    """
+    Returns an operator producing the rows an Update or Delete query should modify, in the order they should be
+    modified.  The first value of each row is its position.
+
+    Inputs: tableIO    - The NanoIO.Table.TableIO of the table being modified.
+            tableName  - The name the table is referred to by in the query.
+            condition  - An optional NanoCondition.NanoCondition rows must satisfy.
+            orderBy    - An optional name of a column to order the rows by.
+            orderByDir - `asc` or `desc`; the direction to order the rows in.
+            limit      - An optional maximum number of rows to modify.
+            params     - A tuple of the parameters bound to the query, for any placeholders in the condition.
+            dbName     - The name of the database the table is in; in which rows being ordered may be written.
+    """
+
+    plan = planScan(tableIO, tableName, condition, orderBy, (orderByDir or '').lower() == 'desc', limit, True, params,
+                    dbName)
+    if limit is not None:
+        plan = Limit(plan, limit)
+
+    return plan
+
+
+def joinKeys(condition, leftColumns, rightColumns):
+    """
+    Returns the columns a join may be hashed on; the pairs of a left column and a right column which the condition
+    requires to be equal.  Only equalities which are and'd together are considered.
+
+    Inputs: condition    - The NanoCondition.NanoCondition of the join.
+            leftColumns  - The columns of the left rows of the join.
+            rightColumns - The columns of the right rows of the join.
+
+    Returns: A tuple of two lists; the indices of the join columns in the left rows, and the indices of their
+             corresponding columns in the right rows.
+    """
+
+    # Resolve names within the combined rows; as they are when the condition is evaluated
+    indices = NanoCondition.columnIndices(leftColumns + rightColumns)
+
+    statement = condition.mainStatement
+    statements = statement.statements if isinstance(statement, NanoCondition.AndStatement) else [statement]
+
+    leftKeys, rightKeys = [], []
+    for statement in statements:
+        if not isinstance(statement, NanoCondition.Statement) or statement.opr != '==' or \
+           len(statement.left) != 1 or len(statement.right) != 1:
+            continue
+
+        first, second = indices.get(statement.left[0]), indices.get(statement.right[0])
+        if first is None or second is None:
+            continue
+        if first > second:
+            first, second = second, first
+        if first < len(leftColumns) <= second:
+            leftKeys.append(first)
+            rightKeys.append(second - len(leftColumns))
+
+    return leftKeys, rightKeys
+
+
+def planJoin(left, right, condition, outer=False, params=(), dbName=None):
+    """
+    Returns an operator joining the rows of two operators.  Joins requiring columns of the left and right rows to be
+    equal are either hashed on those columns, or (if the right rows are a table with an index on one of them) look up
+    the value of each left row in the index; whichever is estimated to be cheaper.  Otherwise each left row is compared
+    against every right row.
+
+    Inputs: See HashJoin.
+    """
+
+    leftKeys, rightKeys = joinKeys(condition, left.columns, right.columns)
+    if not leftKeys:
+        return NestedLoopJoin(left, right, condition, outer, params)
+
+    candidates = [HashJoin(left, right, condition, leftKeys, rightKeys, outer, params, dbName)]
+    if isinstance(right, TableScan) and None not in (left.estimatedRows, candidates[0].estimatedCost):
+        for leftKey, rightKey in zip(leftKeys, rightKeys):
+            colName = right.columns[rightKey][1]
+            if colName in right.tableIO.indices:
+                candidates.append(IndexJoin(left, right, condition, leftKey, colName, outer, params))
+
+    return min(candidates, key=lambda join: join.estimatedCost)
+
+
+def planAggregate(child, expressions, groupBy=(), params=(), dbName=None):
+    """
+    Returns an Aggregate operator computing the aggregate functions called by a list of expressions over groups of the
+    rows of an operator, along with the expressions rewritten to be evaluated against the rows of the Aggregate.
+
+    Inputs: child       - The operator producing the rows to aggregate.
+            expressions - A list of expression strings, which may call aggregate functions.
+            groupBy     - A list of the names of the columns to group rows by.
+            params      - A tuple of the parameters bound to the query, for any placeholders in the expressions.
+            dbName      - The name of the database groups which do not fit in memory may be written in.
+
+    Returns: A tuple of (Aggregate, rewritten expressions).
+
+    Raises an Exception if an expression refers to a column outside of an aggregate function which is not grouped by.
+    """
+
+    aggregates = []
+    rewritten = []
+    for expression in expressions:
+        tokens = QueryGrammar.tokenizeQuery(expression)
+        calls = findAggregates(tokens)
+        for start, end, function, argument in calls:
+            if (function, " ".join(argument)) not in aggregates:
+                aggregates.append((function, " ".join(argument)))
+
+        # Replace each call with the column of the Aggregate holding its result; from the last, so indices stay valid
+        for start, end, function, argument in reversed(calls):
+            tokens[start:end] = [AGGREGATE_COLUMN % aggregates.index((function, " ".join(argument)))]
+        rewritten.append(" ".join(tokens))
+
+    plan = Aggregate(child, list(groupBy), aggregates, params, dbName)
+
+    childIndices = NanoCondition.columnIndices(child.columns)
+    indices = NanoCondition.columnIndices(plan.columns)
+    for expression in rewritten:
+        for token in QueryGrammar.tokenizeQuery(expression):
+            if token in childIndices and token not in indices:
+                raise Exception("Column %s must be grouped by or used in an aggregate function" % token)
+
+    return plan, rewritten
+
+
+def explain(plan):
+    """
+    Returns a description of each operator in a plan, for EXPLAIN.
+
+    Inputs: plan - The operator at the root of the plan.
+
+    Returns: A list of (description, estimated rows, estimated cost) tuples, one for each operator in the plan in
+             depth-first order.  Descriptions are indented by the depth of the operator in the plan.
+    """
+
+    toReturn = []
+
+    def explainInner(node, depth):
+        rows = None if node.estimatedRows is None else int(round(node.estimatedRows))
+        cost = None if node.estimatedCost is None else round(node.estimatedCost, 1)
+        toReturn.append(("  " * depth + node.describe(), rows, cost))
+        for child in node.children():
+            explainInner(child, depth + 1)
+
+    explainInner(plan, 0)
+    return toReturn
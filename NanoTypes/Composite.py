@@ -0,0 +1,36 @@
+# Project imports
+import _BaseType as BaseType
+
+class Composite(BaseType.Type):
+    """
+    Type serializing a tuple of values, each of its own type; used as the key of an index over several columns.  As
+    each of the types is of a fixed size, their serialized values are simply concatenated.
+    """
+
+    types = None # The list of types of each value in the tuple
+
+    def __init__(self, types):
+        self.types = list(types)
+        self.size = sum(typ.size for typ in self.types)
+
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, ", ".join(repr(typ) for typ in self.types))
+
+
+    def _toString(self, val):
+        return "".join(typ.toString(item) for typ, item in zip(self.types, val))
+
+
+    def _fromString(self, s):
+        values = []
+        start = 0
+        for typ in self.types:
+            values.append(typ.fromString(s[start: start + typ.size]))
+            start += typ.size
+        return tuple(values)
+
+
+    def isValid(self, val):
+        return isinstance(val, tuple) and len(val) == len(self.types) and \
+               all(item is None or typ.isValid(item) for typ, item in zip(self.types, val))
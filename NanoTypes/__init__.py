@@ -7,6 +7,7 @@ from Char import Char
 from Float import Float
 from Uint import Uint
 from Varchar import Varchar
+from Composite import Composite
 
 # Globals
 TYPE_NAME_RE = re.compile("(\D+)(\d+)?")